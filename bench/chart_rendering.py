@@ -0,0 +1,156 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "matplotlib",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Benchmark the sandboxed rendering of the chart code (`common/chart_sandbox.py`).
+
+The charts are the code the stub writes for the result of each question (the
+data is the result of the stub's SQL, rendered like `lookup_sales_data` does).
+We report the p50/p95 latency per chart of:
+
+- in_process: `exec` in this process, the baseline without isolation (it
+  blocks the event loop of the labs and shares their memory);
+- cold: a new worker, i.e. the start of the interpreter and the imports of
+  matplotlib and pandas, plus the chart;
+- warm: workers started ahead of time, one chart at a time;
+- cached: the same charts again, served from the rendering cache;
+
+then the throughput of the warm pool with `--workers` charts in flight, and
+what happens to code exceeding the limits (a busy loop, a sleep, a large
+allocation, a crash): the error returned, the time it took and the latency of
+the next chart, which runs on a replacement worker when the previous one was
+killed.
+
+Usage (from the repository root):
+
+    uv run bench/chart_rendering.py [--questions 20] [--workers 2] [--format png]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from questions import CANNED_QUESTIONS, generate_questions  # noqa: E402
+from visualization import question_data  # noqa: E402
+
+# chart code exceeding the limits of the sandbox
+ABUSES = {
+    "busy loop": "while True:\n    pass",
+    "sleep": "import time\ntime.sleep(3600)",
+    "allocation": "chunks = [bytearray(2**26) for _ in range(1024)]",
+    "crash": "import os\nos._exit(1)",
+}
+
+
+def charts(questions: list[str]) -> list[tuple[str, str]]:
+    """(code, data) of the chart of every question."""
+    from common.stub_model import StubScript
+
+    script = StubScript()
+    return [(script.chart(question, data)["code"], data) for question, data, _ in question_data(questions)]
+
+
+def render_in_process(code: str, data: str, fmt: str) -> None:
+    import matplotlib.pyplot as plt
+
+    from common.rendering import parse_result
+
+    try:
+        exec(code, {"__name__": "__chart__", "data": parse_result(data)})
+        plt.gcf().savefig(io.BytesIO(), format=fmt)
+    finally:
+        plt.close("all")
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def report(name: str, latencies: list[float]) -> None:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(f"{name:<11} {len(latencies):>7} {cuts[49]:>8.1f} {cuts[94]:>8.1f}")
+
+
+def main():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    from common.cache import ChartCache
+    from common.chart_sandbox import ChartRenderer
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=20, help="generated questions")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--format", default="png", choices=("png", "svg"))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    work = charts(CANNED_QUESTIONS + generate_questions(args.questions, seed=args.seed))
+    print(f"{len(work)} charts, {args.format}")
+    header = f"{'mode':<11} {'charts':>7} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+
+    report("in_process", [timed(render_in_process, code, data, args.format) for code, data in work])
+
+    cold = []
+    for code, data in work[:3]:
+        renderer = ChartRenderer(workers=1, fmt=args.format)
+        cold.append(timed(renderer.render, code, data))
+        renderer.close()
+    report("cold", cold)
+
+    # a cache without budget keeps nothing, every chart is rendered
+    renderer = ChartRenderer(workers=args.workers, fmt=args.format, cache=ChartCache(max_bytes=0))
+    renderer.start()
+    renderer.render(*work[0])  # wait for the workers to be ready
+    report("warm", [timed(renderer.render, code, data) for code, data in work])
+
+    renderer.cache = ChartCache()
+    for code, data in work:
+        renderer.render(code, data)
+    report("cached", [timed(renderer.render, code, data) for code, data in work])
+
+    renderer.cache = ChartCache(max_bytes=0)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.workers) as executor:
+        failed = sum(not chart.ok for chart in executor.map(lambda w: renderer.render(*w), work))
+    elapsed = time.perf_counter() - start
+    print(f"\n{args.workers} workers: {len(work) / elapsed:.1f} charts/s ({failed} failed)")
+
+    renderer.close()
+    renderer = ChartRenderer(
+        workers=1, timeout=2, cpu_seconds=1, memory_limit=256 * 2**20, fmt=args.format
+    )
+    renderer.render(*work[0])
+    print("\nlimits: timeout 2s, CPU 1s, memory 256MB")
+    header = f"{'code':<11} {'ms':>7} {'next ms':>8}  error"
+    print(header)
+    print("-" * len(header))
+    for name, code in ABUSES.items():
+        chart = renderer.render(code)
+        next_chart = timed(renderer.render, *work[1])
+        renderer.cache = ChartCache()
+        print(f"{name:<11} {chart.elapsed * 1000:>7.0f} {next_chart:>8.0f}  {chart.error}")
+    renderer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Compare concurrent queries on a single shared DuckDB connection and on the
+cursors of `common.cursors.CursorPool`.
+
+A connection can only run one query at a time (and isn't safe to share between
+threads), so the "shared" setup serializes the queries with a lock, like the
+labs did with DuckDB's default connection. The "pool" setup gives every
+in-flight query its own cursor. For every concurrency level (number of worker
+threads) we report the throughput and the p50/p95 latency of a mix of queries.
+
+Usage (from the repository root):
+
+    uv run bench/cursors.py [--mode arrow] [--concurrency 1,2,4,8,16] [--queries 200]
+
+The speedup is bounded by the number of cores. DuckDB also parallelizes a
+single query over `threads` threads (the number of cores by default), pass
+`--duckdb-threads 1` to see the parallelism across queries alone.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.cursors import CursorPool  # noqa: E402
+from common.dataset import DATA_ACCESS_MODES, SalesDataset  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+QUERIES = [
+    "SELECT * FROM sales WHERE Store_Number = 1320 AND Sold_Date = '2021-11-01'",
+    "SELECT Store_Number, SUM(Total_Sale_Value) AS Total_Sales FROM sales "
+    "WHERE YEAR(Sold_Date) = 2021 GROUP BY Store_Number ORDER BY Total_Sales DESC",
+    "SELECT SKU_Coded, SUM(Total_Sale_Value) AS Total_Sales FROM sales "
+    "GROUP BY SKU_Coded ORDER BY Total_Sales DESC",
+    "SELECT Sold_Date, SUM(Qty_Sold) AS Total_Qty FROM sales "
+    "WHERE Store_Number = 2970 GROUP BY Sold_Date ORDER BY Sold_Date",
+]
+
+
+def run(execute, count: int, concurrency: int) -> dict:
+    """Run `count` queries with `concurrency` worker threads."""
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        execute(QUERIES[i % len(QUERIES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(count)))
+    elapsed = time.perf_counter() - start
+    cuts = statistics.quantiles(latencies, n=100)
+    return {"qps": count / elapsed, "p50": cuts[49], "p95": cuts[94]}
+
+
+def main():
+    import duckdb
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=DATA_ACCESS_MODES, default="arrow")
+    parser.add_argument("--concurrency", default="1,2,4,8,16")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--duckdb-threads", type=int, help="DuckDB threads per query")
+    args = parser.parse_args()
+
+    dataset = SalesDataset(TRANSACTION_DATA_FILE_PATH, mode=args.mode, rollups=False)
+
+    shared = duckdb.connect()
+    dataset.register(shared, "sales")
+    lock = threading.Lock()
+
+    def execute_shared(sql):
+        with lock:
+            return shared.sql(sql).df()
+
+    pool = CursorPool(dataset, table_name="sales")
+
+    def execute_pool(sql):
+        with pool.cursor() as cursor:
+            return cursor.sql(sql).df()
+
+    if args.duckdb_threads:
+        for connection in (shared, pool.connection):
+            connection.execute(f"SET threads = {args.duckdb_threads}")
+
+    # warm up both setups (registration, first scan)
+    for sql in QUERIES:
+        execute_shared(sql)
+        execute_pool(sql)
+
+    print(f"{os.cpu_count()} cores, {args.queries} queries per run")
+    header = f"{'concurrency':>11} {'setup':<7} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for name, execute in (("shared", execute_shared), ("pool", execute_pool)):
+            stats = run(execute, args.queries, concurrency)
+            print(
+                f"{concurrency:>11} {name:<7} {stats['qps']:>8.1f} "
+                f"{stats['p50']:>8.2f} {stats['p95']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "psutil",
+#   "pyarrow",
+# ]
+# ///
+
+"""Compare the DuckDB data access modes of `common.dataset.SalesDataset`.
+
+Each mode runs in a fresh subprocess so the resident memory (RSS) of one mode
+doesn't leak into the next one. For every mode we report:
+
+- the RSS growth after loading and registering the dataset,
+- the RSS growth after running the first query,
+- the latency of the registration step and of the first query.
+
+Usage (from the repository root):
+
+    uv run bench/data_access.py [--path PARQUET_FILE_OR_DIRECTORY]
+
+The database of the "duckdb" mode is built first if it doesn't exist yet. A
+partitioned directory (`common/prepare_parquet.py --partitioned`) can't be
+loaded in memory, only the "parquet" and "duckdb" modes are measured for it.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+# the SQL generated for "Show me all the sales for store 1320 on November 1st, 2021"
+FIRST_QUERY = "SELECT * FROM sales WHERE Store_Number = 1320 AND Sold_Date = '2021-11-01'"
+
+
+def measure(mode: str, path: str) -> dict:
+    """Load, register and query the dataset using `mode` (runs in the child process)."""
+    import duckdb
+    import psutil
+
+    from common.dataset import SalesDataset
+
+    process = psutil.Process()
+    connection = duckdb.connect()
+    baseline_rss = process.memory_info().rss
+
+    start = time.perf_counter()
+    dataset = SalesDataset(path, mode=mode)
+    dataset.register(connection, "sales")
+    register_seconds = time.perf_counter() - start
+    registered_rss = process.memory_info().rss
+
+    start = time.perf_counter()
+    rows = len(connection.sql(FIRST_QUERY).df())
+    first_query_seconds = time.perf_counter() - start
+    queried_rss = process.memory_info().rss
+
+    return {
+        "mode": mode,
+        "register_ms": round(register_seconds * 1000, 2),
+        "first_query_ms": round(first_query_seconds * 1000, 2),
+        "rss_after_register_mb": round((registered_rss - baseline_rss) / 2**20, 1),
+        "rss_after_first_query_mb": round((queried_rss - baseline_rss) / 2**20, 1),
+        "rows": rows,
+    }
+
+
+def main():
+    from common.dataset import DATA_ACCESS_MODES, build_sales_database, database_path
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=TRANSACTION_DATA_FILE_PATH)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        print(json.dumps(measure(args.mode, args.path)))
+        return
+
+    # the "duckdb" mode attaches a database built beforehand
+    if not Path(database_path(args.path)).exists():
+        build_sales_database(args.path)
+
+    modes = DATA_ACCESS_MODES
+    if os.path.isdir(args.path):
+        modes = [mode for mode in modes if mode not in ("copy", "arrow")]
+    results = []
+    for mode in modes:
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--path", args.path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    header = f"{'mode':<8} {'register ms':>12} {'1st query ms':>13} {'RSS reg MB':>11} {'RSS query MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mode']:<8} {r['register_ms']:>12} {r['first_query_ms']:>13} "
+            f"{r['rss_after_register_mb']:>11} {r['rss_after_first_query_mb']:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Micro-benchmark of the per-call cost of `lookup_sales_data` (without the LLM).
+
+- before: what the lab_2 tool used to do on every call, i.e. read the parquet
+  file with pandas and run `CREATE TABLE IF NOT EXISTS ... AS SELECT * FROM df`.
+- after: use the process-wide handle returned by `common.dataset.get_sales_dataset`.
+
+Both variants then run the same query, so the difference is the data access
+overhead paid by every tool call.
+
+Usage (from the repository root):
+
+    uv run bench/lookup_latency.py [calls]
+"""
+
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.dataset import get_sales_dataset  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = "data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+QUERY = "SELECT * FROM sales WHERE Store_Number = 1320 AND Sold_Date = '2021-11-01'"
+
+
+def lookup_before(connection: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    df = pd.read_parquet(TRANSACTION_DATA_FILE_PATH)
+    connection.execute("CREATE TABLE IF NOT EXISTS sales AS SELECT * FROM df")
+    return connection.sql(QUERY).df()
+
+
+def lookup_after(connection: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    dataset = get_sales_dataset(TRANSACTION_DATA_FILE_PATH)
+    dataset.register(connection, "sales")
+    return connection.sql(QUERY).df()
+
+
+def timed(lookup, calls: int) -> list[float]:
+    connection = duckdb.connect()
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        lookup(connection)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    header = f"{'variant':<8} {'first ms':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}"
+    print(f"{calls} calls per variant")
+    print(header)
+    print("-" * len(header))
+    for name, lookup in (("before", lookup_before), ("after", lookup_after)):
+        timings = timed(lookup, calls)
+        steady = timings[1:] or timings
+        p95 = statistics.quantiles(steady, n=20)[-1] if len(steady) > 1 else steady[0]
+        print(
+            f"{name:<8} {timings[0]:>9.2f} {statistics.mean(steady):>9.2f} "
+            f"{statistics.median(steady):>9.2f} {p95:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "email-validator",
+#   "logfire",
+#   "openai==1.66.3",
+#   "opentelemetry-sdk",
+#   "pandas",
+#   "pyarrow",
+#   "pydantic-ai",
+#   "python-dotenv",
+# ]
+# ///
+
+"""End-to-end benchmark of the agent pipelines against the local stub model.
+
+The canned questions of the labs plus a generated question set are driven
+through the lab_1 (pydantic-ai) and lab_2 (Logfire) pipelines, with the LLMs
+replaced by the deterministic stub of `common/stub_model.py`. For every lab
+(each one runs in its own subprocess) and every concurrency level it reports:
+
+- p50/p95/p99 latency per stage (SQL generation, DuckDB execution, analysis,
+  chart config, chart code and chart template, or the chart alone in the
+  fused visualization mode, and the rendering of the chart in the sandbox),
+  taken from the spans of the pipeline;
+- p50/p95/p99 end-to-end latency, throughput (questions per second) and the
+  share of the questions answered by the fast path (`common/fast_path.py`);
+- the peak RSS of the process.
+
+The caches of the labs are reset before every concurrency level, so every
+level sees the same cold/warm pattern.
+
+The results are saved as JSON so runs can be diffed between commits.
+
+Usage (from the repository root):
+
+    uv run bench/pipeline.py [--questions 40] [--concurrency 1,4,16,64]
+    uv run bench/pipeline.py --compare bench/results/pipeline-<old sha>.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+from questions import CANNED_QUESTIONS, generate_questions  # noqa: E402
+
+LABS = ("lab_1", "lab_2")
+
+# span name (lab_1) or logfire `chain=`/`tool=` message (lab_2) -> stage
+STAGES = {
+    "generate_sql_query": "sql_generation",
+    "execute_sql_query": "duckdb_execution",
+    "analyze_sales_data": "analysis",
+    "extract_chart_config": "chart_config",
+    "create_chart": "chart_code",
+    "generate_chart": "chart",
+    "render_chart": "chart_template",
+    "execute_chart_code": "chart_rendering",
+    "fast_path": "fast_path",
+}
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    if len(values) == 1:
+        p50 = p95 = p99 = values[0]
+    else:
+        cuts = statistics.quantiles(values, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    return {"count": len(values), "p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2)}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)
+
+
+# -----------------------------------
+# child process: benchmark of one lab
+# -----------------------------------
+
+
+def load_lab(lab: str, exporter):
+    """Import the lab with the stub model and return (module, ask, reset_caches)."""
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+    from common.cache import ChartCache, QueryResultCache, make_response_cache
+
+    sys.path.insert(0, str(ROOT / lab))
+    if lab == "lab_1":
+        from opentelemetry import trace
+        from opentelemetry.sdk.trace import TracerProvider
+
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        os.environ["PYDANTIC_AI_MODEL"] = "stub"
+        import solution_with_pydantic_ai as module
+
+        dataset = module.get_sales_dataset(
+            module.TRANSACTION_DATA_FILE_PATH,
+            mode=module.DATA_ACCESS_MODE,
+            rollups=module.SALES_ROLLUPS,
+        )
+        deps = module.SharedDependencies(
+            table_name="sales",
+            dataset=dataset,
+            cursors=module.CursorPool(
+                dataset, table_name="sales", max_workers=module.QUERY_WORKERS,
+                guard=module.QUERY_GUARD, max_prepared=module.PREPARED_STATEMENTS,
+            ),
+        )
+
+        async def ask(question):
+            return await module.answer_question(question, deps)
+
+    else:
+        os.environ["STUB_MODEL"] = "1"
+        os.environ["LOGFIRE_SEND_TO_LOGFIRE"] = "false"
+        os.environ["LOGFIRE_CONSOLE"] = "false"
+        import logfire
+        import solution_with_logfire as module
+
+        logfire.configure(
+            send_to_logfire=False,
+            console=False,
+            additional_span_processors=[SimpleSpanProcessor(exporter)],
+        )
+
+        async def ask(question):
+            return await module.start_main_span([{"role": "user", "content": question}])
+
+    def reset_caches():
+        module.sql_generation_cache = make_response_cache()
+        module.sql_result_cache = QueryResultCache()
+        if module.chart_renderer is not None:
+            module.chart_renderer.cache = ChartCache()
+
+    return module, ask, reset_caches
+
+
+def stage_of(span) -> str | None:
+    attributes = span.attributes or {}
+    # `@logfire.instrument("tool=...")` spans only carry it in their message
+    message = str(attributes.get("logfire.msg", ""))
+    name = message.partition("=")[2] if message.startswith(("tool=", "chain=")) else span.name
+    return STAGES.get(name)
+
+
+async def run_level(ask, questions: list[str], concurrency: int) -> tuple[list[float], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(question):
+        async with semaphore:
+            start = time.perf_counter()
+            await ask(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    return latencies, time.perf_counter() - start
+
+
+def bench_lab(lab: str, questions: list[str], levels: list[int]) -> dict:
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    os.chdir(ROOT)
+    sys.path.insert(0, str(ROOT))
+    exporter = InMemorySpanExporter()
+    module, ask, reset_caches = load_lab(lab, exporter)
+    if module.chart_renderer is not None:
+        module.chart_renderer.start()
+
+    results = []
+    for concurrency in levels:
+        reset_caches()
+        exporter.clear()
+        # the labs print their progress, keep it out of the benchmark output
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            latencies, elapsed = asyncio.run(run_level(ask, questions, concurrency))
+        stages = {stage: [] for stage in STAGES.values()}
+        # the AgentRun spans record whether the fast path answered
+        hits = [
+            span.attributes["fast_path.hit"]
+            for span in exporter.get_finished_spans()
+            if "fast_path.hit" in (span.attributes or {})
+        ]
+        for span in exporter.get_finished_spans():
+            stage = stage_of(span)
+            if stage:
+                stages[stage].append((span.end_time - span.start_time) / 1e6)
+        results.append(
+            {
+                "concurrency": concurrency,
+                "throughput_qps": round(len(questions) / elapsed, 2),
+                "end_to_end_ms": percentiles(latencies),
+                "fast_path_hit_rate": round(sum(hits) / len(hits), 4) if hits else 0.0,
+                "stages_ms": {stage: percentiles(values) for stage, values in stages.items()},
+            }
+        )
+    if module.chart_renderer is not None:
+        module.chart_renderer.close()
+    return {"lab": lab, "levels": results, "peak_rss_mb": peak_rss_mb()}
+
+
+# -------------------------------
+# parent process: orchestration
+# -------------------------------
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+            capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(report: dict) -> None:
+    for lab in report["labs"]:
+        print(f"\n=== {lab['lab']} (peak RSS {lab['peak_rss_mb']} MB) ===")
+        print(
+            f"{'concurrency':>11} {'qps':>8} {'e2e p50':>9} {'e2e p95':>9} {'e2e p99':>9} "
+            f"{'fast path':>9}"
+        )
+        for level in lab["levels"]:
+            e2e = level["end_to_end_ms"]
+            print(
+                f"{level['concurrency']:>11} {level['throughput_qps']:>8} "
+                f"{e2e['p50']:>9} {e2e['p95']:>9} {e2e['p99']:>9} "
+                f"{level.get('fast_path_hit_rate', 0):>9.0%}"
+            )
+        for level in lab["levels"]:
+            print(f"\nstages at concurrency {level['concurrency']} (ms)")
+            print(f"{'stage':<18} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+            for stage, stats in level["stages_ms"].items():
+                if stats["count"]:
+                    print(
+                        f"{stage:<18} {stats['count']:>6} {stats['p50']:>9} "
+                        f"{stats['p95']:>9} {stats['p99']:>9}"
+                    )
+
+
+def print_comparison(baseline: dict, report: dict) -> None:
+    """p50/p95 and throughput deltas of `report` against `baseline`."""
+    print(f"\n=== {report['revision']} vs {baseline['revision']} ===")
+    old_labs = {lab["lab"]: lab for lab in baseline["labs"]}
+    for lab in report["labs"]:
+        old = old_labs.get(lab["lab"])
+        if old is None:
+            continue
+        old_levels = {level["concurrency"]: level for level in old["levels"]}
+        print(f"{lab['lab']}: peak RSS {old['peak_rss_mb']} -> {lab['peak_rss_mb']} MB")
+        for level in lab["levels"]:
+            old_level = old_levels.get(level["concurrency"])
+            if old_level is None:
+                continue
+            rows = [("throughput_qps", old_level["throughput_qps"], level["throughput_qps"])]
+            for name in ("p50", "p95"):
+                rows.append(
+                    (f"e2e {name}", old_level["end_to_end_ms"][name], level["end_to_end_ms"][name])
+                )
+            for stage, stats in level["stages_ms"].items():
+                old_stats = old_level["stages_ms"].get(stage, {})
+                if stats["count"] and old_stats.get("count"):
+                    rows.append((f"{stage} p95", old_stats["p95"], stats["p95"]))
+            print(f"  concurrency {level['concurrency']}")
+            for name, before, after in rows:
+                change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+                print(f"    {name:<28} {before:>10} -> {after:>10} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labs", default=",".join(LABS))
+    parser.add_argument("--questions", type=int, default=40, help="generated questions")
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--latency", default="lognormal:0.05:0.5", help="STUB_LATENCY spec")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file (default: bench/results/pipeline-<sha>.json)")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare with")
+    parser.add_argument("--child", choices=LABS, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    questions = CANNED_QUESTIONS + generate_questions(args.questions, seed=args.seed)
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    if args.child:
+        result = bench_lab(args.child, questions, levels)
+        Path(args.child_output).write_text(json.dumps(result))
+        return
+
+    env = dict(os.environ, STUB_LATENCY=args.latency)
+    labs = []
+    for lab in args.labs.split(","):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            subprocess.run(
+                [sys.executable, __file__, "--child", lab, "--child-output", output.name,
+                 "--questions", str(args.questions), "--concurrency", args.concurrency,
+                 "--seed", str(args.seed)],
+                check=True, env=env,
+            )
+            labs.append(json.loads(Path(output.name).read_text()))
+
+    report = {
+        "revision": git_revision(),
+        "questions": len(questions),
+        "stub_latency": args.latency,
+        "labs": labs,
+    }
+    output = Path(args.output or ROOT / "bench" / "results" / f"pipeline-{report['revision']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print_report(report)
+    print(f"\nresults saved to {output}")
+    if args.compare:
+        print_comparison(json.loads(Path(args.compare).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
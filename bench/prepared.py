@@ -0,0 +1,97 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "opentelemetry-api",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Compare literal SQL with prepared statements (`common/prepared.py`).
+
+The queries are the stub's SQL for a generated question set, run on a
+`CursorPool` with the default guard. For every data access mode we report the
+p50/p95 latency per query of:
+
+- literal: the SQL with its literal values, planned by the guard (`EXPLAIN`)
+  and by DuckDB at every run;
+- prepared: the same queries as a template plus values (`parameterize`), run
+  as prepared statements, so the templates seen before skip both plans;
+
+and the share of the prepared queries whose template was already prepared.
+The result cache of the labs isn't involved: every query runs.
+
+Usage (from the repository root):
+
+    uv run bench/prepared.py [--questions 200] [--modes arrow,duckdb] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from questions import generate_questions  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = "data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return (time.perf_counter() - start) * 1000
+
+
+def report(mode: str, name: str, latencies: list[float], reuse: str = "") -> None:
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    print(f"{mode:<8} {name:<9} {cuts[49]:>8.2f} {cuts[94]:>8.2f} {reuse:>8}")
+
+
+def main():
+    from common.cursors import CursorPool
+    from common.dataset import SalesDataset
+    from common.guards import QueryGuard
+    from common.prepared import parameterize
+    from common.rollups import ROLLUPS
+    from common.stub_model import StubScript
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=200, help="generated questions")
+    parser.add_argument("--modes", default="arrow,duckdb", help="data access modes")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    script = StubScript()
+    tables = [rollup.name("sales") for rollup in ROLLUPS]
+    queries = [script.sql(q, "sales", tables) for q in generate_questions(args.questions, seed=args.seed)]
+    templates = [parameterize(sql) for sql in queries]
+    print(f"{len(queries)} queries, {len(set(t for t, _ in templates))} templates")
+    header = f"{'mode':<8} {'run':<9} {'p50 ms':>8} {'p95 ms':>8} {'reused':>8}"
+    print(header)
+    print("-" * len(header))
+
+    for mode in args.modes.split(","):
+        dataset = SalesDataset(TRANSACTION_DATA_FILE_PATH, mode=mode)
+        # `query` runs on this thread and reuses the idle cursor, its statements with it
+        pool = CursorPool(dataset, table_name="sales", guard=QueryGuard(), max_prepared=64)
+        pool.query(queries[0])  # load the dataset and build the rollups
+        literal, prepared = [], []
+        for _ in range(args.repeat):
+            literal += [timed(pool.query, sql) for sql in queries]
+            prepared += [timed(pool.query, sql, params) for sql, params in templates]
+        statements = pool.statements
+        reuse = f"{statements.hits / (statements.hits + statements.misses):.0%}"
+        report(mode, "literal", literal)
+        report(mode, "prepared", prepared, reuse)
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Questions driven through the agents by the benchmarks."""
+
+import calendar
+import random
+from datetime import date, timedelta
+
+# the questions of lab_1's main() (taken from the Lab 1 notebook) and lab_2's main()
+CANNED_QUESTIONS = [
+    "Show me all the sales for store 1320 on November 1st, 2021",
+    "what trends do you see in this data",
+    "Show me the code for graph of sales by store in Nov 2021, and tell me what trends you see.",
+    "A bar chart of sales by product SKU. Put the product SKU on the x-axis and the sales on the y-axis.",
+    "Which stores did the best in 2021?",
+]
+
+# stores and dates present in data/Store_Sales_Price_Elasticity_Promotions_Data.parquet
+STORES = [
+    330, 550, 660, 770, 880, 990, 1100, 1210, 1320, 1540, 1650, 1760, 1870, 1980,
+    2090, 2200, 2310, 2420, 2530, 2640, 2750, 2860, 2970, 3080, 3190, 3300, 3410,
+    3520, 3630, 3740, 4070, 4180, 4400, 4730, 4840,
+]
+FIRST_DAY = date(2021, 11, 1)
+LAST_DAY = date(2024, 3, 31)
+
+TEMPLATES = [
+    "Show me all the sales for store {store} on {month_name} {day}, {year}",
+    "Show me the code for graph of sales by store in {month_abbr} {year}, and tell me what trends you see.",
+    "A bar chart of sales by product SKU in {month_name} {year}. Put the product SKU on the x-axis and the sales on the y-axis.",
+    "Which stores did the best in {year}?",
+    "What trends do you see in the sales of store {store} in {year}?",
+    "Plot the daily sales of store {store} in {month_name} {year}",
+]
+
+
+def generate_questions(count: int, seed: int = 0) -> list[str]:
+    """`count` questions built from `TEMPLATES` with random stores and dates."""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        day = FIRST_DAY + timedelta(days=rng.randrange((LAST_DAY - FIRST_DAY).days + 1))
+        questions.append(
+            rng.choice(TEMPLATES).format(
+                store=rng.choice(STORES),
+                day=day.day,
+                month_name=calendar.month_name[day.month],
+                month_abbr=calendar.month_abbr[day.month],
+                year=day.year,
+            )
+        )
+    return questions
@@ -0,0 +1,118 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Compare the latency of common sales questions on the raw table and on the
+rollups of `common/rollups.py`.
+
+Each question is answered by an aggregation over the `sales` table and by the
+equivalent query over the smallest rollup that can answer it. Both queries are
+checked to return the same rows, then timed over `--repeat` runs.
+
+Usage (from the repository root):
+
+    uv run bench/rollups.py [--mode arrow] [--repeat 50]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.dataset import DATA_ACCESS_MODES, SalesDataset, build_sales_database, database_path  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+TOTALS = "SUM(Total_Sale_Value) AS Total_Sales, SUM(Qty_Sold) AS Total_Qty"
+
+# (question, query on the raw table, query on a rollup)
+QUESTIONS = [
+    (
+        "sales by store in Nov 2021",
+        f"SELECT Store_Number, {TOTALS} FROM sales WHERE Sold_Date BETWEEN '2021-11-01' AND '2021-11-30' "
+        "GROUP BY Store_Number ORDER BY Store_Number",
+        f"SELECT Store_Number, {TOTALS} FROM sales_monthly_store WHERE Month = '2021-11-01' "
+        "GROUP BY Store_Number ORDER BY Store_Number",
+    ),
+    (
+        "best stores in 2021",
+        f"SELECT Store_Number, {TOTALS} FROM sales WHERE YEAR(Sold_Date) = 2021 "
+        "GROUP BY Store_Number ORDER BY Total_Sales DESC, Store_Number",
+        f"SELECT Store_Number, {TOTALS} FROM sales_monthly_store WHERE YEAR(Month) = 2021 "
+        "GROUP BY Store_Number ORDER BY Total_Sales DESC, Store_Number",
+    ),
+    (
+        "daily sales of store 1320",
+        f"SELECT Sold_Date, {TOTALS} FROM sales WHERE Store_Number = 1320 "
+        "GROUP BY Sold_Date ORDER BY Sold_Date",
+        f"SELECT Sold_Date, {TOTALS} FROM sales_daily_store WHERE Store_Number = 1320 "
+        "GROUP BY Sold_Date ORDER BY Sold_Date",
+    ),
+    (
+        "sales by SKU",
+        f"SELECT SKU_Coded, {TOTALS} FROM sales GROUP BY SKU_Coded ORDER BY SKU_Coded",
+        f"SELECT SKU_Coded, {TOTALS} FROM sales_sku GROUP BY SKU_Coded ORDER BY SKU_Coded",
+    ),
+    (
+        "sales by SKU for store 1320",
+        f"SELECT SKU_Coded, {TOTALS} FROM sales WHERE Store_Number = 1320 "
+        "GROUP BY SKU_Coded ORDER BY SKU_Coded",
+        f"SELECT SKU_Coded, {TOTALS} FROM sales_store_sku WHERE Store_Number = 1320 "
+        "GROUP BY SKU_Coded ORDER BY SKU_Coded",
+    ),
+]
+
+
+def timed(connection, sql: str, repeat: int) -> float:
+    """Median latency of `sql` in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.sql(sql).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def main():
+    import duckdb
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=DATA_ACCESS_MODES, default="arrow")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == "duckdb" and not Path(database_path(TRANSACTION_DATA_FILE_PATH)).exists():
+        build_sales_database(TRANSACTION_DATA_FILE_PATH)
+
+    connection = duckdb.connect()
+    dataset = SalesDataset(TRANSACTION_DATA_FILE_PATH, mode=args.mode)
+    start = time.perf_counter()
+    dataset.register(connection, "sales")
+    print(f"registered the table and built the rollups in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    header = f"{'question':<30} {'raw ms':>8} {'rollup ms':>10} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for question, raw, rollup in QUESTIONS:
+        # the sums are only equal up to the float rounding of the aggregation order
+        pd.testing.assert_frame_equal(
+            connection.sql(raw).df(), connection.sql(rollup).df(), check_dtype=False, rtol=1e-6,
+            obj=f"rollup query of {question!r}",
+        )
+        raw_ms = timed(connection, raw, args.repeat)
+        rollup_ms = timed(connection, rollup, args.repeat)
+        print(f"{question:<30} {raw_ms:>8.2f} {rollup_ms:>10.2f} {raw_ms / rollup_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
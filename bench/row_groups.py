@@ -0,0 +1,99 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "psutil",
+#   "pyarrow",
+# ]
+# ///
+
+"""Compare the bytes scanned by typical queries on the original Parquet file
+and on the copy clustered by store and date (`common/prepare_parquet.py`).
+
+Both files are queried through `read_parquet`, so DuckDB can only skip row
+groups based on their min/max statistics. For every query we report the bytes
+read from the file (the `read_chars` I/O counter of the process, page cache
+hits included) and the median latency.
+
+Usage (from the repository root):
+
+    uv run bench/row_groups.py [--repeat 20]
+
+The sorted file is built first if it doesn't exist yet.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.dataset import build_sorted_parquet, sorted_parquet_path  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+QUERIES = {
+    "store 1320 on 2021-11-01": "SELECT * FROM {source} WHERE Store_Number = 1320 AND Sold_Date = '2021-11-01'",
+    "store 1320, all dates": "SELECT SUM(Total_Sale_Value) FROM {source} WHERE Store_Number = 1320",
+    "stores 330-1320 in Nov 2021": (
+        "SELECT Store_Number, SUM(Total_Sale_Value) FROM {source} WHERE Store_Number <= 1320 "
+        "AND Sold_Date BETWEEN '2021-11-01' AND '2021-11-30' GROUP BY Store_Number"
+    ),
+    # the sorted file isn't clustered on SKU (the original one mostly is), so
+    # every row group is scanned: cluster on the columns the questions filter on
+    "SKU 6200700": "SELECT SUM(Total_Sale_Value) FROM {source} WHERE SKU_Coded = 6200700",
+}
+
+
+def measure(connection, process, sql: str, repeat: int) -> tuple[int, float]:
+    """Bytes read by one run of `sql` and its median latency in milliseconds."""
+    before = process.io_counters().read_chars
+    connection.sql(sql).fetchall()
+    bytes_read = process.io_counters().read_chars - before
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        connection.sql(sql).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return bytes_read, statistics.median(latencies)
+
+
+def main():
+    import duckdb
+    import psutil
+    import pyarrow.parquet as pq
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    sorted_path = sorted_parquet_path(TRANSACTION_DATA_FILE_PATH)
+    if not Path(sorted_path).exists():
+        build_sorted_parquet(TRANSACTION_DATA_FILE_PATH)
+
+    files = {"original": TRANSACTION_DATA_FILE_PATH, "sorted": sorted_path}
+    for name, path in files.items():
+        row_groups = pq.ParquetFile(path).metadata.num_row_groups
+        print(f"{name}: {path} ({os.path.getsize(path) / 2**20:.2f} MB, {row_groups} row groups)")
+
+    process = psutil.Process()
+    connection = duckdb.connect()
+    header = f"{'query':<30} {'file':<9} {'KB read':>9} {'median ms':>10}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for query, sql in QUERIES.items():
+        for name, path in files.items():
+            bytes_read, latency = measure(
+                connection, process, sql.format(source=f"read_parquet('{path}')"), args.repeat
+            )
+            print(f"{query:<30} {name:<9} {bytes_read / 2**10:>9.1f} {latency:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
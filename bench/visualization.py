@@ -0,0 +1,222 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "email-validator",
+#   "logfire",
+#   "matplotlib",
+#   "openai==1.66.3",
+#   "pandas",
+#   "pyarrow",
+#   "pydantic-ai",
+#   "python-dotenv",
+# ]
+# ///
+
+"""Compare the visualization modes of the labs.
+
+The two-step mode generates a chart configuration, then the chart code from
+it (two LLM calls). The fused mode returns the configuration and the code in
+a single structured result. The template mode generates the configuration
+and renders the code from a template (`common/charts.py`), falling back to
+the model for the chart types without template. For every lab and mode the
+chart tool is called on the result of each question, and we report:
+
+- the p50/p95 latency of the tool;
+- the tokens it used per chart;
+- the quality of the charts: the share of the code that parses, that runs
+  against the query result (bound to `data`, with matplotlib's Agg backend),
+  and that draws the chart type the question asks for (bar, line, scatter or
+  pie, when it names one).
+
+The data of every question is the result of the stub's SQL, rendered like
+`lookup_sales_data` does. By default the LLMs are replaced by the stub of
+`common/stub_model.py` (with its default latencies per kind of call, see
+`--latency`); pass `--live` to call the models configured in the labs.
+
+Usage (from the repository root):
+
+    uv run bench/visualization.py [--labs lab_1,lab_2] [--questions 20] [--live]
+
+The generated code is executed in this process: only use `--live` with
+models you trust.
+"""
+
+import argparse
+import ast
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from questions import CANNED_QUESTIONS, generate_questions  # noqa: E402
+
+LABS = ("lab_1", "lab_2")
+MODES = ("two_step", "fused", "template")
+
+TRANSACTION_DATA_FILE_PATH = "data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+
+# chart type named in a question -> the matplotlib artists that draw it
+CHART_TYPES = {
+    "bar": "patches",
+    "line": "lines",
+    "scatter": "collections",
+    "pie": "patches",
+}
+
+
+def load_lab(lab: str, live: bool):
+    """Import the lab and return (module, visualize), where `visualize(data, goal)`
+    returns the code of the chart and the tokens used."""
+    sys.path.insert(0, str(ROOT / lab))
+    if lab == "lab_1":
+        if not live:
+            os.environ["PYDANTIC_AI_MODEL"] = "stub"
+        import solution_with_pydantic_ai as module
+        from pydantic_ai.usage import Usage
+
+        async def visualize(data, goal):
+            usage = Usage()
+            code = await module.create_visualization(data, goal, usage)
+            return code, usage.total_tokens or 0
+
+    else:
+        if not live:
+            os.environ["STUB_MODEL"] = "1"
+        os.environ.setdefault("LOGFIRE_SEND_TO_LOGFIRE", "false")
+        os.environ.setdefault("LOGFIRE_CONSOLE", "false")
+        import solution_with_logfire as module
+
+        from common.budget import RunBudget
+
+        async def visualize(data, goal):
+            # the tools charge their tokens to the budget of the run in progress
+            budget = RunBudget()
+            token = budget.activate()
+            try:
+                code = await module.create_visualization(data, goal)
+            finally:
+                budget.deactivate(token)
+            return code, budget.total_tokens
+
+    return module, visualize
+
+
+def question_data(questions: list[str]) -> list[tuple]:
+    """(question, rendered result, result) of every question, with the stub's SQL."""
+    from common.cursors import CursorPool
+    from common.dataset import SalesDataset
+    from common.rendering import render_result
+    from common.stub_model import StubScript
+
+    pool = CursorPool(SalesDataset(TRANSACTION_DATA_FILE_PATH), table_name="sales")
+    script = StubScript()
+    rows = []
+    for question in questions:
+        result = pool.query(script.sql(question))
+        rows.append((question, render_result(result, max_rows=50, max_tokens=2000).text, result))
+    pool.close()
+    return rows
+
+
+def chart_quality(code: str, data, goal: str) -> dict:
+    """Whether `code` parses, runs against `data` and draws the chart type `goal` asks for."""
+    import matplotlib.pyplot as plt
+
+    quality = {"parses": False, "runs": False, "matches_goal": None}
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return quality
+    quality["parses"] = True
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            exec(code, {"data": data.copy(), "__name__": "__chart__"})
+        quality["runs"] = True
+        requested = re.search(r"\b(bar|line|scatter|pie)\b", goal, re.I)
+        if requested:
+            artists = CHART_TYPES[requested.group(1).lower()]
+            quality["matches_goal"] = any(
+                getattr(ax, artists) for figure in map(plt.figure, plt.get_fignums())
+                for ax in figure.axes
+            )
+    except Exception:
+        pass
+    finally:
+        plt.close("all")
+    return quality
+
+
+async def bench_mode(visualize, rows, concurrency: int) -> list[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(question, data):
+        async with semaphore:
+            start = time.perf_counter()
+            code, tokens = await visualize(data, question)
+            return code, tokens, (time.perf_counter() - start) * 1000
+
+    runs = await asyncio.gather(*(one(question, data) for question, data, _ in rows))
+    results = []
+    # the code is executed sequentially, pyplot keeps global state
+    for (question, _, result), (code, tokens, latency) in zip(rows, runs):
+        results.append({"latency": latency, "tokens": tokens, **chart_quality(code, result, question)})
+    return results
+
+
+def share(results: list[dict], key: str) -> str:
+    values = [r[key] for r in results if r[key] is not None]
+    return f"{sum(values) / len(values):.0%}" if values else "n/a"
+
+
+def main():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labs", default=",".join(LABS))
+    parser.add_argument("--questions", type=int, default=20, help="generated questions")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", help="STUB_LATENCY spec (default: per kind of call)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="call the models of the labs")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    if args.latency:
+        os.environ["STUB_LATENCY"] = args.latency
+    questions = CANNED_QUESTIONS + generate_questions(args.questions, seed=args.seed)
+    rows = question_data(questions)
+
+    print(f"{len(rows)} charts per lab and mode")
+    header = (
+        f"{'lab':<6} {'mode':<9} {'p50 ms':>8} {'p95 ms':>8} {'tokens':>7} "
+        f"{'parses':>7} {'runs':>6} {'matches goal':>13}"
+    )
+    print(header)
+    print("-" * len(header))
+    for lab in args.labs.split(","):
+        module, visualize = load_lab(lab, args.live)
+        for mode in MODES:
+            module.VISUALIZATION_MODE = mode
+            results = asyncio.run(bench_mode(visualize, rows, args.concurrency))
+            latencies = [r["latency"] for r in results]
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            tokens = statistics.mean(r["tokens"] for r in results)
+            print(
+                f"{lab:<6} {mode:<9} {cuts[49]:>8.0f} {cuts[94]:>8.0f} {tokens:>7.0f} "
+                f"{share(results, 'parses'):>7} {share(results, 'runs'):>6} "
+                f"{share(results, 'matches_goal'):>13}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Helpers shared by the labs (data access, caching, benchmarking utilities)."""
@@ -0,0 +1,100 @@
+"""Per-run limits for the router loop.
+
+`RunBudget` tracks the iterations, the tokens and the elapsed time of one
+agent run. The budget of the run in progress is kept in a context variable,
+so the tools can charge the tokens of their own LLM calls to it through
+`record_usage` (the context is inherited by the tasks they run in).
+"""
+
+import contextvars
+import os
+import time
+from dataclasses import dataclass, field
+
+
+_current_budget: contextvars.ContextVar["RunBudget | None"] = contextvars.ContextVar(
+    "current_budget", default=None
+)
+
+# message returned instead of the model's answer when a limit fires
+LIMIT_EXCEEDED_ANSWER = (
+    "I couldn't complete the answer within the limits of this run ({limit} exceeded). "
+    "Please try a more specific question."
+)
+
+
+@dataclass
+class RunBudget:
+    """Limits of one agent run, `None` disables a limit.
+
+    Args:
+        max_iterations: Maximum number of router calls.
+        max_total_tokens: Maximum number of tokens of all the LLM calls of the run.
+        timeout: Wall-clock seconds the run may take.
+    """
+
+    max_iterations: int | None = 10
+    max_total_tokens: int | None = 100_000
+    timeout: float | None = 120.0
+    iterations: int = 0
+    total_tokens: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    # name of the limit that fired, if any
+    exceeded: str | None = None
+
+    @classmethod
+    def from_env(cls) -> "RunBudget":
+        """Build the budget from the AGENT_MAX_ITERATIONS, AGENT_MAX_TOTAL_TOKENS
+        and AGENT_TIMEOUT env variables (0 disables a limit)."""
+
+        def limit(name, default, cast):
+            value = cast(os.getenv(name, default))
+            return value or None
+
+        return cls(
+            max_iterations=limit("AGENT_MAX_ITERATIONS", cls.max_iterations, int),
+            max_total_tokens=limit("AGENT_MAX_TOTAL_TOKENS", cls.max_total_tokens, int),
+            timeout=limit("AGENT_TIMEOUT", cls.timeout, float),
+        )
+
+    def activate(self) -> contextvars.Token:
+        """Start the clock and make this the budget of the run in progress
+        (see `record_usage`)."""
+        self.started_at = time.monotonic()
+        return _current_budget.set(self)
+
+    @staticmethod
+    def deactivate(token: contextvars.Token) -> None:
+        _current_budget.reset(token)
+
+    def remaining_time(self) -> float | None:
+        """Seconds left before the deadline, `None` if there is no deadline."""
+        if self.timeout is None:
+            return None
+        return max(self.timeout - (time.monotonic() - self.started_at), 0.0)
+
+    def check(self) -> str | None:
+        """Return (and remember) the name of the first limit exceeded, if any."""
+        if self.exceeded is None:
+            if self.max_iterations is not None and self.iterations >= self.max_iterations:
+                self.exceeded = "max_iterations"
+            elif self.max_total_tokens is not None and self.total_tokens >= self.max_total_tokens:
+                self.exceeded = "max_total_tokens"
+            elif self.remaining_time() == 0.0:
+                self.exceeded = "timeout"
+        return self.exceeded
+
+    def span_attributes(self, prefix: str = "budget") -> dict:
+        return {
+            f"{prefix}.iterations": self.iterations,
+            f"{prefix}.total_tokens": self.total_tokens,
+            f"{prefix}.elapsed": round(time.monotonic() - self.started_at, 3),
+            f"{prefix}.limit_exceeded": self.exceeded or "",
+        }
+
+
+def record_usage(usage) -> None:
+    """Charge the tokens of an OpenAI `usage` payload to the run in progress."""
+    budget = _current_budget.get()
+    if budget is not None and usage is not None:
+        budget.total_tokens += usage.total_tokens or 0
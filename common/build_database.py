@@ -0,0 +1,49 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Build the persistent DuckDB database used by the "duckdb" data access mode.
+
+The database holds the rows of the Parquet file sorted by store and date, with
+the column types of the file and up to date statistics, and the rollup tables
+of `common/rollups.py`. Workers attach it read-only (`DATA_ACCESS_MODE=duckdb`)
+instead of loading the Parquet file, and link its rollups instead of
+aggregating the table on start.
+
+Usage (from the repository root):
+
+    uv run common/build_database.py [PARQUET_FILE] [--output DATABASE]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# make the `common` package importable when running `uv run common/build_database.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.dataset import build_sales_database  # noqa: E402
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=TRANSACTION_DATA_FILE_PATH)
+    parser.add_argument("--output", help="database path (default: PARQUET_FILE with a .duckdb extension)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    output = build_sales_database(args.path, output=args.output)
+    print(f"built {output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
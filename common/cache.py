@@ -0,0 +1,390 @@
+"""Caches for LLM responses and SQL query results.
+
+A response cache is any object with `get(key) -> str | None`,
+`set(key, value)` and `delete(key)` methods, and a `blocking` attribute telling
+whether they do I/O. `LRUCache` keeps entries in memory, `SQLiteCache` on disk
+and `TieredCache` chains several of them (e.g. memory in front of disk) while
+counting hits and misses. Its `aget`/`aset`/`adelete` variants run the blocking
+tiers on a worker thread, for async callers; `lookup` and `aget` also return
+the tier a value was found in.
+
+`QueryResultCache` keeps the results of SQL queries in memory, keyed on the
+normalized query text, its parameters and the version of the dataset it ran
+against.
+`ChartCache` keeps rendered chart images the same way.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Sequence
+from pathlib import Path
+
+import pandas as pd
+
+
+def cache_key(model: str, prompt: str, schema: object) -> str:
+    """Content address of an LLM response.
+
+    Args:
+        model: Name of the model generating the response.
+        prompt: The fully rendered prompt.
+        schema: Anything JSON serializable identifying the schema the response
+            depends on (e.g. the table name and its columns).
+    """
+    payload = json.dumps([model, prompt, schema], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LRUCache:
+    """In-memory cache evicting the least recently used entries.
+
+    Args:
+        max_entries: Maximum number of entries kept.
+        ttl: Seconds an entry stays valid, `None` to keep it until evicted.
+    """
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SQLiteCache:
+    """On-disk cache stored in a SQLite database, shared across processes.
+
+    Lookups only write when the access time of an entry is older than
+    `access_resolution`, and the expired and least recently used entries are
+    evicted every `evict_every` writes, so the cache may exceed `max_entries`
+    by that many entries in between.
+
+    Args:
+        path: Path to the SQLite file (created if needed).
+        max_entries: Maximum number of entries kept, the least recently used
+            ones are evicted first.
+        ttl: Seconds an entry stays valid, `None` to keep it until evicted.
+        access_resolution: Seconds within which the access time of an entry
+            isn't updated again.
+        evict_every: Number of writes between two evictions.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        ttl: float | None = None,
+        access_resolution: float = 60.0,
+        evict_every: int = 100,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.access_resolution = access_resolution
+        self.evict_every = evict_every
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, created_at REAL, accessed_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at, accessed_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, accessed_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            if now - accessed_at > self.access_resolution:
+                self._connection.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+                )
+                self._connection.commit()
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", (key, value, now, now)
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(now)
+            self._connection.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._connection.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._connection.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl,))
+        (count,) = self._connection.execute("SELECT count(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+class TieredCache:
+    """Look up a key in each tier in order, filling the faster tiers on a hit.
+
+    Only the hit/miss counters are kept on the instance, the tier answering a
+    lookup is returned by `lookup`/`aget` as it's shared by concurrent callers.
+
+    Args:
+        tiers: The caches, fastest first.
+    """
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        return self.lookup(key)[0]
+
+    def lookup(self, key: str) -> tuple[str | None, str | None]:
+        """The value of `key` and the name of the tier it was found in, `None`
+        for both on a miss."""
+        for i, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.set(key, value)
+                self.hits += 1
+                return value, tier.name
+        self.misses += 1
+        return None, None
+
+    def set(self, key: str, value: str) -> None:
+        for tier in self.tiers:
+            tier.set(key, value)
+
+    def delete(self, key: str) -> None:
+        """Drop `key` from every tier, e.g. a response that turned out to be unusable."""
+        for tier in self.tiers:
+            tier.delete(key)
+
+    async def aget(self, key: str) -> tuple[str | None, str | None]:
+        """`lookup`, with the blocking tiers run on a worker thread."""
+        for i, tier in enumerate(self.tiers):
+            value = await self._call(tier, "get", key)
+            if value is not None:
+                for faster_tier in self.tiers[:i]:
+                    await self._call(faster_tier, "set", key, value)
+                self.hits += 1
+                return value, tier.name
+        self.misses += 1
+        return None, None
+
+    async def aset(self, key: str, value: str) -> None:
+        """`set`, with the blocking tiers run on a worker thread."""
+        for tier in self.tiers:
+            await self._call(tier, "set", key, value)
+
+    async def adelete(self, key: str) -> None:
+        """`delete`, with the blocking tiers run on a worker thread."""
+        for tier in self.tiers:
+            await self._call(tier, "delete", key)
+
+    @staticmethod
+    async def _call(tier, method: str, *args):
+        if tier.blocking:
+            return await asyncio.to_thread(getattr(tier, method), *args)
+        return getattr(tier, method)(*args)
+
+    def span_attributes(self, prefix: str, tier: str | None) -> dict:
+        """Whether a lookup hit (and in which `tier`, as returned by `lookup`/`aget`)
+        and the hit/miss counters as span attributes."""
+        return {
+            f"{prefix}.hit": tier is not None,
+            f"{prefix}.tier": tier or "",
+            f"{prefix}.hits": self.hits,
+            f"{prefix}.misses": self.misses,
+        }
+
+
+def make_response_cache(
+    sqlite_path: str | None = None,
+    max_entries: int = 1024,
+    max_disk_entries: int = 100_000,
+    ttl: float | None = 24 * 3600,
+) -> TieredCache:
+    """Build the default cache: an in-memory LRU tier, backed by an on-disk
+    SQLite tier when `sqlite_path` is given.
+    """
+    tiers = [LRUCache(max_entries=max_entries, ttl=ttl)]
+    if sqlite_path:
+        tiers.append(SQLiteCache(sqlite_path, max_entries=max_disk_entries, ttl=ttl))
+    return TieredCache(*tiers)
+
+
+# quoted literals and identifiers, kept verbatim by `normalize_sql`
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalize a query so that equivalent spellings share a cache entry.
+
+    Markdown fences and trailing semicolons are stripped, whitespace is
+    collapsed and everything but quoted literals is lowercased.
+    """
+    sql = sql.replace("```sql", "").replace("```", "").strip().rstrip(";").strip()
+    parts = _QUOTED.split(sql)
+    # odd indexes are the quoted parts captured by the split
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts)
+    )
+
+
+class QueryResultCache:
+    """In-memory cache of query results, evicting the least recently used ones
+    once their total size exceeds a memory budget.
+
+    Args:
+        max_bytes: Memory budget for the cached DataFrames.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, pd.DataFrame]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(sql: str, dataset_version: object, params: Sequence | None = None) -> str:
+        payload = f"{dataset_version}\n{normalize_sql(sql)}"
+        if params:
+            payload += "\n" + json.dumps(list(params), default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(
+        self, sql: str, dataset_version: object, params: Sequence | None = None
+    ) -> pd.DataFrame | None:
+        """Return the cached result of `sql` (with the values `params` of its `?`
+        placeholders) on the given dataset version, if any."""
+        key = self.key(sql, dataset_version, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(
+        self,
+        sql: str,
+        dataset_version: object,
+        result: pd.DataFrame,
+        params: Sequence | None = None,
+    ) -> None:
+        """Cache `result`, unless it alone exceeds the memory budget."""
+        nbytes = int(result.memory_usage(deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        key = self.key(sql, dataset_version, params)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[0]
+            self._entries[key] = (nbytes, result)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (evicted_bytes, _) = self._entries.popitem(last=False)
+                self.size -= evicted_bytes
+
+
+class ChartCache:
+    """In-memory cache of rendered charts (PNG/SVG bytes), evicting the least
+    recently used ones once their total size exceeds a memory budget.
+
+    Args:
+        max_bytes: Memory budget for the cached images.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def set(self, key: str, image: bytes) -> None:
+        """Cache `image`, unless it alone exceeds the memory budget."""
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = image
+            self.size += len(image)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
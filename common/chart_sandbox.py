@@ -0,0 +1,344 @@
+"""Sandboxed rendering of the generated chart code.
+
+The code returned by `generate_visualization` comes from a model (or a
+template), so nothing guarantees that it runs, and running it in the agent's
+process would block the event loop and expose the process to whatever the
+code does. `ChartRenderer` executes it in a pool of worker processes started
+ahead of time:
+
+- every worker is a separate interpreter (`python common/chart_sandbox.py`)
+  running in a temporary directory, without the API keys of the environment,
+  with matplotlib's non-interactive Agg backend and with matplotlib and
+  pandas already imported, so a chart only pays for its own rendering;
+- a chart may use `timeout` seconds of wall time and `cpu_seconds` of CPU
+  time, and the worker's address space is capped at `memory_limit` bytes
+  above what the imports use. A worker that doesn't answer in time is killed
+  and replaced;
+- the lookup result is bound to `data` (as a DataFrame), like the code
+  written by the models expects;
+- the rendered PNG/SVG is cached by the hash of the code, the data and the
+  format.
+
+This isolates the agent from crashes, hangs and runaway allocations of the
+chart code. It isn't a security boundary: the code can still read files and
+use the network.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import queue
+import selectors
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+if __name__ == "__main__":
+    # make the `common` package importable in the worker processes
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.cache import ChartCache  # noqa: E402
+
+CHART_FORMATS = ("png", "svg")
+
+# seconds a worker may take to start (import matplotlib and pandas)
+STARTUP_TIMEOUT = 60.0
+# seconds on top of the timeout before an unresponsive worker is killed
+KILL_GRACE = 2.0
+# environment variables passed on to the workers
+WORKER_ENV = ("PATH", "HOME", "LANG", "LC_ALL", "TMPDIR", "SYSTEMROOT")
+
+
+@dataclass
+class RenderedChart:
+    """Outcome of the rendering of a chart."""
+
+    key: str
+    format: str
+    image: bytes | None
+    cached: bool
+    elapsed: float
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.image is not None
+
+    def save(self, directory: str) -> str:
+        """Write the image to `directory` (named after its key) and return its path."""
+        path = Path(directory) / f"{self.key[:16]}.{self.format}"
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.image)
+        return str(path)
+
+    def span_attributes(self, prefix: str = "chart_rendering") -> dict:
+        return {
+            f"{prefix}.ok": self.ok,
+            f"{prefix}.cached": self.cached,
+            f"{prefix}.elapsed": round(self.elapsed, 4),
+            f"{prefix}.bytes": len(self.image or b""),
+            f"{prefix}.error": self.error or "",
+        }
+
+
+class _Worker:
+    """A worker process and its pipes."""
+
+    def __init__(self, memory_limit: int, cpu_seconds: float):
+        env = {name: os.environ[name] for name in WORKER_ENV if name in os.environ}
+        env.update(MPLBACKEND="Agg", OPENBLAS_NUM_THREADS="1", OMP_NUM_THREADS="1")
+        self.directory = tempfile.TemporaryDirectory(prefix="chart-")
+        self.process = subprocess.Popen(
+            [sys.executable, __file__, str(memory_limit), str(cpu_seconds)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.directory.name,
+            env=env,
+            text=True,
+        )
+        self.ready = False
+
+    def _read(self, timeout: float) -> dict:
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ)
+            if not selector.select(timeout):
+                raise TimeoutError
+        line = self.process.stdout.readline()
+        if not line:
+            raise EOFError("the worker exited")
+        return json.loads(line)
+
+    def request(self, payload: dict, timeout: float) -> dict:
+        if not self.ready:
+            self._read(STARTUP_TIMEOUT)
+            self.ready = True
+        self.process.stdin.write(json.dumps(payload) + "\n")
+        self.process.stdin.flush()
+        return self._read(timeout)
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+        self.directory.cleanup()
+
+
+class ChartRenderer:
+    """Pool of sandboxed worker processes rendering chart code.
+
+    Args:
+        workers: Number of worker processes, i.e. of charts rendered at the same time.
+        timeout: Wall-clock seconds a chart may take.
+        cpu_seconds: CPU seconds a chart may use.
+        memory_limit: Bytes a worker may allocate on top of its imports.
+        fmt: Format of the images, one of `CHART_FORMATS`.
+        cache: Cache of the rendered images, `None` for a default one.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 10.0,
+        cpu_seconds: float = 10.0,
+        memory_limit: int = 512 * 2**20,
+        fmt: str = "png",
+        cache: ChartCache | None = None,
+    ):
+        if fmt not in CHART_FORMATS:
+            raise ValueError(f"Unknown chart format {fmt!r}, expected one of {CHART_FORMATS}")
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_limit = memory_limit
+        self.fmt = fmt
+        self.cache = cache if cache is not None else ChartCache()
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        # every live worker, idle or rendering
+        self._workers: set[_Worker] = set()
+        self._lock = threading.RLock()
+        self._started = False
+
+    @classmethod
+    def from_env(cls) -> "ChartRenderer":
+        """Build the renderer from the CHART_RENDER_WORKERS, CHART_RENDER_TIMEOUT,
+        CHART_RENDER_CPU_SECONDS, CHART_RENDER_MEMORY_MB and CHART_FORMAT env variables."""
+        return cls(
+            workers=int(os.getenv("CHART_RENDER_WORKERS", 2)),
+            timeout=float(os.getenv("CHART_RENDER_TIMEOUT", 10)),
+            cpu_seconds=float(os.getenv("CHART_RENDER_CPU_SECONDS", 10)),
+            memory_limit=int(os.getenv("CHART_RENDER_MEMORY_MB", 512)) * 2**20,
+            fmt=os.getenv("CHART_FORMAT", "png"),
+        )
+
+    def start(self) -> None:
+        """Start the workers, if not started yet. They import matplotlib and
+        pandas in the background, so call it early to have them warm."""
+        with self._lock:
+            if not self._started:
+                for _ in range(self.workers):
+                    self._idle.put(self._spawn())
+                self._started = True
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self.memory_limit, self.cpu_seconds)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _kill(self, worker: _Worker) -> None:
+        with self._lock:
+            self._workers.discard(worker)
+        worker.kill()
+
+    def _release(self, worker: _Worker | None) -> None:
+        """Put a worker back in the pool after a chart, or the replacement of a
+        worker that was killed (`None`). Once closed, the worker is killed instead."""
+        with self._lock:
+            if not self._started:
+                if worker is not None:
+                    self._kill(worker)
+                return
+            self._idle.put(worker if worker is not None else self._spawn())
+
+    @staticmethod
+    def key(code: str, data: str | None, fmt: str) -> str:
+        payload = json.dumps([fmt, code, data])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def render(self, code: str, data: str | None = None) -> RenderedChart:
+        """Render `code` in a worker (blocks until one is free).
+
+        Args:
+            code: The chart code.
+            data: The lookup_sales_data tool's output, bound to `data` as a
+                DataFrame if it holds a table.
+        """
+        start = time.perf_counter()
+        key = self.key(code, data, self.fmt)
+        image = self.cache.get(key)
+        if image is not None:
+            return RenderedChart(key, self.fmt, image, True, time.perf_counter() - start)
+
+        self.start()
+        worker = self._idle.get()
+        payload = {"code": code, "data": data, "fmt": self.fmt, "timeout": self.timeout}
+        try:
+            response = worker.request(payload, self.timeout + KILL_GRACE)
+        except (TimeoutError, EOFError, OSError) as e:
+            self._kill(worker)
+            worker = None
+            reason = "didn't complete in time" if isinstance(e, TimeoutError) else "crashed"
+            response = {"error": f"the chart code {reason}"}
+        finally:
+            self._release(worker)
+
+        elapsed = time.perf_counter() - start
+        if "error" in response:
+            return RenderedChart(key, self.fmt, None, False, elapsed, response["error"])
+        image = base64.b64decode(response["image"])
+        self.cache.set(key, image)
+        return RenderedChart(key, self.fmt, image, False, elapsed)
+
+    def close(self) -> None:
+        """Kill all the workers and wait for them to exit, including the ones
+        rendering a chart (which then fails)."""
+        with self._lock:
+            self._started = False
+            workers, self._workers = self._workers, set()
+            while not self._idle.empty():
+                self._idle.get_nowait()
+        for worker in workers:
+            worker.kill()
+
+
+# ------
+# worker
+# ------
+
+
+class _LimitExceeded(Exception):
+    pass
+
+
+def _serve(memory_limit: int, cpu_seconds: float) -> None:
+    """Render the charts requested on stdin, one JSON object per line."""
+    import io
+    import signal
+    import traceback
+
+    # answers go to the original stdout, what the charts print is discarded
+    answers = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import pandas as pd  # noqa: F401 (warm import for the charts)
+
+    from common.rendering import parse_result
+
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        resource = None
+
+    def limit_exceeded(signum, frame):
+        raise _LimitExceeded("time" if signum == signal.SIGALRM else "CPU")
+
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, limit_exceeded)
+        signal.signal(signal.SIGALRM, limit_exceeded)
+        if memory_limit and Path("/proc/self/statm").exists():
+            # the address space used by the imports, plus the budget
+            pages = int(Path("/proc/self/statm").read_text().split()[0])
+            used = pages * os.sysconf("SC_PAGE_SIZE")
+            resource.setrlimit(resource.RLIMIT_AS, (used + memory_limit, resource.RLIM_INFINITY))
+
+    def render(request: dict) -> dict:
+        plt.close("all")
+        data = parse_result(request["data"]) if request.get("data") else None
+        namespace = {"__name__": "__chart__", "data": data}
+        if resource is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            cpu = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, resource.RLIM_INFINITY))
+            signal.setitimer(signal.ITIMER_REAL, request["timeout"])
+        try:
+            exec(compile(request["code"], "<chart>", "exec"), namespace)
+            if not plt.get_fignums():
+                return {"error": "the chart code didn't draw a figure"}
+            buffer = io.BytesIO()
+            plt.gcf().savefig(buffer, format=request["fmt"])
+            return {"image": base64.b64encode(buffer.getvalue()).decode()}
+        except _LimitExceeded as e:
+            return {"error": f"the chart code exceeded its {e} limit"}
+        except MemoryError:
+            return {"error": "the chart code exceeded its memory limit"}
+        except Exception as e:
+            line = traceback.extract_tb(e.__traceback__)[-1]
+            where = f" (line {line.lineno})" if line.filename == "<chart>" else ""
+            return {"error": f"{type(e).__name__}: {e}{where}"}
+        finally:
+            if resource is not None:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY,) * 2)
+            plt.close("all")
+
+    answers.write(json.dumps({"ready": True}) + "\n")
+    answers.flush()
+    for line in sys.stdin:
+        answers.write(json.dumps(render(json.loads(line))) + "\n")
+        answers.flush()
+
+
+if __name__ == "__main__":
+    _serve(int(sys.argv[1]), float(sys.argv[2]))
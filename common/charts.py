@@ -0,0 +1,97 @@
+"""Deterministic chart code for the common chart types.
+
+Once the chart configuration (chart_type, x_axis, y_axis, title) is known,
+writing the matplotlib code doesn't need a model. `chart_code` renders the
+code of a bar, line, scatter or pie chart from the configuration and the
+`lookup_sales_data` output, with the rows embedded in the code so it runs
+on its own. It returns `None` for the other chart types, and when the axes
+of the configuration aren't columns of the data, so the labs can fall back
+to the model.
+"""
+
+import re
+from collections.abc import Mapping
+
+import pandas as pd
+
+from common.rendering import parse_result
+
+# chart type -> plotting statement, `{x}` and `{y}` are the quoted column names
+TEMPLATES = {
+    "bar": "ax.bar(data[{x}].astype(str), data[{y}])",
+    "line": 'ax.plot(data[{x}], data[{y}], marker="o")',
+    "scatter": "ax.scatter(data[{x}], data[{y}])",
+    "pie": 'ax.pie(data[{y}], labels=data[{x}].astype(str), autopct="%1.1f%%")',
+}
+
+# other names the model uses for the chart types above
+ALIASES = {"column": "bar", "barh": "bar", "time series": "line", "timeseries": "line"}
+
+# categories beyond which the labels of the x-axis are rotated
+ROTATE_LABELS = 10
+
+
+def chart_type(name: str) -> str | None:
+    """The template of a chart type named by the model ("Bar chart", "line_plot", ...)."""
+    name = re.sub(r"[\s_-]*(chart|plot|graph)$", "", name.strip().lower().replace("_", " "))
+    name = ALIASES.get(name, name)
+    return name if name in TEMPLATES else None
+
+
+def _column(name: str, columns: list[str]) -> str | None:
+    """The column of `columns` named `name`, ignoring case, spaces and underscores."""
+    key = re.sub(r"[\s_]", "", name).lower()
+    return next((c for c in columns if re.sub(r"[\s_]", "", str(c)).lower() == key), None)
+
+
+def chart_code(config: Mapping[str, str], data: str) -> str | None:
+    """Python code drawing the chart of `config` from the rows of `data`.
+
+    Args:
+        config: The chart configuration (chart_type, x_axis, y_axis, title).
+        data: The lookup_sales_data tool's output.
+
+    Returns:
+        The code, or `None` if there is no template for the chart type or the
+        axes aren't columns of the data.
+    """
+    kind = chart_type(config.get("chart_type", ""))
+    df = parse_result(data) if kind else None
+    if df is None:
+        return None
+    x = _column(config.get("x_axis", ""), list(df.columns))
+    y = _column(config.get("y_axis", ""), list(df.columns))
+    if x is None or y is None or not pd.api.types.is_numeric_dtype(df[y]):
+        return None
+
+    rows = df[[x, y]].to_csv(index=False)
+    # a readable literal, unless the values would end or escape it
+    literal = repr(rows) if '"""' in rows or "\\" in rows else f'"""\n{rows}"""'
+    lines = [
+        "import io",
+        "",
+        "import matplotlib.pyplot as plt",
+        "import pandas as pd",
+        "",
+        f"data = pd.read_csv(io.StringIO({literal}))",
+    ]
+    if kind == "line":
+        dates = pd.to_datetime(df[x], format="ISO8601", errors="coerce")
+        if not pd.api.types.is_numeric_dtype(df[x]) and dates.notna().all():
+            lines.append(f"data[{x!r}] = pd.to_datetime(data[{x!r}])")
+        lines.append(f"data = data.sort_values({x!r})")
+    lines += [
+        "",
+        "fig, ax = plt.subplots(figsize=(10, 6))",
+        TEMPLATES[kind].format(x=repr(x), y=repr(y)),
+    ]
+    if kind != "pie":
+        lines += [f"ax.set_xlabel({x!r})", f"ax.set_ylabel({y!r})"]
+    if kind == "bar" and df[x].nunique() > ROTATE_LABELS:
+        lines.append('ax.tick_params(axis="x", labelrotation=90)')
+    lines += [
+        f"ax.set_title({config.get('title', '')!r})",
+        "fig.tight_layout()",
+        "plt.show()",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,230 @@
+"""Pool of DuckDB cursors over a shared in-memory database.
+
+The module-level `duckdb.sql(...)` runs every query on DuckDB's single default
+connection, which serializes them. A `CursorPool` owns its own connection with
+the dataset registered on it and hands out one cursor per in-flight query.
+The cursors share the database (tables, views, rollups, attached files), so
+queries running on different threads execute in parallel.
+
+`CursorPool.execute` runs a query on a bounded pool of worker threads, so a
+heavy query doesn't block the event loop, and interrupts it when it exceeds
+its timeout. The time spent waiting for a worker and the execution time are
+recorded as the `query_queue_wait` and `query_execution` spans.
+
+With a `common.guards.QueryGuard`, the pool's database runs with the guard's
+memory and thread limits and every query is checked against its plan first.
+
+With `max_prepared`, the parameterized queries (the ones given `params`) run
+as prepared statements kept per cursor, see `common.prepared`.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import duckdb
+import pandas as pd
+from opentelemetry import trace
+
+from common.dataset import SalesDataset
+from common.guards import QueryGuard
+from common.prepared import PreparedStatements
+
+tracer = trace.get_tracer(__name__)
+
+
+class QueryTimeout(Exception):
+    """Raised when a query exceeds its timeout (it's interrupted)."""
+
+
+# seconds between two interrupts of a query that timed out, until it stops
+INTERRUPT_INTERVAL = 0.05
+
+
+@dataclass
+class _QueryState:
+    """Progress of a query submitted to the workers, shared with the event loop."""
+
+    submitted_at: int
+    started_at: int | None = None
+    finished_at: int | None = None
+    # the cursor running the query, set and cleared under `lock`
+    cursor: duckdb.DuckDBPyConnection | None = None
+    cancelled: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def cancel(self) -> None:
+        """Flag the query as cancelled and interrupt it, if it's running."""
+        with self.lock:
+            self.cancelled = True
+            if self.cursor is not None:
+                self.cursor.interrupt()
+
+
+class CursorPool:
+    """Cursors over a connection the dataset is registered on.
+
+    Cursors are created on demand, so there is one per in-flight query, and
+    up to `max_idle` of them are kept for reuse once released.
+
+    Args:
+        dataset: The dataset to expose on the cursors.
+        table_name: Name of the table of the dataset.
+        max_idle: Number of released cursors kept open.
+        max_workers: Number of worker threads of `execute`, queries beyond
+            that wait for a worker.
+        guard: Limits the queries are checked against, `None` to run them
+            unchecked.
+        max_prepared: Number of prepared statements kept per cursor for the
+            parameterized queries, 0 to not prepare them.
+    """
+
+    def __init__(
+        self,
+        dataset: SalesDataset,
+        table_name: str = "sales",
+        max_idle: int = 16,
+        max_workers: int = 4,
+        guard: QueryGuard | None = None,
+        max_prepared: int = 0,
+    ):
+        self.dataset = dataset
+        self.table_name = table_name
+        self.max_idle = max_idle
+        self.guard = guard
+        self.statements = PreparedStatements(max_prepared) if max_prepared else None
+        self.connection = duckdb.connect()
+        if guard is not None:
+            guard.configure(self.connection)
+        self._idle: list[duckdb.DuckDBPyConnection] = []
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="duckdb-query")
+        # the tasks interrupting the queries that timed out
+        self._interrupts: set[asyncio.Task] = set()
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """A cursor with the current version of the dataset registered on it,
+        for the duration of the block."""
+        with self._lock:
+            cursor = self._idle.pop() if self._idle else self.connection.cursor()
+            self.in_use += 1
+        try:
+            self.dataset.register(self.connection, self.table_name)
+            self.dataset.register_cursor(cursor, self.table_name)
+            yield cursor
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(cursor)
+                    cursor = None
+            if cursor is not None:
+                self._close_cursor(cursor)
+
+    async def execute(
+        self, sql: str, timeout: float | None = None, params: Sequence | None = None
+    ) -> pd.DataFrame:
+        """Run `sql` on a worker thread and return the result as a DataFrame.
+
+        Args:
+            sql: The query.
+            timeout: Seconds the query may take, waiting for a worker included.
+                Past that the query is interrupted (or dropped if it didn't
+                start yet) and `QueryTimeout` is raised.
+            params: The values of the query's `?` placeholders.
+        """
+        state = _QueryState(submitted_at=time.time_ns())
+        # run in a copy of the context, so the worker's spans and attributes
+        # are attached to the caller's span
+        context = contextvars.copy_context()
+        submitted = self._executor.submit(context.run, self._run, sql, params, state)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(submitted), timeout)
+        except asyncio.TimeoutError:
+            state.cancel()
+            # an interrupt landing before the cursor starts executing the query
+            # is lost, so keep interrupting it until the worker is done
+            task = asyncio.ensure_future(self._interrupt(state, submitted))
+            self._interrupts.add(task)
+            task.add_done_callback(self._interrupts.discard)
+            raise QueryTimeout(f"the query didn't complete within {timeout}s") from None
+        finally:
+            self._record_spans(state)
+
+    @staticmethod
+    async def _interrupt(state: _QueryState, submitted: Future) -> None:
+        while not submitted.done():
+            await asyncio.sleep(INTERRUPT_INTERVAL)
+            state.cancel()
+
+    def query(self, sql: str, params: Sequence | None = None) -> pd.DataFrame:
+        """Run `sql` (with the values `params` of its `?` placeholders) on a cursor
+        of the calling thread and return the result as a DataFrame.
+
+        Raises:
+            common.guards.QueryRejected: When the query exceeds the guard's limits.
+        """
+        with self.cursor() as cursor:
+            return self._query(cursor, sql, params)
+
+    def _query(
+        self, cursor: duckdb.DuckDBPyConnection, sql: str, params: Sequence | None
+    ) -> pd.DataFrame:
+        if params is not None and self.statements is not None:
+            check = None
+            if self.guard is not None:
+                def check(template: str) -> str:
+                    return self.guard.prepare(cursor, template, self.dataset, params)
+            return self.statements.execute(cursor, sql, params, check).df()
+        if self.guard is not None:
+            sql = self.guard.prepare(cursor, sql, self.dataset, params)
+        return cursor.execute(sql, params).df()
+
+    def _run(self, sql: str, params: Sequence | None, state: _QueryState) -> pd.DataFrame:
+        state.started_at = time.time_ns()
+        try:
+            with self.cursor() as cursor:
+                with state.lock:
+                    if state.cancelled:
+                        raise QueryTimeout("the query timed out before it started")
+                    state.cursor = cursor
+                try:
+                    return self._query(cursor, sql, params)
+                finally:
+                    # before the cursor goes back to the pool, so that it isn't
+                    # interrupted while running another query
+                    with state.lock:
+                        state.cursor = None
+        finally:
+            state.finished_at = time.time_ns()
+
+    @staticmethod
+    def _record_spans(state: _QueryState) -> None:
+        now = time.time_ns()
+        started_at = state.started_at or now
+        wait = tracer.start_span("query_queue_wait", start_time=state.submitted_at)
+        wait.end(end_time=started_at)
+        if state.started_at is not None:
+            execution = tracer.start_span("query_execution", start_time=started_at)
+            execution.set_attribute("interrupted", state.cancelled)
+            execution.end(end_time=state.finished_at or now)
+
+    def _close_cursor(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        if self.statements is not None:
+            self.statements.forget(cursor)
+        cursor.close()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for cursor in self._idle:
+                self._close_cursor(cursor)
+            self._idle.clear()
+        self.connection.close()
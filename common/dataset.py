@@ -0,0 +1,591 @@
+"""Access to the Store Sales Price Elasticity Promotions dataset from DuckDB."""
+
+import os
+import shutil
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common.prepared import sql_literal
+from common.rollups import create_rollups, describe_rollups, link_rollups
+
+
+# How the sales data is exposed to DuckDB:
+# - "copy": load the file with pandas and materialize it into a DuckDB table
+#   (CREATE TABLE AS SELECT), the data lives twice in memory.
+# - "arrow": load the file as an Arrow table and register it as a view, DuckDB
+#   scans the Arrow buffers in place without copying them.
+# - "parquet": create a view over `read_parquet(...)`, nothing is loaded upfront
+#   and DuckDB scans the file directly on every query. This is also the mode for
+#   hive-partitioned directories (see `parquet_source`), that can grow larger
+#   than the memory.
+# - "duckdb": attach read-only the persistent database built from the file by
+#   `build_sales_database` (see common/build_database.py). Nothing is loaded
+#   upfront and every process shares the database file through the OS page cache.
+DATA_ACCESS_MODES = ("copy", "arrow", "parquet", "duckdb")
+
+# name of the table in the databases built by `build_sales_database`
+DATABASE_TABLE = "sales"
+# order of the rows in the files built by `build_sales_database` and
+# `build_sorted_parquet`, it makes the min/max statistics of the row groups
+# selective for store/date filters
+SORT_ORDER = ("Store_Number", "Sold_Date")
+# rows per row group of the files built by `build_sorted_parquet`, small enough
+# for a store/date filter to skip most of them
+SORTED_ROW_GROUP_SIZE = 16_384
+
+# columns with at most this many distinct values list all of them in the schema
+LOW_CARDINALITY = 12
+# number of example values shown for the other columns
+EXAMPLE_VALUES = 3
+
+
+@dataclass(frozen=True)
+class ColumnSchema:
+    """Type and value statistics of a column, as shown to the text2sql model."""
+
+    name: str
+    type: str
+    min: str
+    max: str
+    distinct: int
+    # all the values of low cardinality columns, the most frequent ones otherwise
+    values: tuple[str, ...]
+
+    @property
+    def enumerated(self) -> bool:
+        return len(self.values) <= LOW_CARDINALITY
+
+    def describe(self) -> str:
+        if self.enumerated:
+            return f"- {self.name} ({self.type}): one of {', '.join(self.values)}"
+        examples = ", ".join(self.values[:EXAMPLE_VALUES])
+        return (
+            f"- {self.name} ({self.type}): ~{self.distinct} distinct values "
+            f"from {self.min} to {self.max}, e.g. {examples}"
+        )
+
+
+# partition columns of the directories built by `build_partitioned_parquet`
+PARTITION_COLUMNS = {
+    "Sold_Year": "YEAR(Sold_Date)",
+    "Sold_Month": "MONTH(Sold_Date)",
+    "Store_Number": "Store_Number",
+}
+# file of a partitioned directory touched by its writer once the files are
+# complete (e.g. by `build_partitioned_parquet`), its modification time is the
+# version of the directory
+VERSION_MARKER = "_SUCCESS"
+# seconds the version of a partitioned directory without a marker is reused
+# before its subdirectories are walked again
+VERSION_TTL = 2.0
+# rows of the most recent partitions of a partitioned directory the example
+# values of the schema are taken from
+SCHEMA_SAMPLE_ROWS = 100_000
+
+
+def parquet_source(path: str) -> str:
+    """`read_parquet(...)` expression scanning `path`.
+
+    `path` is either a Parquet file or a hive-partitioned directory of Parquet
+    files (e.g. `Sold_Year=2021/Sold_Month=11/Store_Number=1320/data_0.parquet`).
+    The partition values become columns, and DuckDB only reads the files of
+    the partitions matching the filters of a query.
+    """
+    if os.path.isdir(path):
+        files = sql_literal(os.path.join(path, "**", "*.parquet"))
+        return f"read_parquet({files}, hive_partitioning = true)"
+    return f"read_parquet({sql_literal(path)})"
+
+
+def database_path(path: str) -> str:
+    """Path of the DuckDB database built from the Parquet file (or directory)
+    `path` (the same path with a `.duckdb` extension), `path` itself if it is
+    a database."""
+    root, extension = os.path.splitext(os.path.normpath(path))
+    return path if extension == ".duckdb" else f"{root}.duckdb"
+
+
+def build_sales_database(
+    path: str,
+    output: str | None = None,
+    sort_by: tuple[str, ...] = SORT_ORDER,
+    rollups: bool = True,
+) -> str:
+    """Build a persistent DuckDB database from the Parquet file (or directory) `path`.
+
+    The rows are stored in the `DATABASE_TABLE` table, with the column types of
+    the Parquet file, sorted by `sort_by` and with up to date statistics, next
+    to the rollups of `common/rollups.py` when `rollups` is set. The database
+    is written next to its final location and moved in place once complete, so
+    processes attached to a previous version keep working.
+
+    Args:
+        path: Path to the Parquet file or directory.
+        output: Path of the database, `database_path(path)` by default.
+        sort_by: Columns to sort the rows by.
+        rollups: Whether to build the rollup tables.
+
+    Returns:
+        The path of the database.
+    """
+    output = output or database_path(path)
+    building = f"{output}.building"
+    if os.path.exists(building):
+        os.remove(building)
+    with duckdb.connect(building) as connection:
+        connection.execute(
+            f"CREATE TABLE {DATABASE_TABLE} AS SELECT * FROM {parquet_source(path)} "
+            f"ORDER BY {', '.join(sort_by)}"
+        )
+        if rollups:
+            create_rollups(connection, DATABASE_TABLE)
+        connection.execute("ANALYZE")
+        connection.execute("CHECKPOINT")
+    os.replace(building, output)
+    return output
+
+
+def sorted_parquet_path(path: str) -> str:
+    """Path of the sorted copy of the Parquet file `path` built by `build_sorted_parquet`."""
+    root, _ = os.path.splitext(path)
+    return f"{root}.sorted.parquet"
+
+
+def build_sorted_parquet(
+    path: str,
+    output: str | None = None,
+    sort_by: tuple[str, ...] = SORT_ORDER,
+    row_group_size: int = SORTED_ROW_GROUP_SIZE,
+) -> str:
+    """Rewrite the Parquet file `path` clustered by `sort_by`.
+
+    Every row group then covers a narrow range of stores and dates, so DuckDB
+    skips the row groups whose min/max statistics don't match the filters of a
+    query instead of scanning the whole file. Like `build_sales_database`, the
+    file is written aside and moved in place once complete.
+
+    Args:
+        path: Path to the Parquet file.
+        output: Path of the sorted file, `sorted_parquet_path(path)` by default.
+        sort_by: Columns to sort the rows by.
+        row_group_size: Number of rows per row group.
+
+    Returns:
+        The path of the sorted file.
+    """
+    output = output or sorted_parquet_path(path)
+    building = f"{output}.building"
+    with duckdb.connect() as connection:
+        connection.execute(
+            f"COPY (SELECT * FROM {parquet_source(path)} ORDER BY {', '.join(sort_by)}) "
+            f"TO {sql_literal(building)} "
+            f"(FORMAT parquet, ROW_GROUP_SIZE {row_group_size}, COMPRESSION zstd)"
+        )
+    os.replace(building, output)
+    return output
+
+
+def partitioned_parquet_path(path: str) -> str:
+    """Path of the partitioned copy of the Parquet file `path` built by
+    `build_partitioned_parquet`."""
+    root, _ = os.path.splitext(path)
+    return f"{root}.partitioned"
+
+
+def build_partitioned_parquet(path: str, output: str | None = None) -> str:
+    """Rewrite the Parquet file `path` as a directory partitioned by year,
+    month and store (`PARTITION_COLUMNS`).
+
+    The directory is written aside, with its `VERSION_MARKER`, and swapped
+    with the previous one once complete.
+
+    Args:
+        path: Path to the Parquet file.
+        output: Path of the directory, `partitioned_parquet_path(path)` by default.
+
+    Returns:
+        The path of the directory.
+    """
+    output = output or partitioned_parquet_path(path)
+    building = f"{output}.building"
+    shutil.rmtree(building, ignore_errors=True)
+    columns = ", ".join(
+        f"{expression} AS {name}"
+        for name, expression in PARTITION_COLUMNS.items()
+        if expression != name
+    )
+    with duckdb.connect() as connection:
+        connection.execute(
+            f"COPY (SELECT *, {columns} FROM {parquet_source(path)}) TO {sql_literal(building)} "
+            f"(FORMAT parquet, PARTITION_BY ({', '.join(PARTITION_COLUMNS)}), COMPRESSION zstd)"
+        )
+    open(os.path.join(building, VERSION_MARKER), "w").close()
+    if os.path.exists(output):
+        previous = f"{output}.previous"
+        shutil.rmtree(previous, ignore_errors=True)
+        os.replace(output, previous)
+        os.replace(building, output)
+        shutil.rmtree(previous)
+    else:
+        os.replace(building, output)
+    return output
+
+
+class SalesDataset:
+    """Handle to the sales data file and the way it's exposed to DuckDB.
+
+    The data is loaded lazily on first access and reloaded whenever the file's
+    modification time changes, so a long running process picks up a new file
+    without restarting.
+
+    A hive-partitioned directory of Parquet files is only supported by the
+    "parquet" mode, where it's scanned lazily (see `parquet_source`), and by
+    the "duckdb" mode through the database built from it. Nothing grows with
+    the size of the directory in memory: its rollups are views rather than
+    tables (and aren't advertised in `table_description`, as they save
+    nothing). The ranges of its schema come from the Parquet footers and the
+    paths of the files, the other statistics from the first
+    `SCHEMA_SAMPLE_ROWS` rows of the most recent partitions.
+
+    Args:
+        path: Path to the Parquet file or directory. In "duckdb" mode the
+            database built from it (see `database_path`) is used instead.
+        mode: One of `DATA_ACCESS_MODES`.
+        rollups: Whether to create the rollups of `common/rollups.py` next to
+            the table on every connection it's registered on (in "duckdb"
+            mode, to expose the ones built with the database).
+    """
+
+    def __init__(self, path: str, mode: str = "arrow", rollups: bool = True):
+        if mode not in DATA_ACCESS_MODES:
+            raise ValueError(
+                f"Unknown data access mode {mode!r}, expected one of {DATA_ACCESS_MODES}"
+            )
+        if mode in ("copy", "arrow") and os.path.isdir(path):
+            raise ValueError(
+                f"{path} is a partitioned directory, it can't be loaded in memory with "
+                f"the {mode!r} mode, use the 'parquet' (or 'duckdb') mode instead"
+            )
+        self.path = database_path(path) if mode == "duckdb" else path
+        self.mode = mode
+        self.rollups = rollups
+        self.partitioned = os.path.isdir(self.path)
+        self._data: pd.DataFrame | pa.Table | None = None
+        self._columns: list[str] | None = None
+        self._version: int | None = None
+        # (time of the walk, version) of a partitioned directory without a marker
+        self._walked: tuple[float, int] | None = None
+        self._schema: tuple[int, list[ColumnSchema], str] | None = None
+        # version of the data registered on each connection, per table name
+        self._registered: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._register_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        """Version of the data, derived from the file's modification time.
+
+        For a partitioned directory this is the modification time of its
+        `VERSION_MARKER`. Without a marker, it's the last modification time of
+        its subdirectories, which changes whenever a file is added or removed.
+        Walking them takes time with a long history, so that version is reused
+        for `VERSION_TTL` seconds.
+        """
+        try:
+            if self.partitioned:
+                return self._directory_version()
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self.mode == "duckdb":
+                raise FileNotFoundError(
+                    f"{self.path} not found, build it with `uv run common/build_database.py`"
+                ) from None
+            raise
+
+    def _directory_version(self) -> int:
+        try:
+            return os.stat(os.path.join(self.path, VERSION_MARKER)).st_mtime_ns
+        except FileNotFoundError:
+            pass
+        now = time.monotonic()
+        walked = self._walked
+        if walked is None or now - walked[0] > VERSION_TTL:
+            version = max(os.stat(root).st_mtime_ns for root, _, _ in os.walk(self.path))
+            walked = self._walked = (now, version)
+        return walked[1]
+
+    def _refresh(self) -> None:
+        """(Re)load the file if it was never loaded or changed on disk."""
+        version = self.version
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            if self.mode == "copy":
+                self._data = pd.read_parquet(self.path)
+                self._columns = list(self._data.columns)
+            elif self.mode == "arrow":
+                self._data = pq.read_table(self.path)
+                self._columns = self._data.column_names
+            elif self.mode == "parquet":
+                with duckdb.connect() as connection:
+                    self._columns = [
+                        name for name, *_ in connection.execute(
+                            f"DESCRIBE SELECT * FROM {parquet_source(self.path)}"
+                        ).fetchall()
+                    ]
+            else:
+                with duckdb.connect(self.path, read_only=True) as connection:
+                    self._columns = [
+                        name for name, *_ in
+                        connection.execute(f"DESCRIBE {DATABASE_TABLE}").fetchall()
+                    ]
+            self._version = version
+
+    @property
+    def data(self) -> pd.DataFrame | pa.Table | None:
+        """The in-memory data (a DataFrame in "copy" mode, an Arrow table in
+        "arrow" mode and `None` in the "parquet" and "duckdb" modes)."""
+        self._refresh()
+        return self._data
+
+    @property
+    def columns(self) -> list[str]:
+        """Names of the columns available in the dataset."""
+        self._refresh()
+        return self._columns
+
+    @property
+    def schema(self) -> list[ColumnSchema]:
+        """DuckDB type, range and example values of every column.
+
+        Computed once per version of the data.
+        """
+        return self._describe()[0]
+
+    @property
+    def schema_description(self) -> str:
+        """Compact and stable rendering of `schema`, one line per column, meant
+        to be put in the text2sql prompt."""
+        return self._describe()[1]
+
+    def table_description(self, table_name: str) -> str:
+        """`schema_description` followed by the description of the rollups of
+        `table_name`, if they are built."""
+        if not self.rollups or self.partitioned:
+            return self.schema_description
+        return f"{self.schema_description}\n\n{describe_rollups(table_name)}"
+
+    def _describe(self) -> tuple[list[ColumnSchema], str]:
+        self._refresh()
+        version = self._version
+        if self._schema is None or self._schema[0] != version:
+            schema = self._compute_schema()
+            description = "\n".join(column.describe() for column in schema)
+            self._schema = (version, schema, description)
+        return self._schema[1], self._schema[2]
+
+    def _compute_schema(self) -> list[ColumnSchema]:
+        """Collect the column statistics on a private connection (one DESCRIBE,
+        one aggregate scan and one small GROUP BY per column, see
+        `_read_partitions` for a partitioned directory)."""
+        connection = duckdb.connect()
+        try:
+            if self.mode in ("copy", "arrow"):
+                # a zero-copy scan of the in-memory data, also in "copy" mode
+                connection.register("dataset", self._data)
+            else:
+                self._register_table(connection, "dataset")
+            types = [(name, column_type) for name, column_type, *_ in
+                     connection.execute("DESCRIBE dataset").fetchall()]
+            source, partitions = "dataset", []
+            if self.partitioned:
+                source, partitions = "sample", self._read_partitions(connection, types)
+            stats = connection.execute(
+                "SELECT "
+                + ", ".join(
+                    f'CAST(min("{name}") AS VARCHAR), CAST(max("{name}") AS VARCHAR), '
+                    f'approx_count_distinct("{name}")'
+                    for name, _ in types
+                )
+                + f" FROM {source}"
+            ).fetchone()
+            schema = []
+            for i, (name, column_type) in enumerate(types):
+                column_min, column_max, distinct = stats[3 * i:3 * i + 3]
+                values_source, frequency = source, "count(*)"
+                if name in partitions:
+                    # exact, from the paths of the files
+                    column_min, column_max, distinct = connection.execute(
+                        f'SELECT CAST(min("{name}") AS VARCHAR), CAST(max("{name}") AS VARCHAR), '
+                        f'count(DISTINCT "{name}") FROM partitions'
+                    ).fetchone()
+                    values_source, frequency = "partitions", "sum(rows)"
+                elif self.partitioned:
+                    # exact, from the statistics of the footers
+                    footer_min, footer_max = connection.execute(
+                        f"SELECT CAST(min(TRY_CAST(stats_min_value AS {column_type})) AS VARCHAR), "
+                        f"CAST(max(TRY_CAST(stats_max_value AS {column_type})) AS VARCHAR) "
+                        "FROM footers WHERE path_in_schema = ?",
+                        [name],
+                    ).fetchone()
+                    column_min, column_max = footer_min or column_min, footer_max or column_max
+                values = connection.execute(
+                    f'SELECT CAST("{name}" AS VARCHAR) FROM {values_source} GROUP BY "{name}" '
+                    f'ORDER BY {frequency} DESC, "{name}" LIMIT {LOW_CARDINALITY + 1}'
+                ).fetchall()
+                schema.append(
+                    ColumnSchema(
+                        name=name,
+                        type=column_type,
+                        min=column_min,
+                        max=column_max,
+                        distinct=distinct,
+                        values=tuple(value for (value,) in values),
+                    )
+                )
+            return schema
+        finally:
+            connection.close()
+
+    def _read_partitions(
+        self, connection: duckdb.DuckDBPyConnection, types: list[tuple[str, str]]
+    ) -> list[str]:
+        """Read the footers of the files of a partitioned directory, without
+        scanning the whole history.
+
+        Creates the temp tables `footers` (the statistics of every column chunk),
+        `partitions` (the rows and the partition values of every file) and
+        `sample` (the first `SCHEMA_SAMPLE_ROWS` rows of the most recent
+        partitions, the only data files read).
+
+        Returns:
+            The partition columns, in the order of the path of a file.
+        """
+        connection.execute(
+            "CREATE TEMP TABLE footers AS SELECT file_name, row_group_id, row_group_num_rows, "
+            "path_in_schema, stats_min_value, stats_max_value "
+            f"FROM parquet_metadata({sql_literal(os.path.join(self.path, '**', '*.parquet'))})"
+        )
+        (file_name,) = connection.execute("SELECT any_value(file_name) FROM footers").fetchone()
+        partitions = sorted(
+            (name for name, _ in types if f"/{name}=" in (file_name or "")),
+            key=lambda name: file_name.index(f"/{name}="),
+        )
+        values = "".join(
+            f", TRY_CAST(regexp_extract(file_name, '/{name}=([^/]+)', 1) AS {column_type}) "
+            f'AS "{name}"'
+            for name, column_type in types if name in partitions
+        )
+        connection.execute(
+            f"CREATE TEMP TABLE partitions AS SELECT file_name, sum(rows) AS rows{values} FROM ("
+            "SELECT file_name, row_group_id, any_value(row_group_num_rows) AS rows "
+            "FROM footers GROUP BY ALL) GROUP BY ALL"
+        )
+        recency = "".join(f'"{name}" DESC, ' for name in partitions)
+        files = [file_name for (file_name,) in connection.execute(
+            "SELECT file_name FROM ("
+            f"SELECT file_name, sum(rows) OVER (ORDER BY {recency}file_name "
+            "ROWS UNBOUNDED PRECEDING) - rows AS preceding FROM partitions) "
+            "WHERE preceding < ?",
+            [SCHEMA_SAMPLE_ROWS],
+        ).fetchall()]
+        connection.execute(
+            "CREATE TEMP TABLE sample AS SELECT * FROM "
+            f"read_parquet(?, hive_partitioning = true) LIMIT {SCHEMA_SAMPLE_ROWS}",
+            [files],
+        )
+        return partitions
+
+    def register(self, connection: duckdb.DuckDBPyConnection, table_name: str) -> None:
+        """Make the dataset queryable as `table_name` on the given connection.
+
+        This is a no-op when the current version of the data is already
+        registered on the connection. The rollups of the table, if enabled, are
+        (re)built along with it, except in "duckdb" mode where the ones built
+        with the database are only linked.
+
+        Args:
+            connection: The DuckDB connection.
+            table_name: Name of the table (or view) to create.
+        """
+        self._refresh()
+        with self._register_lock:
+            registered = self._registered.setdefault(connection, {})
+            if registered.get(table_name) == self._version:
+                return
+            self._register_table(connection, table_name)
+            if self.rollups and self.mode == "duckdb":
+                # built once with the database, see `build_sales_database`
+                link_rollups(connection, table_name, f"{table_name}_db", DATABASE_TABLE)
+            elif self.rollups:
+                create_rollups(connection, table_name, materialize=not self.partitioned)
+            registered[table_name] = self._version
+
+    def register_cursor(self, cursor: duckdb.DuckDBPyConnection, table_name: str) -> None:
+        """Make the dataset queryable as `table_name` on a cursor of a connection
+        it's registered on (see `register`).
+
+        The tables, views and attached databases created by `register` are
+        shared by the cursors of the connection, only the Arrow views of the
+        "arrow" mode are local to a connection and registered again here.
+
+        Args:
+            cursor: A cursor of the connection.
+            table_name: Name of the table (or view) given to `register`.
+        """
+        if self.mode != "arrow":
+            return
+        with self._register_lock:
+            registered = self._registered.setdefault(cursor, {})
+            if registered.get(table_name) != self._version:
+                cursor.register(table_name, self._data)
+                registered[table_name] = self._version
+
+    def _register_table(self, connection: duckdb.DuckDBPyConnection, table_name: str) -> None:
+        if self.mode == "copy":
+            df = self._data
+            connection.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
+        elif self.mode == "arrow":
+            connection.register(table_name, self._data)
+        elif self.mode == "parquet":
+            connection.execute(
+                f"CREATE OR REPLACE VIEW {table_name} AS "
+                f"SELECT * FROM {parquet_source(self.path)}"
+            )
+        else:
+            # the database name is also known to `register` for the rollups
+            database = f"{table_name}_db"
+            connection.execute(f"DETACH DATABASE IF EXISTS {database}")
+            connection.execute(f"ATTACH {sql_literal(self.path)} AS {database} (READ_ONLY)")
+            connection.execute(
+                f"CREATE OR REPLACE VIEW {table_name} AS "
+                f"SELECT * FROM {database}.{DATABASE_TABLE}"
+            )
+
+
+_datasets: dict[tuple[str, str, bool], SalesDataset] = {}
+_datasets_lock = threading.Lock()
+
+
+def get_sales_dataset(path: str, mode: str = "arrow", rollups: bool = True) -> SalesDataset:
+    """Return the process-wide dataset handle for `path`, creating it if needed.
+
+    Args:
+        path: Path to the Parquet file.
+        mode: One of `DATA_ACCESS_MODES`.
+        rollups: Whether to build the rollups of the table (see `SalesDataset`).
+    """
+    key = (os.path.abspath(path), mode, rollups)
+    with _datasets_lock:
+        if key not in _datasets:
+            _datasets[key] = SalesDataset(path, mode=mode, rollups=rollups)
+        return _datasets[key]
@@ -0,0 +1,199 @@
+"""Rule-based fast path answering templated questions without the models.
+
+Many questions are plain lookups ("Show me all the sales for store 1320 on
+November 1st, 2021", "sales by SKU in Nov 2021"). For those, the router and
+the text2sql calls only rediscover a query we can write directly. `FastPath`
+matches a question against a few templates and returns the parameterized
+query answering it. A template only matches the *whole* question, so a
+question asking for anything more (a chart, an analysis, a comparison) or
+that doesn't parse falls through to the model.
+
+`FastPath.record` counts the questions answered by the fast path and
+estimates the latency it saved: the mean latency of the runs that went through
+the model, minus the latency of the fast path.
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+# what comes before "sales" in a lookup question ("show me all the sales ...")
+_PREFIX = (
+    r"(?:(?:please|can you|could you)\s+)?"
+    r"(?:show(?:\s+me)?|list|get|fetch|give\s+me|what\s+(?:are|were))?\s*"
+    r"(?:all\s+)?(?:of\s+)?(?:the\s+)?(?:total\s+)?sales"
+)
+_STORE = r"store\s+(?:number\s+|#)?(?P<store>\d+)"
+
+# name -> pattern of the whole question
+TEMPLATES = {
+    "store_day": rf"{_PREFIX}\s+(?:for|of|at|in)\s+{_STORE}\s+on\s+(?P<day>.+)",
+    "store_month": rf"{_PREFIX}\s+(?:for|of|at)\s+{_STORE}\s+(?:in|for|during)\s+(?P<month>.+)",
+    "by_sku": (
+        rf"{_PREFIX}\s+(?:by|per)\s+(?:product\s+)?sku"
+        rf"(?:\s+(?:for|of|at)\s+{_STORE})?(?:\s+(?:in|for|during)\s+(?P<period>.+))?"
+    ),
+    "by_store": rf"{_PREFIX}\s+(?:by|per)\s+store(?:\s+(?:in|for|during)\s+(?P<period>.+))?",
+}
+
+_DAY_FORMATS = ("%B %d %Y", "%b %d %Y", "%d %B %Y", "%d %b %Y", "%Y-%m-%d")
+_MONTH_FORMATS = ("%B %Y", "%b %Y", "%Y-%m")
+
+
+@dataclass
+class FastPathQuery:
+    """The query answering a templated question."""
+
+    template: str
+    sql: str
+    params: list = field(default_factory=list)
+    # what the result holds, leads the answer
+    description: str = ""
+
+
+def _parse(text: str, formats: tuple[str, ...]) -> date | None:
+    # "November 1st, 2021" -> "November 1 2021"
+    text = re.sub(r"(\d)(?:st|nd|rd|th)\b", r"\1", text.replace(",", " "))
+    text = " ".join(text.split())
+    for fmt in formats:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_day(text: str) -> date | None:
+    """The day of "November 1st, 2021", "1 Nov 2021", "2021-11-01", ..."""
+    return _parse(text, _DAY_FORMATS)
+
+
+def parse_period(text: str) -> tuple[date, date, str] | None:
+    """The first day, the day after the last and the name of a month
+    ("November 2021", "Nov 2021", "2021-11") or a year ("2021")."""
+    text = re.sub(r"^(?:the\s+)?(?:month\s+of\s+|year\s+)?", "", text.strip(), flags=re.I)
+    if re.fullmatch(r"20\d\d", text):
+        year = int(text)
+        return date(year, 1, 1), date(year + 1, 1, 1), text
+    start = _parse(text, _MONTH_FORMATS)
+    if start is None:
+        return None
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end, start.strftime("%B %Y")
+
+
+class FastPath:
+    """Matches questions against `TEMPLATES` and keeps the statistics of the runs.
+
+    Args:
+        table_name: Name of the sales table.
+        rollups: Whether the rollups of `common/rollups.py` exist next to the
+            table, the aggregations by store then scan the daily rollup.
+    """
+
+    def __init__(self, table_name: str = "sales", rollups: bool = False):
+        self.table_name = table_name
+        self.rollups = rollups
+        self.questions = 0
+        self.hits = 0
+        self.saved = 0.0
+        self._model_runs = 0
+        self._model_latency = 0.0
+        self._patterns = {
+            name: re.compile(pattern, re.IGNORECASE) for name, pattern in TEMPLATES.items()
+        }
+        self._lock = threading.Lock()
+
+    def match(self, question: str) -> FastPathQuery | None:
+        """The query answering `question`, `None` if no template matches it entirely."""
+        question = " ".join(question.split()).rstrip("?.! ")
+        for name, pattern in self._patterns.items():
+            match = pattern.fullmatch(question)
+            if match:
+                return getattr(self, f"_{name}")(**match.groupdict())
+        return None
+
+    def _store_day(self, store: str, day: str) -> FastPathQuery | None:
+        day = parse_day(day)
+        if day is None:
+            return None
+        return FastPathQuery(
+            "store_day",
+            f"SELECT * FROM {self.table_name} WHERE Store_Number = ? AND Sold_Date = ?",
+            [int(store), day],
+            f"Sales of store {store} on {day:%B} {day.day}, {day.year}",
+        )
+
+    def _store_month(self, store: str, month: str) -> FastPathQuery | None:
+        period = parse_period(month)
+        if period is None or period[2].isdigit():
+            # a whole year of transactions is too large to be an answer
+            return None
+        start, end, name = period
+        return FastPathQuery(
+            "store_month",
+            f"SELECT * FROM {self.table_name} WHERE Store_Number = ? "
+            "AND Sold_Date >= ? AND Sold_Date < ? ORDER BY Sold_Date",
+            [int(store), start, end],
+            f"Sales of store {store} in {name}",
+        )
+
+    def _aggregate(
+        self, template: str, key: str, table_name: str, store: str | None, period: str | None
+    ) -> FastPathQuery | None:
+        filters, params, scope = [], [], ""
+        if store is not None:
+            filters.append("Store_Number = ?")
+            params.append(int(store))
+            scope += f" of store {store}"
+        if period is not None:
+            parsed = parse_period(period)
+            if parsed is None:
+                return None
+            filters.append("Sold_Date >= ? AND Sold_Date < ?")
+            params += parsed[:2]
+            scope += f" in {parsed[2]}"
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+        return FastPathQuery(
+            template,
+            f"SELECT {key}, SUM(Total_Sale_Value) AS Total_Sales, SUM(Qty_Sold) AS Total_Qty "
+            f"FROM {table_name}{where} GROUP BY {key} ORDER BY Total_Sales DESC",
+            params,
+            f"Sales by {'SKU' if key == 'SKU_Coded' else 'store'}{scope}",
+        )
+
+    def _by_sku(self, store: str | None, period: str | None) -> FastPathQuery | None:
+        return self._aggregate("by_sku", "SKU_Coded", self.table_name, store, period)
+
+    def _by_store(self, period: str | None) -> FastPathQuery | None:
+        # the daily rollup has the same Store_Number, Sold_Date and sums columns
+        table_name = f"{self.table_name}_daily_store" if self.rollups else self.table_name
+        return self._aggregate("by_store", "Store_Number", table_name, None, period)
+
+    def record(self, query: FastPathQuery | None, elapsed: float) -> dict:
+        """Count a run and return the fast path's attributes of its span.
+
+        Args:
+            query: The query of the fast path, `None` if the run went through
+                the model.
+            elapsed: Seconds the run took.
+        """
+        with self._lock:
+            self.questions += 1
+            saved = 0.0
+            if query is None:
+                self._model_runs += 1
+                self._model_latency += elapsed
+            else:
+                self.hits += 1
+                if self._model_runs:
+                    saved = max(self._model_latency / self._model_runs - elapsed, 0.0)
+                    self.saved += saved
+            return {
+                "fast_path.hit": query is not None,
+                "fast_path.template": query.template if query is not None else "",
+                "fast_path.hit_rate": round(self.hits / self.questions, 4),
+                "fast_path.latency_saved_ms": round(saved * 1000, 2),
+                "fast_path.total_latency_saved_ms": round(self.saved * 1000, 2),
+            }
@@ -0,0 +1,163 @@
+"""Resource guards for the LLM-generated SQL.
+
+The generated SQL is executed verbatim, so an accidental cross join or an
+unbounded `SELECT *` can pin a core and allocate gigabytes. A `QueryGuard`:
+
+- caps the memory and the threads DuckDB may use. These are settings of the
+  database, so they apply to all the queries of a `CursorPool`;
+- looks at the estimated cardinalities of the query plan (`EXPLAIN`) and
+  rejects the query when an operator would process too many rows, with a
+  hint the model can use to write a cheaper query;
+- wraps the query in a `LIMIT` when it would return too many rows.
+"""
+
+import json
+import math
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import duckdb
+from opentelemetry import trace
+
+from common.dataset import SalesDataset
+
+
+class QueryRejected(Exception):
+    """Raised when the plan of a query exceeds the guard's limits. The message
+    is meant to be sent back to the model."""
+
+
+@dataclass
+class QueryGuard:
+    """Limits applied to the generated SQL.
+
+    Args:
+        memory_limit: DuckDB `memory_limit` (e.g. "1GB"), empty to keep DuckDB's.
+        threads: DuckDB `threads`, 0 to keep DuckDB's.
+        max_rows: Results estimated to have more rows are truncated to this many.
+        max_estimated_rows: Queries with an operator estimated to process more
+            rows are rejected.
+    """
+
+    memory_limit: str = "1GB"
+    threads: int = 0
+    max_rows: int = 10_000
+    max_estimated_rows: int = 50_000_000
+
+    @classmethod
+    def from_env(cls) -> "QueryGuard":
+        return cls(
+            memory_limit=os.getenv("SQL_GUARD_MEMORY_LIMIT", cls.memory_limit),
+            threads=int(os.getenv("SQL_GUARD_THREADS", cls.threads)),
+            max_rows=int(os.getenv("SQL_GUARD_MAX_ROWS", cls.max_rows)),
+            max_estimated_rows=int(
+                os.getenv("SQL_GUARD_MAX_ESTIMATED_ROWS", cls.max_estimated_rows)
+            ),
+        )
+
+    def configure(self, connection: duckdb.DuckDBPyConnection) -> None:
+        """Apply the memory and thread limits to the database of `connection`."""
+        if self.memory_limit:
+            connection.execute(f"SET memory_limit = '{self.memory_limit}'")
+        if self.threads:
+            connection.execute(f"SET threads = {self.threads}")
+
+    def prepare(
+        self,
+        cursor: duckdb.DuckDBPyConnection,
+        sql: str,
+        dataset: SalesDataset | None = None,
+        params: Sequence | None = None,
+    ) -> str:
+        """Check the plan of `sql` and return the query to run.
+
+        The estimates are recorded on the current span.
+
+        Args:
+            cursor: The cursor the query will run on.
+            sql: The query.
+            dataset: The dataset the query runs on. DuckDB only keeps statistics
+                for its own tables, so the size of the Arrow table and the
+                distinct values of the columns complete its estimates.
+            params: The values of the query's `?` placeholders.
+
+        Raises:
+            QueryRejected: When an operator of the plan exceeds `max_estimated_rows`.
+        """
+        sql = sql.strip().rstrip(";")
+        scan_rows, distinct = None, {}
+        if dataset is not None:
+            if dataset.mode == "arrow":
+                scan_rows = len(dataset.data)
+            distinct = {column.name: column.distinct for column in dataset.schema}
+        rows, peak = 0, 0
+        for node in json.loads(cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params).fetchall()[0][1]):
+            node_rows, node_peak, _ = self._estimate(node, scan_rows, distinct)
+            rows, peak = max(rows, node_rows), max(peak, node_peak)
+        limited = rows > self.max_rows
+        trace.get_current_span().set_attributes(
+            {
+                "query_guard.estimated_rows": rows,
+                "query_guard.peak_estimated_rows": peak,
+                "query_guard.limit_injected": limited,
+            }
+        )
+        if peak > self.max_estimated_rows:
+            raise QueryRejected(
+                f"The query was rejected: its plan processes about {peak:,} rows (the limit "
+                f"is {self.max_estimated_rows:,}). Avoid cross joins and joins on non-unique "
+                "columns, filter or aggregate the data, or use the pre-aggregated tables."
+            )
+        if limited:
+            # on their own lines, so a trailing `--` comment doesn't swallow them
+            return f"SELECT * FROM (\n{sql}\n) LIMIT {self.max_rows}"
+        return sql
+
+    def _estimate(
+        self, node: dict, scan_rows: int | None, distinct: dict[str, int]
+    ) -> tuple[int, int, bool]:
+        """Estimated output rows of a plan node, the largest estimate of its
+        subtree and whether the subtree scans an Arrow table."""
+        children = [self._estimate(child, scan_rows, distinct) for child in node.get("children", [])]
+        child_rows = [rows for rows, _, _ in children]
+        arrow = any(arrow for _, _, arrow in children)
+        info = node.get("extra_info", {})
+        reported = info.get("Estimated Cardinality")
+        name = node["name"].strip()
+        if name == "ARROW_SCAN":
+            arrow = True
+            rows = scan_rows or int(reported or 0)
+        elif name == "CROSS_PRODUCT":
+            rows = math.prod(child_rows)
+        elif name.endswith("LIMIT"):
+            # the plan doesn't tell the value of the LIMIT (it may be larger
+            # than `max_rows`, or a parameter), so its input is the bound
+            rows = max(child_rows + [0])
+        elif name == "UNGROUPED_AGGREGATE":
+            rows = 1
+        elif name == "TOP_N":
+            rows = min(child_rows + [int(info["Top"])])
+        elif reported and not arrow:
+            rows = int(reported)
+        else:
+            # operators without an estimate (ORDER_BY, ...) pass their input
+            # on, and DuckDB's estimates above an Arrow scan start from its
+            # cardinality of 1, so the input is the better bound
+            rows = max(child_rows + [int(reported or 0)])
+        if name.endswith("_JOIN") and len(child_rows) == 2:
+            # without column statistics (Parquet, Arrow) DuckDB estimates a
+            # join as its largest input, even when the keys aren't unique
+            conditions = info.get("Conditions", [])
+            if isinstance(conditions, str):
+                conditions = [conditions]
+            keys = [
+                distinct[column]
+                for condition in conditions
+                for column in re.findall(r"\w+", condition)
+                if column in distinct
+            ]
+            if keys:
+                rows = max(rows, math.prod(child_rows) // max(keys))
+        return rows, max([rows] + [peak for _, peak, _ in children]), arrow
@@ -0,0 +1,71 @@
+# /// script
+# dependencies = [
+#   "duckdb==1.1.3",
+#   "pandas",
+#   "pyarrow",
+# ]
+# ///
+
+"""Rewrite the sales Parquet file clustered by store and date.
+
+The rows are sorted by store and date and written in small row groups, each
+with min/max statistics, so DuckDB skips most of the row groups of a query
+filtering on a store or a date range. Point the labs at the sorted file with
+`SALES_DATA_PATH`.
+
+With `--partitioned` the file is instead rewritten as a hive-partitioned
+directory (`Sold_Year=.../Sold_Month=.../Store_Number=.../*.parquet`), the
+layout of the production sales history. It's scanned lazily by the "parquet"
+data access mode (`SALES_DATA_PATH=<directory> DATA_ACCESS_MODE=parquet`).
+
+Usage (from the repository root):
+
+    uv run common/prepare_parquet.py [PARQUET_FILE] [--output SORTED_FILE] [--row-group-size N]
+    uv run common/prepare_parquet.py [PARQUET_FILE] --partitioned [--output DIRECTORY]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+# make the `common` package importable when running `uv run common/prepare_parquet.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.dataset import (  # noqa: E402
+    SORTED_ROW_GROUP_SIZE,
+    build_partitioned_parquet,
+    build_sorted_parquet,
+)
+
+TRANSACTION_DATA_FILE_PATH = (
+    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default=TRANSACTION_DATA_FILE_PATH)
+    parser.add_argument("--output", help="sorted file path (default: PARQUET_FILE with a .sorted.parquet extension)")
+    parser.add_argument("--row-group-size", type=int, default=SORTED_ROW_GROUP_SIZE)
+    parser.add_argument("--partitioned", action="store_true", help="write a partitioned directory instead")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.partitioned:
+        output = build_partitioned_parquet(args.path, output=args.output)
+        files = sum(len(names) for _, _, names in os.walk(output))
+        print(f"built {output} ({files} files) in {time.perf_counter() - start:.2f}s")
+        print(f"use it with: SALES_DATA_PATH={output} DATA_ACCESS_MODE=parquet")
+        return
+    output = build_sorted_parquet(args.path, output=args.output, row_group_size=args.row_group_size)
+    row_groups = pq.ParquetFile(output).metadata.num_row_groups
+    print(f"built {output} ({row_groups} row groups) in {time.perf_counter() - start:.2f}s")
+    print(f"use it with: SALES_DATA_PATH={output}")
+
+
+if __name__ == "__main__":
+    main()
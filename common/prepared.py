@@ -0,0 +1,171 @@
+"""Prepared statements for parameterized queries.
+
+DuckDB parses, binds and plans every query it runs, and the guard of
+`common/guards.py` plans it once more (`EXPLAIN`). When the SQL is a template
+with `?` placeholders plus their values, queries of the same shape differ only
+in their values. `PreparedStatements` prepares a template once per cursor
+(`PREPARE`), with the guard's checks, and runs the next queries of the same
+shape with `EXECUTE`, which skips the parsing, the planning and the guard.
+
+The guard's verdict on a template (rejected, or wrapped in a `LIMIT`) is taken
+with the values of its first query and reused for the other values. DuckDB's
+estimates come from the shape of the plan and the size of the tables, the
+values of a filter barely change them.
+
+Prepared statements are local to a DuckDB connection, so every cursor keeps
+its own, the least recently used ones are deallocated beyond
+`max_statements`. `EXECUTE` doesn't take `?` parameters: the values are
+rendered as SQL literals (see `sql_literal`).
+"""
+
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from datetime import date, datetime
+from decimal import Decimal
+
+import duckdb
+from opentelemetry import trace
+
+from common.cache import normalize_sql
+
+
+def sql_literal(value: object) -> str:
+    """`value` as a SQL literal.
+
+    Raises:
+        TypeError: For the types that have no literal here.
+        ValueError: For the floats that aren't finite.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, Decimal)):
+        return str(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"Unsupported parameter value {value!r}")
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    raise TypeError(f"Unsupported parameter type {type(value).__name__}")
+
+
+# double-quoted identifiers, string and numeric literals, words, the rest
+_TOKENS = re.compile(
+    r"""(?P<identifier>"(?:[^"]|"")*")|(?P<string>'(?:[^']|'')*')"""
+    r"""|(?P<number>\d+(?:\.\d+)?(?![\w.]))|(?P<word>\w+)|(?P<space>\s+)|(?P<other><>|!=|<=|>=|.)""",
+    re.DOTALL,
+)
+_COMPARISONS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+
+
+def parameterize(sql: str) -> tuple[str, list]:
+    """Replace the literal values of `sql` by `?` placeholders.
+
+    Only the literals compared to something (`=`, `<`, ..., `BETWEEN`, `IN`
+    lists) are values: the other ones (`LIMIT 10`, `ORDER BY 1`, the
+    arguments of functions, typed literals such as `DATE '2021-11-01'`) are
+    part of the shape of the query and kept.
+
+    Returns:
+        The template and the values of its placeholders, in order.
+    """
+    tokens = [(m.lastgroup, m.group()) for m in _TOKENS.finditer(sql)]
+    parts, params = [], []
+    previous = ""  # the previous significant token, uppercased
+    in_list = between = False
+    for kind, text in tokens:
+        if kind in ("string", "number") and (
+            previous in _COMPARISONS or previous == "BETWEEN" or (previous == "AND" and between)
+            or (in_list and previous in ("(", ","))
+        ):
+            between = previous == "BETWEEN"
+            params.append(text[1:-1].replace("''", "'") if kind == "string" else _number(text))
+            parts.append("?")
+        else:
+            parts.append(text)
+            if kind == "other" and text == ")":
+                in_list = False
+            elif kind == "other" and text == "(" and previous == "IN":
+                in_list = True
+        if kind != "space":
+            previous = text.upper()
+    return "".join(parts), params
+
+
+def _number(text: str) -> int | float:
+    return float(text) if "." in text else int(text)
+
+
+class PreparedStatements:
+    """The statements prepared on the cursors of a `CursorPool`, by template.
+
+    Args:
+        max_statements: Number of statements kept per cursor.
+    """
+
+    def __init__(self, max_statements: int = 64):
+        self.max_statements = max_statements
+        self.hits = 0
+        self.misses = 0
+        self._statements: dict[duckdb.DuckDBPyConnection, OrderedDict[str, None]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def name(sql: str) -> str:
+        """Name of the statement of a template, shared by its equivalent spellings."""
+        return "prepared_" + hashlib.sha256(normalize_sql(sql).encode()).hexdigest()[:16]
+
+    def execute(
+        self,
+        cursor: duckdb.DuckDBPyConnection,
+        sql: str,
+        params: Sequence | None,
+        check: Callable[[str], str] | None = None,
+    ) -> duckdb.DuckDBPyConnection:
+        """Run the template `sql` with the values `params` on `cursor`, preparing
+        it first if it's not prepared on the cursor yet.
+
+        Whether the statement was prepared already is recorded on the current span.
+
+        Args:
+            cursor: The cursor, used by a single thread at a time.
+            sql: The query, with a `?` placeholder for every value.
+            params: The values of the placeholders.
+            check: Called with the template before it's prepared, returns the
+                query to prepare (e.g. `QueryGuard.prepare`).
+        """
+        name = self.name(sql)
+        with self._lock:
+            statements = self._statements.setdefault(cursor, OrderedDict())
+            hit = name in statements
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        trace.get_current_span().set_attribute("prepared_statement.hit", hit)
+        if hit:
+            statements.move_to_end(name)
+        else:
+            sql = check(sql) if check is not None else sql.strip().rstrip(";")
+            cursor.execute(f"PREPARE {name} AS {sql}")
+            statements[name] = None
+            while len(statements) > self.max_statements:
+                evicted, _ = statements.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {evicted}")
+        values = ", ".join(sql_literal(value) for value in params or ())
+        return cursor.execute(f"EXECUTE {name}({values})" if values else f"EXECUTE {name}")
+
+    def forget(self, cursor: duckdb.DuckDBPyConnection) -> None:
+        """Drop the statements of a cursor that's closed."""
+        with self._lock:
+            self._statements.pop(cursor, None)
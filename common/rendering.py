@@ -0,0 +1,148 @@
+"""Compact, bounded rendering of query results for the downstream prompts.
+
+The output of `lookup_sales_data` ends up verbatim in the analysis and chart
+prompts, so a broad query rendered with `DataFrame.to_string()` can add
+megabytes of text to each of them. `render_result` keeps small results whole
+(as CSV or Markdown) and replaces large ones with a head sample plus a summary
+of every column, within a row and token budget. `parse_result` reads the rows
+of a rendered result back.
+"""
+
+import csv
+import io
+import math
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+RESULT_FORMATS = ("csv", "markdown")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text` (~4 characters per token for English/tabular text)."""
+    return math.ceil(len(text) / 4)
+
+
+def estimate_to_string_tokens(df: pd.DataFrame, sample_rows: int = 100) -> int:
+    """Estimate the tokens of `df.to_string()` without rendering the whole frame."""
+    if len(df) <= sample_rows:
+        return estimate_tokens(df.to_string())
+    sample = df.head(sample_rows).to_string()
+    return math.ceil(estimate_tokens(sample) * len(df) / sample_rows)
+
+
+@dataclass
+class RenderedResult:
+    text: str
+    rows: int
+    rows_shown: int
+    tokens: int
+    tokens_saved: int
+
+    @property
+    def truncated(self) -> bool:
+        return self.rows_shown < self.rows
+
+    def span_attributes(self, prefix: str = "result_rendering") -> dict:
+        return {
+            f"{prefix}.rows": self.rows,
+            f"{prefix}.rows_shown": self.rows_shown,
+            f"{prefix}.truncated": self.truncated,
+            f"{prefix}.tokens": self.tokens,
+            f"{prefix}.tokens_saved": self.tokens_saved,
+        }
+
+
+def _to_text(df: pd.DataFrame, fmt: str) -> str:
+    if fmt == "csv":
+        return df.to_csv(index=False).strip()
+    header = "| " + " | ".join(map(str, df.columns)) + " |"
+    separator = "|" + "---|" * len(df.columns)
+    rows = ("| " + " | ".join(row) + " |" for row in df.astype(str).itertuples(index=False))
+    return "\n".join([header, separator, *rows])
+
+
+def summarize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """min/max/mean/distinct count of every column of `df`."""
+    summary = []
+    for column in df.columns:
+        values = df[column]
+        numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+        summary.append(
+            {
+                "column": column,
+                "dtype": str(values.dtype),
+                "min": values.min() if numeric or values.notna().any() else None,
+                "max": values.max() if numeric or values.notna().any() else None,
+                "mean": round(float(values.mean()), 4) if numeric else None,
+                "distinct": int(values.nunique()),
+            }
+        )
+    return pd.DataFrame(summary)
+
+
+def render_result(
+    df: pd.DataFrame, max_rows: int = 50, max_tokens: int = 2000, fmt: str = "csv"
+) -> RenderedResult:
+    """Render a query result within a row and token budget.
+
+    Args:
+        df: The query result.
+        max_rows: Maximum number of rows rendered verbatim.
+        max_tokens: Token budget of the rendered text.
+        fmt: One of `RESULT_FORMATS`.
+    """
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format {fmt!r}, expected one of {RESULT_FORMATS}")
+    baseline_tokens = estimate_to_string_tokens(df)
+
+    if len(df) <= max_rows:
+        text = _to_text(df, fmt)
+        if estimate_tokens(text) <= max_tokens:
+            tokens = estimate_tokens(text)
+            return RenderedResult(text, len(df), len(df), tokens, max(baseline_tokens - tokens, 0))
+
+    try:
+        summary = _to_text(summarize_columns(df), fmt)
+    except TypeError:  # columns whose values can't be compared (e.g. mixed types)
+        summary = ""
+    rows_shown = min(max_rows, len(df))
+    while True:
+        head = _to_text(df.head(rows_shown), fmt)
+        text = (
+            f"The result has {len(df)} rows and {len(df.columns)} columns, "
+            f"the first {rows_shown} rows are:\n{head}"
+        )
+        if summary:
+            text += f"\n\nSummary of every column:\n{summary}"
+        if rows_shown == 0 or estimate_tokens(text) <= max_tokens:
+            break
+        rows_shown //= 2
+    tokens = estimate_tokens(text)
+    return RenderedResult(text, len(df), rows_shown, tokens, max(baseline_tokens - tokens, 0))
+
+
+def parse_result(text: str) -> pd.DataFrame | None:
+    """The rows of a result rendered by `render_result` (the head sample of a
+    truncated result), `None` if `text` doesn't hold a table."""
+    lines = text.strip().splitlines()
+    if lines and lines[0].startswith("The result has "):
+        lines = lines[1:]
+    if "" in lines:
+        lines = lines[: lines.index("")]
+    if len(lines) < 2:
+        return None
+    if lines[0].startswith("|"):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [cell.strip() for cell in line.strip().strip("|").split("|")]
+            for line in lines
+            if not set(line.strip()) <= set("|-")
+        )
+        lines = buffer.getvalue().splitlines()
+    try:
+        df = pd.read_csv(io.StringIO("\n".join(lines)))
+    except (pd.errors.ParserError, pd.errors.EmptyDataError):
+        return None
+    return df if len(df) and len(df.columns) > 1 else None
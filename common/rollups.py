@@ -0,0 +1,137 @@
+"""Pre-aggregated rollups of the sales table.
+
+Most questions (sales by store for a month, best stores of a year, sales by
+SKU, ...) aggregate the whole transaction table. The rollups below are built
+next to the sales table when it's registered on a connection, and advertised
+in the text2sql prompt so the generated queries can scan them instead.
+
+Every rollup keeps the names of the sales columns it's grouped by and sums
+`Qty_Sold` and `Total_Sale_Value` under the same names, so summing them again
+over any subset of the rows gives the same result as on the sales table.
+"""
+
+from dataclasses import dataclass
+
+import duckdb
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """A rollup of the sales table grouped by `keys`.
+
+    Args:
+        suffix: The rollup is named `<sales table name>_<suffix>`.
+        keys: SQL expressions of the grouping columns, as `(name, expression)`.
+        description: What one row of the rollup holds.
+    """
+
+    suffix: str
+    keys: tuple[tuple[str, str], ...]
+    description: str
+
+    def name(self, table_name: str) -> str:
+        return f"{table_name}_{self.suffix}"
+
+    @property
+    def columns(self) -> list[str]:
+        return [name for name, _ in self.keys] + list(MEASURES)
+
+    def sql(self, table_name: str) -> str:
+        keys = ", ".join(f"{expression} AS {name}" for name, expression in self.keys)
+        measures = ", ".join(f"{expression} AS {name}" for name, expression in MEASURES.items())
+        return (
+            f"SELECT {keys}, {measures} FROM {table_name} "
+            f"GROUP BY ALL ORDER BY ALL"
+        )
+
+
+# aggregated columns of every rollup
+MEASURES = {
+    "Qty_Sold": "SUM(Qty_Sold)",
+    "Total_Sale_Value": "SUM(Total_Sale_Value)",
+    "Transaction_Count": "COUNT(*)",
+}
+
+ROLLUPS = (
+    Rollup(
+        "daily_store",
+        (("Store_Number", "Store_Number"), ("Sold_Date", "Sold_Date")),
+        "totals per store and day",
+    ),
+    Rollup(
+        "monthly_store",
+        (("Store_Number", "Store_Number"), ("Month", "CAST(date_trunc('month', Sold_Date) AS DATE)")),
+        "totals per store and month, Month is the first day of the month",
+    ),
+    Rollup(
+        "sku",
+        (("SKU_Coded", "SKU_Coded"),),
+        "totals per SKU over the whole period",
+    ),
+    Rollup(
+        "store_sku",
+        (("Store_Number", "Store_Number"), ("SKU_Coded", "SKU_Coded")),
+        "totals per store and SKU over the whole period",
+    ),
+)
+
+
+def create_rollups(
+    connection: duckdb.DuckDBPyConnection, table_name: str, materialize: bool = True
+) -> None:
+    """(Re)create the rollups of `table_name` on the given connection.
+
+    Args:
+        connection: The DuckDB connection the sales table is registered on.
+        table_name: Name of the sales table.
+        materialize: Whether to create tables, or views aggregating the sales
+            table on every query (e.g. for data that doesn't fit in memory).
+    """
+    kind = "TABLE" if materialize else "VIEW"
+    for rollup in ROLLUPS:
+        connection.execute(
+            f"CREATE OR REPLACE {kind} {rollup.name(table_name)} AS {rollup.sql(table_name)}"
+        )
+
+
+def link_rollups(
+    connection: duckdb.DuckDBPyConnection, table_name: str, database: str, source_table: str
+) -> None:
+    """Expose the rollups built in an attached database as views named after `table_name`.
+
+    Nothing is aggregated: a database built by `build_sales_database` already
+    holds the rollups of its `source_table`. The ones it lacks (a database
+    built without them) are views aggregating `table_name` on every query.
+
+    Args:
+        connection: The DuckDB connection the database is attached to.
+        table_name: Name of the sales table (or view) on the connection.
+        database: Name of the attached database.
+        source_table: Name of the sales table in the attached database.
+    """
+    built = {
+        name for (name,) in connection.execute(
+            "SELECT table_name FROM duckdb_tables() WHERE database_name = ?", [database]
+        ).fetchall()
+    }
+    for rollup in ROLLUPS:
+        source = rollup.name(source_table)
+        sql = (
+            f"SELECT * FROM {database}.{source}" if source in built
+            else rollup.sql(table_name)
+        )
+        connection.execute(f"CREATE OR REPLACE VIEW {rollup.name(table_name)} AS {sql}")
+
+
+def describe_rollups(table_name: str) -> str:
+    """Description of the rollups of `table_name` for the text2sql prompt."""
+    lines = [
+        "Pre-aggregated tables, much smaller than the table. Prefer them when the "
+        "question doesn't need individual transactions (sum their Qty_Sold and "
+        "Total_Sale_Value columns to aggregate further):"
+    ]
+    for rollup in ROLLUPS:
+        lines.append(
+            f"- {rollup.name(table_name)}({', '.join(rollup.columns)}): {rollup.description}"
+        )
+    return "\n".join(lines)
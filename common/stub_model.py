@@ -0,0 +1,504 @@
+"""Deterministic local stand-in for the LLMs used by the labs.
+
+The stub replays a scripted behavior instead of calling a provider, so the
+tool pipeline, DuckDB and the tracing overhead can be load-tested offline:
+
+- the router always looks the data up first, then asks for an analysis and/or
+  a visualization depending on the question, and finally answers;
+- the SQL (with literal values, or as a template plus its values when the
+  response format asks for `params`), the analyses, the chart configurations
+  and the chart code (alone or together, in the fused visualization mode) are
+  derived from the prompt with simple rules (see `StubScript`).
+
+Every call sleeps for a latency drawn from a configurable distribution (see
+`Latency`), per kind of call. Two backends share the script:
+
+- `stub_function_model()`: a pydantic-ai `FunctionModel` (lab_1);
+- `stub_openai_client()`: a real `AsyncOpenAI` client whose HTTP transport is
+  answered locally (lab_2), so `logfire.instrument_openai` keeps working.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import httpx
+
+from common.prepared import parameterize
+
+
+# -------
+# Latency
+# -------
+
+
+@dataclass
+class Latency:
+    """Distribution of the latency of a stubbed call, in seconds.
+
+    Args:
+        kind: "fixed" (always `a`), "uniform" (between `a` and `b`) or
+            "lognormal" (median `a`, shape `b`).
+        a: First parameter of the distribution.
+        b: Second parameter of the distribution.
+    """
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        """Parse a "kind:a[:b]" spec, e.g. "fixed:0.2" or "lognormal:0.8:0.3"."""
+        kind, *params = spec.split(":")
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution {kind!r}")
+        params = [float(p) for p in params] + [0.0, 0.0]
+        return cls(kind, params[0], params[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return math.exp(rng.gauss(math.log(self.a), self.b)) if self.a > 0 else 0.0
+        return self.a
+
+
+# the kinds of calls made by the labs
+CALL_KINDS = ("router", "sql", "analysis", "chart_config", "chart_code", "chart")
+
+DEFAULT_LATENCIES = {
+    "router": Latency("lognormal", 0.6, 0.3),
+    "sql": Latency("lognormal", 0.5, 0.3),
+    "analysis": Latency("lognormal", 1.5, 0.4),
+    "chart_config": Latency("lognormal", 0.7, 0.3),
+    "chart_code": Latency("lognormal", 2.0, 0.4),
+    # configuration and code in one call: the output of both, a single prompt
+    "chart": Latency("lognormal", 2.2, 0.4),
+}
+
+
+def latencies_from_env() -> dict[str, Latency]:
+    """Latencies per kind of call: STUB_LATENCY overrides every kind, and
+    STUB_LATENCY_<KIND> (e.g. STUB_LATENCY_SQL) a single one."""
+    latencies = dict(DEFAULT_LATENCIES)
+    if os.getenv("STUB_LATENCY"):
+        latencies = {kind: Latency.parse(os.environ["STUB_LATENCY"]) for kind in CALL_KINDS}
+    for kind in CALL_KINDS:
+        spec = os.getenv(f"STUB_LATENCY_{kind.upper()}")
+        if spec:
+            latencies[kind] = Latency.parse(spec)
+    return latencies
+
+
+# ------
+# Script
+# ------
+
+_MONTHS = {
+    name: i
+    for i, name in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"],
+        start=1,
+    )
+}
+_MONTH_PATTERN = "|".join(list(_MONTHS) + [m[:3] for m in _MONTHS])
+
+
+def _month_number(name: str) -> int:
+    name = name.lower()
+    return _MONTHS.get(name) or next(i for m, i in _MONTHS.items() if m.startswith(name))
+
+
+def _extract(pattern: str, text: str) -> str | None:
+    match = re.search(pattern, text, flags=re.IGNORECASE | re.DOTALL)
+    return match.group(1).strip() if match else None
+
+
+def _table(data: str) -> list[str]:
+    """Header and rows of the table in a `lookup_sales_data` output (CSV or Markdown),
+    skipping the prose lines of truncated results."""
+    lines = [line.strip() for line in data.strip().splitlines()]
+    for i, line in enumerate(lines):
+        if re.fullmatch(r"[\w\s|,.'-]+", line) and ("," in line or "|" in line):
+            table = []
+            for row in lines[i:]:
+                if not row:
+                    break
+                if not set(row) <= set("|-"):
+                    table.append(row)
+            return table
+    return []
+
+
+def _tables(prompt: str) -> list[str]:
+    """Names of the pre-aggregated tables listed in a SQL generation prompt."""
+    return re.findall(r"^\s*- (\w+)\(", prompt, flags=re.MULTILINE)
+
+
+class StubScript:
+    """The scripted behavior of the stub, independent of the backend."""
+
+    def wants_analysis(self, question: str) -> bool:
+        return bool(re.search(r"trend|analy|insight|why|best|top|compare", question, re.I))
+
+    def wants_visualization(self, question: str) -> bool:
+        return bool(re.search(r"chart|graph|plot|visuali", question, re.I))
+
+    def sql(self, question: str, table_name: str = "sales", tables: Iterable[str] = ()) -> str:
+        """SQL answering `question`, built from the store, date, month and year it mentions.
+
+        Aggregations use the rollups of `common/rollups.py` listed in `tables`
+        when they can answer them.
+        """
+        filters = []
+        store = _extract(r"store\s+(?:number\s+)?(\d+)", question)
+        if store:
+            filters.append(f"Store_Number = {store}")
+        sku = _extract(r"sku\s+(\d+)", question)
+        if sku:
+            filters.append(f"SKU_Coded = {sku}")
+
+        day = re.search(rf"({_MONTH_PATTERN})\w*\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})", question, re.I)
+        month = re.search(rf"({_MONTH_PATTERN})\w*\s+(\d{{4}})", question, re.I)
+        year = _extract(r"\b(20\d\d)\b", question)
+        if day:
+            date = f"{day.group(3)}-{_month_number(day.group(1)):02d}-{int(day.group(2)):02d}"
+            filters.append(f"Sold_Date = '{date}'")
+        elif month:
+            filters.append(
+                f"YEAR(Sold_Date) = {month.group(2)} AND MONTH(Sold_Date) = {_month_number(month.group(1))}"
+            )
+        elif year:
+            filters.append(f"YEAR(Sold_Date) = {year}")
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+
+        if re.search(r"by (product )?sku|per sku", question, re.I):
+            group = "SKU_Coded"
+        elif re.search(r"by store|per store|stores", question, re.I):
+            group = "Store_Number"
+        elif re.search(r"trend|by day|daily|over time", question, re.I):
+            group = "Sold_Date"
+        else:
+            group = None
+
+        if group is None:
+            return f"SELECT * FROM {table_name}{where}"
+        tables = set(tables)
+        if group in ("Store_Number", "Sold_Date") and not sku and f"{table_name}_daily_store" in tables:
+            table_name = f"{table_name}_daily_store"
+        elif group == "SKU_Coded" and not (day or month or year):
+            rollup = f"{table_name}_store_sku" if store else f"{table_name}_sku"
+            table_name = rollup if rollup in tables else table_name
+        order = "Sold_Date" if group == "Sold_Date" else "Total_Sales DESC"
+        return (
+            f"SELECT {group}, SUM(Total_Sale_Value) AS Total_Sales, SUM(Qty_Sold) AS Total_Qty "
+            f"FROM {table_name}{where} GROUP BY {group} ORDER BY {order}"
+        )
+
+    def parameterized_sql(
+        self, question: str, table_name: str = "sales", tables: Iterable[str] = ()
+    ) -> dict:
+        """`sql` as a template with `?` placeholders, plus the values of the placeholders."""
+        sql, params = parameterize(self.sql(question, table_name, tables))
+        return {"sql": sql, "params": params}
+
+    def analysis(self, question: str, data: str) -> str:
+        table = _table(data)
+        return (
+            f"Regarding '{question}': the sample has {max(len(table) - 1, 0)} rows. "
+            f"The first row is {table[1] if len(table) > 1 else 'missing'}, "
+            "sales are concentrated in a few entries and the rest follow a long tail."
+        )
+
+    def chart_config(self, goal: str, data: str) -> dict:
+        table = _table(data)
+        columns = [c.strip() for c in re.split(r"[,|]", table[0]) if c.strip()] if table else []
+        if not columns:
+            columns = ["x", "y"]
+        chart_type = "line" if re.search(r"trend|line|over time", goal, re.I) else "bar"
+        return {
+            "chart_type": chart_type,
+            "x_axis": columns[0],
+            "y_axis": columns[1] if len(columns) > 1 else columns[0],
+            "title": goal[:80],
+        }
+
+    def chart_code(self, config: str) -> str:
+        chart_type = _extract(r"chart_type['\"]?\s*[:=]\s*['\"]([^'\"]+)", config) or "bar"
+        x_axis = _extract(r"x_axis['\"]?\s*[:=]\s*['\"]([^'\"]+)", config) or "x"
+        y_axis = _extract(r"y_axis['\"]?\s*[:=]\s*['\"]([^'\"]+)", config) or "y"
+        title = _extract(r"title['\"]?\s*[:=]\s*['\"]([^'\"]+)", config) or ""
+        plot = {"bar": "bar", "line": "plot", "scatter": "scatter"}.get(chart_type, "bar")
+        return (
+            "import matplotlib.pyplot as plt\n\n"
+            "fig, ax = plt.subplots()\n"
+            f"ax.{plot}(data[{x_axis!r}], data[{y_axis!r}])\n"
+            f"ax.set_xlabel({x_axis!r})\n"
+            f"ax.set_ylabel({y_axis!r})\n"
+            f"ax.set_title({title!r})\n"
+            "plt.show()"
+        )
+
+    def chart(self, goal: str, data: str) -> dict:
+        """The configuration and the code of a chart, in a single result."""
+        config = self.chart_config(goal, data)
+        return {**config, "code": self.chart_code(json.dumps(config))}
+
+    def next_tools(self, question: str, tool_outputs: list[str]) -> list[str] | None:
+        """The tools the router calls next, `None` when it's time to answer."""
+        if not tool_outputs:
+            return ["lookup_sales_data"]
+        if len(tool_outputs) == 1:
+            tools = []
+            if self.wants_analysis(question) or not self.wants_visualization(question):
+                tools.append("analyze_sales_data")
+            if self.wants_visualization(question):
+                tools.append("generate_visualization")
+            return tools
+        return None
+
+    def final_answer(self, question: str, tool_outputs: list[str]) -> str:
+        return "\n\n".join(output for output in tool_outputs[1:]) or tool_outputs[0]
+
+
+def _estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+class _Stub:
+    """Script + latencies shared by both backends."""
+
+    def __init__(self, script: StubScript | None, latencies: dict[str, Latency] | None, seed: int):
+        self.script = script or StubScript()
+        self.latencies = latencies or latencies_from_env()
+        self.rng = random.Random(seed)
+
+    async def wait(self, kind: str) -> None:
+        delay = self.latencies.get(kind, Latency()).sample(self.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# ----------------------------
+# pydantic-ai backend (lab_1)
+# ----------------------------
+
+
+def stub_function_model(
+    script: StubScript | None = None,
+    latencies: dict[str, Latency] | None = None,
+    seed: int = 0,
+):
+    """A pydantic-ai `FunctionModel` replaying `script`, for the lab_1 agents."""
+    from pydantic_ai.messages import (
+        ModelRequest,
+        ModelResponse,
+        SystemPromptPart,
+        TextPart,
+        ToolCallPart,
+        ToolReturnPart,
+        UserPromptPart,
+    )
+    from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+    stub = _Stub(script, latencies, seed)
+
+    def parts(messages, part_type):
+        return [
+            part
+            for message in messages
+            if isinstance(message, ModelRequest)
+            for part in message.parts
+            if isinstance(part, part_type)
+        ]
+
+    async def function(messages, info: AgentInfo) -> ModelResponse:
+        system = "\n".join(p.content for p in parts(messages, SystemPromptPart))
+        user = "\n".join(p.content for p in parts(messages, UserPromptPart))
+
+        if any(tool.name == "lookup_sales_data" for tool in info.function_tools):
+            await stub.wait("router")
+            outputs = [str(p.content) for p in parts(messages, ToolReturnPart)]
+            tools = stub.script.next_tools(user, outputs)
+            if not tools:
+                return ModelResponse(parts=[TextPart(stub.script.final_answer(user, outputs))])
+            args = {
+                "lookup_sales_data": {},
+                "analyze_sales_data": {"data": outputs[0] if outputs else ""},
+                "generate_visualization": {
+                    "data": outputs[0] if outputs else "",
+                    "visualization_goal": user,
+                },
+            }
+            return ModelResponse(parts=[ToolCallPart(name, args[name]) for name in tools])
+
+        if info.result_tools:
+            result_tool = info.result_tools[0]
+            properties = result_tool.parameters_json_schema.get("properties", {})
+            if "params" in properties:
+                await stub.wait("sql")
+                question = _extract(r"The prompt is:(.*?)\n\s*\n", system) or user
+                table_name = _extract(r"The table name is:\s*(\w+)", system) or "sales"
+                args = stub.script.parameterized_sql(question, table_name, _tables(system))
+            elif "chart_type" in properties:
+                kind = "chart" if "code" in properties else "chart_config"
+                await stub.wait(kind)
+                goal = _extract(r"The goal is to show:(.*)", user) or user
+                data = _extract(r"based on this data:(.*)The goal is", user) or ""
+                if kind == "chart":
+                    args = stub.script.chart(goal, data)
+                else:
+                    args = stub.script.chart_config(goal, data)
+            else:
+                await stub.wait("analysis")
+                question = _extract(r"answer the following question:(.*)", user) or user
+                data = _extract(r"Analyze the following data:(.*)Your job", user) or ""
+                args = {"description": stub.script.analysis(question, data)}
+            return ModelResponse(parts=[ToolCallPart(result_tool.name, args)])
+
+        if "Generate an SQL query" in system:
+            await stub.wait("sql")
+            question = _extract(r"The prompt is:(.*?)\n\s*\n", system) or user
+            table_name = _extract(r"The table name is:\s*(\w+)", system) or "sales"
+            sql = stub.script.sql(question, table_name, _tables(system))
+            return ModelResponse(parts=[TextPart(f"```sql\n{sql}\n```")])
+
+        await stub.wait("chart_code")
+        return ModelResponse(parts=[TextPart(f"```python\n{stub.script.chart_code(user)}\n```")])
+
+    return FunctionModel(function, model_name="stub")
+
+
+# -----------------------
+# OpenAI backend (lab_2)
+# -----------------------
+
+
+class StubOpenAITransport(httpx.AsyncBaseTransport):
+    """httpx transport answering the OpenAI chat completions API locally."""
+
+    def __init__(
+        self,
+        script: StubScript | None = None,
+        latencies: dict[str, Latency] | None = None,
+        seed: int = 0,
+    ):
+        self.stub = _Stub(script, latencies, seed)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": "not stubbed"}})
+        body = json.loads(request.content)
+        messages = body["messages"]
+        prompt = next((m["content"] for m in messages if m.get("role") == "user"), "") or ""
+        message = {"role": "assistant", "content": None}
+        script = self.stub.script
+
+        if body.get("tools") and body.get("tool_choice") != "none":
+            await self.stub.wait("router")
+            outputs = [m["content"] for m in messages if m.get("role") == "tool"]
+            tools = script.next_tools(prompt, outputs)
+            if tools:
+                args = {
+                    "lookup_sales_data": {"prompt": prompt},
+                    "analyze_sales_data": {"data": outputs[0] if outputs else "", "prompt": prompt},
+                    "generate_visualization": {
+                        "data": outputs[0] if outputs else "",
+                        "visualization_goal": prompt,
+                    },
+                }
+                message["tool_calls"] = [
+                    {
+                        "id": f"call_{len(outputs)}_{i}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": json.dumps(args[name])},
+                    }
+                    for i, name in enumerate(tools)
+                ]
+            else:
+                message["content"] = script.final_answer(prompt, outputs)
+        elif body.get("tools"):
+            await self.stub.wait("router")
+            outputs = [m["content"] for m in messages if m.get("role") == "tool"]
+            message["content"] = script.final_answer(prompt, outputs or [""])
+        elif "params" in body.get("response_format", {}).get("json_schema", {}).get(
+            "schema", {}
+        ).get("properties", {}):
+            await self.stub.wait("sql")
+            question = _extract(r"The prompt is:(.*?)\n\s*\n", prompt) or prompt
+            table_name = _extract(r"The table name is:\s*(\w+)", prompt) or "sales"
+            message["content"] = json.dumps(
+                script.parameterized_sql(question, table_name, _tables(prompt))
+            )
+        elif body.get("response_format"):
+            schema = body["response_format"].get("json_schema", {}).get("schema", {})
+            kind = "chart" if "code" in schema.get("properties", {}) else "chart_config"
+            await self.stub.wait(kind)
+            goal = _extract(r"The goal is to show:(.*)", prompt) or prompt
+            data = _extract(r"based on this data:(.*)The goal is", prompt) or ""
+            if kind == "chart":
+                message["content"] = json.dumps(script.chart(goal, data))
+            else:
+                message["content"] = json.dumps(script.chart_config(goal, data))
+        elif "Generate an SQL query" in prompt:
+            await self.stub.wait("sql")
+            question = _extract(r"The prompt is:(.*?)\n\s*\n", prompt) or prompt
+            table_name = _extract(r"The table name is:\s*(\w+)", prompt) or "sales"
+            message["content"] = f"```sql\n{script.sql(question, table_name, _tables(prompt))}\n```"
+        elif "Analyze the following data" in prompt:
+            await self.stub.wait("analysis")
+            question = _extract(r"answer the following question:(.*)", prompt) or prompt
+            data = _extract(r"Analyze the following data:(.*)Your job", prompt) or ""
+            message["content"] = script.analysis(question, data)
+        else:
+            await self.stub.wait("chart_code")
+            message["content"] = f"```python\n{script.chart_code(prompt)}\n```"
+
+        prompt_tokens = _estimate_tokens(json.dumps(messages) + json.dumps(body.get("tools", [])))
+        completion_tokens = _estimate_tokens(json.dumps(message))
+        return httpx.Response(
+            200,
+            json={
+                "id": f"chatcmpl-stub-{time.monotonic_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": 0},
+                },
+            },
+        )
+
+
+def stub_openai_client(
+    script: StubScript | None = None,
+    latencies: dict[str, Latency] | None = None,
+    seed: int = 0,
+):
+    """An `AsyncOpenAI` client answered by `StubOpenAITransport`, for lab_2."""
+    from openai import AsyncOpenAI
+
+    transport = StubOpenAITransport(script, latencies, seed)
+    return AsyncOpenAI(
+        api_key="stub",
+        base_url="http://stub.local/v1",
+        http_client=httpx.AsyncClient(transport=transport),
+    )
@@ -0,0 +1,140 @@
+"""Size control of the payloads attached to spans.
+
+Attributes such as the SQL result of `execute_sql_query` or the message list
+of `router_call` can be arbitrarily large. `PayloadPolicy` bounds them: values
+are truncated (with a marker telling how much was dropped) or replaced by
+their content hash, and only a sampled fraction of the traces keeps the full
+payloads.
+
+A list (e.g. the message history, recorded again at every turn) is rendered
+item by item: the text and the hash of an item are computed once and reused
+by the next renderings of a list holding the same item, so a turn only pays
+for the messages appended since the previous one. Items are expected not to
+change once rendered.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from opentelemetry import trace
+
+
+def _to_text(value: object) -> str:
+    if isinstance(value, str):
+        return value
+
+    def default(obj):
+        if hasattr(obj, "model_dump"):
+            return obj.model_dump(exclude_none=True)
+        return str(obj)
+
+    return json.dumps(value, default=default)
+
+
+@dataclass
+class PayloadPolicy:
+    """How payload attributes are recorded on spans.
+
+    Args:
+        max_length: Maximum number of characters kept (when not hashing).
+        hash_only: Record only the content hash of the payload.
+        full_payload_sample_rate: Fraction of the traces (0.0 to 1.0) recording
+            full payloads, regardless of the other settings. The decision is
+            taken on the trace id, so all the spans of a trace agree.
+    """
+
+    max_length: int = 2048
+    hash_only: bool = False
+    full_payload_sample_rate: float = 0.0
+    # number of list items whose text and hash are kept (see `_item`)
+    max_cached_items: int = 4096
+    # id of an item -> (the item, its text, its hash), the item is referenced
+    # so that its id isn't reused while it's cached
+    _items: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False, compare=False)
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def from_env(cls) -> "PayloadPolicy":
+        """Build the policy from the SPAN_PAYLOAD_MAX_LENGTH, SPAN_PAYLOAD_HASH_ONLY
+        and SPAN_FULL_PAYLOAD_SAMPLE_RATE env variables."""
+        return cls(
+            max_length=int(os.getenv("SPAN_PAYLOAD_MAX_LENGTH", cls.max_length)),
+            hash_only=os.getenv("SPAN_PAYLOAD_HASH_ONLY", "").lower() in ("1", "true", "yes"),
+            full_payload_sample_rate=float(
+                os.getenv("SPAN_FULL_PAYLOAD_SAMPLE_RATE", cls.full_payload_sample_rate)
+            ),
+        )
+
+    def full_payload_sampled(self) -> bool:
+        """Whether the current trace records full payloads."""
+        if self.full_payload_sample_rate <= 0:
+            return False
+        span_context = trace.get_current_span().get_span_context()
+        if not span_context.is_valid:
+            return False
+        # the low 64 bits of the trace id are random (W3C trace context)
+        return (span_context.trace_id & 0xFFFFFFFFFFFFFFFF) / 2**64 < self.full_payload_sample_rate
+
+    def render(self, value: object) -> str:
+        """The attribute value to record for `value`."""
+        if isinstance(value, list):
+            items = [self._item(item) for item in value]
+            length = 2 + sum(len(text) for text, _ in items) + 2 * max(len(items) - 1, 0)
+            if self.full_payload_sampled() or (not self.hash_only and length <= self.max_length):
+                return "[" + ", ".join(text for text, _ in items) + "]"
+            # the hash of the hashes of the items
+            digest = hashlib.sha256("".join(digest for _, digest in items).encode()).hexdigest()
+            if self.hash_only:
+                return f"sha256:{digest}"
+            return self._truncate(_prefix(items, self.max_length), length, digest)
+        text = _to_text(value)
+        if self.full_payload_sampled():
+            return text
+        if not self.hash_only and len(text) <= self.max_length:
+            return text
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        if self.hash_only:
+            return f"sha256:{digest}"
+        return self._truncate(text, len(text), digest)
+
+    def _truncate(self, text: str, length: int, digest: str) -> str:
+        return (
+            f"{text[:self.max_length]}"
+            f"...[truncated {length - self.max_length} of {length} chars, sha256:{digest}]"
+        )
+
+    def _item(self, item: object) -> tuple[str, str]:
+        """The text and the hash of a list item, computed once per item."""
+        key = id(item)
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is not None and cached[0] is item:
+                self._items.move_to_end(key)
+                return cached[1], cached[2]
+        text = _to_text(item) if not isinstance(item, str) else json.dumps(item)
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        with self._lock:
+            self._items[key] = (item, text, digest)
+            while len(self._items) > self.max_cached_items:
+                self._items.popitem(last=False)
+        return text, digest
+
+
+def _prefix(items: list[tuple[str, str]], length: int) -> str:
+    """The first `length` characters (at least) of the rendering of a list."""
+    parts, size = ["["], 1
+    for text, _ in items:
+        if size >= length:
+            break
+        if size > 1:
+            parts.append(", ")
+            size += 2
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
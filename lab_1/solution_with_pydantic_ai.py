@@ -4,7 +4,8 @@
 #   "pandas",
 #   "pyarrow",
 #   "pydantic-ai",
-#   "email-validator"
+#   "email-validator",
+#   "opentelemetry-api"
 # ]
 # ///
 
@@ -15,18 +16,97 @@
 import asyncio
 import os
 import random
+import sys
+import time
 from dataclasses import dataclass
+from pathlib import Path
 
 import duckdb
 import pandas as pd
+from opentelemetry import trace
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, ModelRetry, RunContext
+from pydantic_ai.exceptions import UnexpectedModelBehavior, UsageLimitExceeded
+from pydantic_ai.usage import Usage, UsageLimits
+
+# make the `common` package importable when running `uv run lab_1/<script>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.budget import LIMIT_EXCEEDED_ANSWER  # noqa: E402
+from common.cache import QueryResultCache, cache_key, make_response_cache  # noqa: E402
+from common.chart_sandbox import ChartRenderer  # noqa: E402
+from common.charts import chart_code  # noqa: E402
+from common.cursors import CursorPool  # noqa: E402
+from common.dataset import SalesDataset, get_sales_dataset  # noqa: E402
+from common.fast_path import FastPath, FastPathQuery  # noqa: E402
+from common.guards import QueryGuard, QueryRejected  # noqa: E402
+from common.rendering import render_result  # noqa: E402
+from common.stub_model import stub_function_model  # noqa: E402
 
 
 # database lookup
-TRANSACTION_DATA_FILE_PATH = (
-    "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
+# HINT: set SALES_DATA_PATH to use another file, e.g. the copy clustered by store
+# and date built by `uv run common/prepare_parquet.py`
+TRANSACTION_DATA_FILE_PATH = os.getenv(
+    "SALES_DATA_PATH", "./data/Store_Sales_Price_Elasticity_Promotions_Data.parquet"
 )
+# HINT: one of "copy", "arrow", "parquet" or "duckdb" (see common/dataset.py),
+# "duckdb" needs the database built by `uv run common/build_database.py`
+DATA_ACCESS_MODE = os.getenv("DATA_ACCESS_MODE", "arrow")
+# HINT: set SALES_ROLLUPS=false to not build the pre-aggregated tables of
+# common/rollups.py (nor advertise them in the SQL generation prompt)
+SALES_ROLLUPS = os.getenv("SALES_ROLLUPS", "true").lower() == "true"
+# the queries run on a bounded pool of worker threads (see common/cursors.py) and
+# are interrupted past their timeout
+# HINT: change them via the QUERY_WORKERS and QUERY_TIMEOUT env variables (0
+# disables the timeout).
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 4))
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 30)) or None
+# the generated SQL is checked against its plan before it runs: queries that
+# would process too many rows (e.g. cross joins) are sent back to the model,
+# large results are truncated and DuckDB runs with a memory limit (see
+# common/guards.py)
+# HINT: set SQL_GUARD=false to run the SQL unchecked, the limits are set via the
+# SQL_GUARD_MEMORY_LIMIT, SQL_GUARD_THREADS, SQL_GUARD_MAX_ROWS and
+# SQL_GUARD_MAX_ESTIMATED_ROWS env variables
+QUERY_GUARD = QueryGuard.from_env() if os.getenv("SQL_GUARD", "true").lower() == "true" else None
+# the SQL that fails or is rejected by the guard is generated again, with the
+# failing query and the error (or the guard's hint) added to the prompt
+# HINT: change the number of attempts via the SQL_GENERATION_RETRIES env variable
+SQL_GENERATION_RETRIES = int(os.getenv("SQL_GENERATION_RETRIES", 2))
+# budget of the lookup result passed to the other tools (see common/rendering.py)
+# HINT: RESULT_FORMAT is one of "csv" or "markdown"
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", 50))
+RESULT_MAX_TOKENS = int(os.getenv("RESULT_MAX_TOKENS", 2000))
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "csv")
+# the model generates the chart configuration and the code is rendered from a
+# template (see common/charts.py), the model only writes the code of the chart
+# types without template
+# HINT: set VISUALIZATION_MODE=fused to generate the configuration and the code
+# in a single structured call, or VISUALIZATION_MODE=two_step to generate the
+# code in a second call (e.g. to compare them in evaluations)
+VISUALIZATION_MODE = os.getenv("VISUALIZATION_MODE", "template")
+# the chart code is run in sandboxed worker processes (with time, CPU and memory
+# limits, see common/chart_sandbox.py) and the chart saved to CHART_OUTPUT_DIR
+# HINT: set CHART_RENDERING=false to only return the code, the limits are set via
+# the CHART_RENDER_WORKERS, CHART_RENDER_TIMEOUT, CHART_RENDER_CPU_SECONDS and
+# CHART_RENDER_MEMORY_MB env variables and the format via CHART_FORMAT (png or svg)
+CHART_RENDERING = os.getenv("CHART_RENDERING", "true").lower() == "true"
+CHART_OUTPUT_DIR = os.getenv("CHART_OUTPUT_DIR", "charts")
+# templated lookup questions ("sales for store N on DATE", "sales by SKU in
+# MONTH", ...) are answered with a parameterized query, without calling the
+# models, the other questions go to the router (see common/fast_path.py)
+# HINT: set FAST_PATH=false to send every question to the router
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() == "true"
+# the parameterized queries (the fast path's, and the generated SQL with
+# SQL_PARAMETERS=true) run as prepared statements, kept per cursor by query
+# template, so a repeated query shape skips DuckDB's parsing and planning and the
+# guard's plan check (see common/prepared.py)
+# HINT: set SQL_PARAMETERS=true to have the model generate a query template plus
+# the values of its placeholders instead of SQL with literal values, and
+# PREPARED_STATEMENTS=0 to not prepare the parameterized queries
+SQL_PARAMETERS = os.getenv("SQL_PARAMETERS", "false").lower() == "true"
+PREPARED_STATEMENTS = int(os.getenv("PREPARED_STATEMENTS", 64))
 
 
 # ==============================
@@ -37,10 +117,29 @@ TRANSACTION_DATA_FILE_PATH = (
 @dataclass
 class SharedDependencies:
     table_name: str
-    dataframe: pd.DataFrame
-
+    dataset: SalesDataset
+    # one DuckDB cursor per in-flight query, over a database shared by the run
+    cursors: CursorPool
+
+
+# HINT: set PYDANTIC_AI_MODEL=stub to use a deterministic local stand-in instead
+# of a real model, e.g. for offline load tests (see common/stub_model.py).
+MODEL_NAME = os.getenv("PYDANTIC_AI_MODEL", "google-gla:gemini-1.5-flash")
+model = stub_function_model() if MODEL_NAME == "stub" else MODEL_NAME
+
+# Limits of a run. The tools pass `usage=ctx.usage` to their agents, so the
+# requests and tokens of every agent count against the same limits.
+# HINT: change them via the AGENT_MAX_REQUESTS, AGENT_MAX_TOTAL_TOKENS and
+# AGENT_TIMEOUT env variables (0 disables a limit).
+usage_limits = UsageLimits(
+    request_limit=int(os.getenv("AGENT_MAX_REQUESTS", 50)) or None,
+    total_tokens_limit=int(os.getenv("AGENT_MAX_TOTAL_TOKENS", 100_000)) or None,
+)
+RUN_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", 120)) or None
 
-model = os.getenv("PYDANTIC_AI_MODEL", "google-gla:gemini-1.5-flash")
+# Spans around the steps of the tools. They are no-ops unless an OpenTelemetry
+# tracer provider is configured (e.g. by the benchmarks in bench/).
+tracer = trace.get_tracer(__name__)
 
 
 # ==================
@@ -55,19 +154,126 @@ model = os.getenv("PYDANTIC_AI_MODEL", "google-gla:gemini-1.5-flash")
 
 text2sql_agent = Agent(model, deps_type=SharedDependencies)
 
+# cache of the generated SQL, keyed on the model, the rendered prompt and the schema
+# HINT: set LLM_CACHE_PATH (e.g. ".cache/llm.sqlite") to also keep it on disk.
+sql_generation_cache = make_response_cache(sqlite_path=os.getenv("LLM_CACHE_PATH"))
+
 
 # code for step 2 of tool 1
+# HINT: the schema description (DuckDB types, ranges and example values of the
+# columns) is computed once per version of the dataset, see common/dataset.py.
+# It also lists the pre-aggregated tables of common/rollups.py, if enabled.
 @text2sql_agent.system_prompt
 def text2sql_system_prompt(ctx: RunContext) -> str:
     return f"""
     Generate an SQL query based on a prompt. Do not reply with anything besides the SQL query.
     The prompt is: {ctx.prompt}
 
-    The available columns are: {ctx.deps.dataframe.columns}
     The table name is: {ctx.deps.table_name}
+    The columns of the table are:
+{ctx.deps.dataset.table_description(ctx.deps.table_name)}
     """
 
 
+# class defining the response format of step 2 of tool 1 with SQL_PARAMETERS
+class ParameterizedQuery(BaseModel):
+    sql: str = Field(..., description="The SQL query, with a ? placeholder for every value")
+    params: list[str | int | float] = Field(
+        ..., description="The values of the placeholders, in order"
+    )
+
+
+# agent generating the SQL as a template plus its values, with SQL_PARAMETERS
+parameterized_text2sql_agent = Agent(
+    model,
+    deps_type=SharedDependencies,
+    result_type=ParameterizedQuery,
+    system_prompt=(
+        "Write every literal value the query compares columns to (numbers, strings, dates) "
+        "as a ? placeholder, and list the values in params, in the order of the placeholders."
+    ),
+)
+parameterized_text2sql_agent.system_prompt(text2sql_system_prompt)
+
+
+# cache of the query results, keyed on the normalized SQL and the dataset version
+# HINT: change its memory budget via the SQL_RESULT_CACHE_MAX_BYTES env variable.
+sql_result_cache = QueryResultCache(
+    max_bytes=int(os.getenv("SQL_RESULT_CACHE_MAX_BYTES", 64 * 2**20))
+)
+
+
+async def execute_sql_query(
+    sql_query: str, deps: SharedDependencies, params: list | None = None
+) -> pd.DataFrame:
+    """Run the query, unless an equivalent query already ran against the same
+    version of the dataset."""
+    with tracer.start_as_current_span("execute_sql_query") as span:
+        version = deps.dataset.version
+        result = sql_result_cache.get(sql_query, version, params)
+        span.set_attribute("sql_result_cache.hit", result is not None)
+        if result is None:
+            # off the event loop, so a heavy query doesn't stall the other runs
+            result = await deps.cursors.execute(sql_query, timeout=QUERY_TIMEOUT, params=params)
+            sql_result_cache.set(sql_query, version, result, params)
+    return result
+
+
+def sql_generation_key(ctx: RunContext[SharedDependencies]) -> str:
+    """Key of the SQL generated for the prompt of `ctx` in `sql_generation_cache`."""
+    schema = ctx.deps.dataset.table_description(ctx.deps.table_name)
+    key_schema = {"table_name": ctx.deps.table_name, "schema": schema}
+    if SQL_PARAMETERS:
+        # cached as the JSON of the template and its values
+        key_schema["parameters"] = True
+    return cache_key(MODEL_NAME, text2sql_system_prompt(ctx), key_schema)
+
+
+# added to the prompt when the SQL is generated again after a failure
+SQL_RETRY_PROMPT = """
+The previous query was:
+{sql_query}
+It failed with: {error}
+Write a query that fixes this.
+"""
+
+
+# step 2 of tool 1, with the cache of the generated SQL
+async def generate_sql_query(
+    ctx: RunContext[SharedDependencies], feedback: str | None = None
+) -> tuple[str, list | None]:
+    """Generate the SQL code, unless it was already generated for the same prompt
+    and schema, and the values of its placeholders with SQL_PARAMETERS.
+
+    Args:
+        ctx: The context of the tool.
+        feedback: The previous query and its error (`SQL_RETRY_PROMPT`), the
+            SQL is then generated again with them.
+    """
+    with tracer.start_as_current_span("generate_sql_query") as span:
+        key = sql_generation_key(ctx)
+        span.set_attribute("sql_generation.retry", feedback is not None)
+        # a retry skips the lookup, the cached query is the one that failed
+        response, tier = (
+            await sql_generation_cache.aget(key) if feedback is None else (None, None)
+        )
+        span.set_attributes(sql_generation_cache.span_attributes("sql_generation_cache", tier))
+        if response is None:
+            agent = parameterized_text2sql_agent if SQL_PARAMETERS else text2sql_agent
+            prompt = ctx.prompt if feedback is None else f"{ctx.prompt}\n{feedback}"
+            result = await agent.run(
+                prompt, usage=ctx.usage, usage_limits=usage_limits, deps=ctx.deps
+            )
+            response = result.data.model_dump_json() if SQL_PARAMETERS else result.data
+            await sql_generation_cache.aset(key, response)
+    params = None
+    if SQL_PARAMETERS:
+        query = ParameterizedQuery.model_validate_json(response)
+        response, params = query.sql, query.params
+    # clean response to make sure it only includes SQL code
+    return response.replace("```sql", "").replace("```", "").strip(), params
+
+
 # code for tool 1
 async def lookup_sales_data(ctx: RunContext[SharedDependencies]) -> str:
     """Look up data from Store Sales Price Elasticity Promotions dataset.
@@ -76,20 +282,36 @@ async def lookup_sales_data(ctx: RunContext[SharedDependencies]) -> str:
         ctx: The context.
     """
     try:
-        df = ctx.deps.dataframe
-        # step 1: load dataframe into a duckdb table
-        duckdb.sql(
-            f"CREATE TABLE IF NOT EXISTS {ctx.deps.table_name} AS SELECT * FROM df"
+        # step 1: the dataset is exposed as a duckdb table (or view) on the
+        # cursors of `ctx.deps.cursors`, see step 3
+        feedback = None
+        for attempt in range(SQL_GENERATION_RETRIES + 1):
+            # step 2: generate the SQL code (unless it was already generated for
+            # the same prompt and schema)
+            sql_query, params = await generate_sql_query(ctx, feedback)
+            # step 3: execute the SQL query, unless an equivalent query already
+            # ran against the same version of the dataset. Parameterized queries
+            # run as prepared statements.
+            try:
+                result = await execute_sql_query(sql_query, ctx.deps, params)
+                break
+            except Exception as e:
+                # the SQL failed (or was rejected by the guard), don't serve it again
+                await sql_generation_cache.adelete(sql_generation_key(ctx))
+                retryable = isinstance(e, (QueryRejected, duckdb.Error))
+                if not retryable or attempt == SQL_GENERATION_RETRIES:
+                    raise
+                # generate it again, with the error (or the guard's hint)
+                feedback = SQL_RETRY_PROMPT.format(sql_query=sql_query, error=e)
+        # step 4: render a compact version of the result, large results are
+        # replaced by a sample of their rows plus a summary of every column
+        rendered = render_result(
+            result, max_rows=RESULT_MAX_ROWS, max_tokens=RESULT_MAX_TOKENS, fmt=RESULT_FORMAT
         )
-
-        # step 2: generate the SQL code
-        result = await text2sql_agent.run(ctx.prompt, usage=ctx.usage, deps=ctx.deps)
-        sql_query = result.data
-        # clean response to make sure it only includes SQL code
-        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-        # step 3: execute the SQL query
-        result = duckdb.sql(sql_query).df()
-        return result.to_string()
+        trace.get_current_span().set_attributes(rendered.span_attributes())
+        return rendered.text
+    except UsageLimitExceeded:
+        raise
     except Exception as e:
         raise ModelRetry(f"Error accessing data:: {e}")
 
@@ -124,7 +346,8 @@ async def analyze_sales_data(ctx: RunContext[SharedDependencies], data: str) ->
     Analyze the following data: {data}
     Your job is to answer the following question: {ctx.prompt}
     """
-    result = await analyzer_agent.run(prompt, usage=ctx.usage)
+    with tracer.start_as_current_span("analyze_sales_data"):
+        result = await analyzer_agent.run(prompt, usage=ctx.usage, usage_limits=usage_limits)
     return (
         result.data.description
         if isinstance(result.data, SuccessfulAnalysis)
@@ -153,38 +376,111 @@ chart_visualization_config_agent = Agent(model, result_type=VisualizationConfig)
 chart_creation_agent = Agent(model)
 
 
-async def generate_visualization(
-    ctx: RunContext[SharedDependencies], data: str, visualization_goal: str
-) -> str:
-    """Generate Python code to create data visualizations.
+# class defining the response format of the fused mode of tool 3: the
+# configuration and the code of the chart in a single result
+class Visualization(VisualizationConfig):
+    code: str = Field(..., description="Python code creating the chart, no other text")
 
-    Args:
-        ctx: The context.
-        data: The lookup_sales_data tool's output.
-        visualization_goal: The goal of the visualization.
-    """
-    result = await chart_visualization_config_agent.run(
-        f"""
+
+# agent to generate the configuration and the code of a chart in one call
+chart_agent = Agent(model, result_type=Visualization)
+
+
+async def extract_chart_config(
+    data: str, visualization_goal: str, usage: Usage
+) -> VisualizationConfig:
+    """Generate the chart configuration."""
+    with tracer.start_as_current_span("extract_chart_config"):
+        result = await chart_visualization_config_agent.run(
+            f"""
     Generate a chart configuration based on this data: {data}
     The goal is to show: {visualization_goal}
     """,
-        usage=ctx.usage,
-    )
-    config = result.data
+            usage=usage,
+            usage_limits=usage_limits,
+        )
+    return result.data
+
 
-    result = await chart_creation_agent.run(
-        f"""
+async def create_chart(config: VisualizationConfig, data: str, usage: Usage) -> str:
+    """Generate the chart code from its configuration."""
+    with tracer.start_as_current_span("create_chart"):
+        result = await chart_creation_agent.run(
+            f"""
     Write python code to create a chart based on the following configuration and data.
     Only return the code, no other text.
     config: {config}
     data: {data}
     """,
-        usage=ctx.usage,
-    )
+            usage=usage,
+            usage_limits=usage_limits,
+        )
     code = result.data.replace("```python", "").replace("```", "").strip()
     return code
 
 
+async def create_visualization_fused(data: str, visualization_goal: str, usage: Usage) -> str:
+    """Generate the chart configuration and code in a single structured call."""
+    with tracer.start_as_current_span("generate_chart"):
+        result = await chart_agent.run(
+            f"""
+    Generate a chart configuration and the python code creating that chart.
+    The code only contains python code, no other text.
+    Generate the chart based on this data: {data}
+    The goal is to show: {visualization_goal}
+    """,
+            usage=usage,
+            usage_limits=usage_limits,
+        )
+    code = result.data.code.replace("```python", "").replace("```", "").strip()
+    return code
+
+
+async def create_visualization(data: str, visualization_goal: str, usage: Usage) -> str:
+    """The chart code, generated as set by `VISUALIZATION_MODE`."""
+    if VISUALIZATION_MODE == "fused":
+        return await create_visualization_fused(data, visualization_goal, usage)
+    config = await extract_chart_config(data, visualization_goal, usage)
+    if VISUALIZATION_MODE == "template":
+        with tracer.start_as_current_span("render_chart") as span:
+            code = chart_code(config.model_dump(), data)
+            span.set_attribute("chart_template", code is not None)
+        if code is not None:
+            return code
+    return await create_chart(config, data, usage)
+
+
+# pool of worker processes running the chart code, with matplotlib and pandas
+# already imported (started in `main`)
+chart_renderer = ChartRenderer.from_env() if CHART_RENDERING else None
+
+
+async def execute_chart_code(code: str, data: str) -> str:
+    """Run the chart code in the sandbox and note the outcome at the end of the code."""
+    with tracer.start_as_current_span("execute_chart_code") as span:
+        chart = await asyncio.to_thread(chart_renderer.render, code, data)
+        span.set_attributes(chart.span_attributes())
+    if chart.ok:
+        return f"{code}\n\n# chart rendered to {chart.save(CHART_OUTPUT_DIR)}"
+    return f"{code}\n\n# the chart code failed to run: {chart.error}"
+
+
+async def generate_visualization(
+    ctx: RunContext[SharedDependencies], data: str, visualization_goal: str
+) -> str:
+    """Generate Python code to create data visualizations.
+
+    Args:
+        ctx: The context.
+        data: The lookup_sales_data tool's output.
+        visualization_goal: The goal of the visualization.
+    """
+    code = await create_visualization(data, visualization_goal, ctx.usage)
+    if chart_renderer is not None:
+        code = await execute_chart_code(code, data)
+    return code
+
+
 # ------------------------------------
 # Defining the router and `its logic`?
 # ------------------------------------
@@ -203,18 +499,123 @@ router_agent = Agent(
 )
 
 
+# ---------
+# Fast path
+# ---------
+
+
+# templates of the lookup questions answered without the models
+fast_path = FastPath("sales", rollups=SALES_ROLLUPS) if FAST_PATH else None
+
+
+async def answer_with_fast_path(query: FastPathQuery, deps: SharedDependencies) -> str | None:
+    """Answer a templated question with its query, `None` if the query fails."""
+    with tracer.start_as_current_span("fast_path") as span:
+        span.set_attribute("fast_path.template", query.template)
+        try:
+            result = await execute_sql_query(query.sql, deps, query.params)
+        except Exception as e:
+            # e.g. rejected by the guard or timed out, the router takes over
+            span.record_exception(e)
+            return None
+        rendered = render_result(
+            result, max_rows=RESULT_MAX_ROWS, max_tokens=RESULT_MAX_TOKENS, fmt=RESULT_FORMAT
+        )
+        span.set_attributes(rendered.span_attributes())
+    return f"{query.description}:\n\n{rendered.text}"
+
+
+# answer of the runs where a tool kept failing past its retries
+RUN_FAILED_ANSWER = "I couldn't answer this question ({error}). Please try rephrasing it."
+
+
+async def run_router(question: str, deps: SharedDependencies) -> str:
+    """Run the router within the limits of a run.
+
+    When a limit fires the run is stopped and a canned answer naming the limit
+    is returned instead of raising. The same goes for a tool that keeps
+    failing (`RUN_FAILED_ANSWER`).
+    """
+    usage = Usage()
+    start = time.monotonic()
+    limit = None
+    try:
+        result = await asyncio.wait_for(
+            router_agent.run(question, deps=deps, usage=usage, usage_limits=usage_limits),
+            timeout=RUN_TIMEOUT,
+        )
+        return result.data
+    except UnexpectedModelBehavior as e:
+        # e.g. lookup_sales_data failed past its retries
+        trace.get_current_span().record_exception(e)
+        return RUN_FAILED_ANSWER.format(error=e)
+    except UsageLimitExceeded:
+        # named like the limits of common/budget.py, used by Lab 2
+        if usage_limits.request_limit and usage.requests >= usage_limits.request_limit:
+            limit = "max_requests"
+        else:
+            limit = "max_total_tokens"
+    except asyncio.TimeoutError:
+        limit = "timeout"
+    finally:
+        # the same attributes as `RunBudget.span_attributes` in Lab 2
+        trace.get_current_span().set_attributes(
+            {
+                "budget.requests": usage.requests,
+                "budget.total_tokens": usage.total_tokens or 0,
+                "budget.elapsed": round(time.monotonic() - start, 3),
+                "budget.limit_exceeded": limit or "",
+            }
+        )
+    return LIMIT_EXCEEDED_ANSWER.format(limit=limit)
+
+
+async def answer_question(question: str, deps: SharedDependencies) -> str:
+    """Answer with the fast path when the question matches one of its templates,
+    with the router otherwise."""
+    with tracer.start_as_current_span("AgentRun") as span:
+        start = time.perf_counter()
+        query = fast_path.match(question) if fast_path is not None else None
+        answer = await answer_with_fast_path(query, deps) if query is not None else None
+        if answer is None:
+            query = None
+            answer = await run_router(question, deps)
+        if fast_path is not None:
+            span.set_attributes(fast_path.record(query, time.perf_counter() - start))
+    return answer
+
+
 # ----------
 # Entrypoint
 # ----------
 
 
 async def main():
-    # Hint: Loading the Parquet file into memory once at the start
-    # optimizes performance by reducing I/O overhead and resource consumption,
-    # especially when the lookup_sales_data tool is called multiple times.
-    df = pd.read_parquet(TRANSACTION_DATA_FILE_PATH)
+    # Hint: The dataset handle is shared by the whole process. It's loaded once
+    # (lazily, on the first lookup, and again only if the file changes) and, in
+    # the default "arrow" mode, registered as a zero-copy view instead of being
+    # copied into a DuckDB table, so the data lives only once in memory.
+    dataset = get_sales_dataset(
+        TRANSACTION_DATA_FILE_PATH, mode=DATA_ACCESS_MODE, rollups=SALES_ROLLUPS
+    )
 
-    deps = SharedDependencies(table_name="sales", dataframe=df)
+    # Hint: every query runs on its own cursor of the pool, so concurrent
+    # lookups don't share (and serialize on) DuckDB's default connection.
+    deps = SharedDependencies(
+        table_name="sales",
+        dataset=dataset,
+        cursors=CursorPool(
+            dataset,
+            table_name="sales",
+            max_workers=QUERY_WORKERS,
+            guard=QUERY_GUARD,
+            max_prepared=PREPARED_STATEMENTS,
+        ),
+    )
+    # Hint: the chart workers import matplotlib and pandas while the first
+    # question is answered, so the first chart doesn't wait for them.
+    if chart_renderer is not None:
+        chart_renderer.start()
     # The following questions were taken from a Jupyter Notebook from Lab 1
     questions = [
         "Show me all the sales for store 1320 on November 1st, 2021",
@@ -225,11 +626,12 @@ async def main():
     choosen_question = random.choice(questions)  # select a question at random
     print(f"Question: {choosen_question}")
     print("Answer:")
-    result = await router_agent.run(
-        choosen_question,
-        deps=deps,
-    )
-    print(result.data)
+    try:
+        print(await answer_question(choosen_question, deps))
+    finally:
+        if chart_renderer is not None:
+            chart_renderer.close()
+        deps.cursors.close()
 
 
 if __name__ == "__main__":
@@ -40,20 +40,28 @@ def get_phoenix_endpoint():
 # =============================
 import json
 import os
+import sys
 import warnings
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 import duckdb
 import pandas as pd
 import phoenix as px
 from phoenix.otel import register
-from openai import OpenAI
+from openai import APITimeoutError, OpenAI
 from openinference.instrumentation.openai import OpenAIInstrumentor
 from openinference.semconv.trace import SpanAttributes
+from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 from openinference.instrumentation import TracerProvider
 from pydantic import BaseModel, Field
 
+# make the `common` package importable when running `uv run lab_2/<script>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.budget import LIMIT_EXCEEDED_ANSWER, RunBudget, record_usage
+
 # ==============================
 # initializing the OpenAI client
 # ==============================
@@ -116,6 +124,7 @@ def generate_sql_query(prompt: str, columns: list, table_name: str) -> str:
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
+    record_usage(response.usage)
     
     return response.choices[0].message.content
 
@@ -174,6 +183,7 @@ def analyze_sales_data(prompt: str, data: str) -> str:
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
+    record_usage(response.usage)
 
     analysis = response.choices[0].message.content
     return analysis if analysis else "No analysis could be generated"
@@ -218,6 +228,7 @@ def extract_chart_config(data: str, visualization_goal: str) -> dict:
         messages=[{"role": "user", "content": formatted_prompt}],
         response_format=VisualizationConfig,
     )
+    record_usage(response.usage)
     
     try:
         # Extract axis and title info from response
@@ -259,6 +270,7 @@ def create_chart(config: dict) -> str:
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
+    record_usage(response.usage)
     
     code = response.choices[0].message.content
     code = code.replace("```python", "").replace("```", "")
@@ -368,20 +380,82 @@ You are a helpful assistant that can answer questions about the Store Sales Pric
 """
 
 
-def run_agent(messages):
+# instruction appended when a limit of the run fires, to get an answer without more tool calls
+FINAL_ANSWER_PROMPT = """
+The limits of this run were reached, do not call any more tools.
+Answer the user's question with the information gathered so far.
+"""
+
+
+def final_answer(messages, budget):
+    """Answer with the information gathered so far once a limit of the run fired"""
+    print(f"Run limit exceeded ({budget.exceeded}), returning final response")
+    answer = None
+    if budget.exceeded != "timeout":
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages + [{"role": "system", "content": FINAL_ANSWER_PROMPT}],
+            tools=tools,
+            tool_choice="none",
+            timeout=budget.remaining_time(),
+        )
+        record_usage(response.usage)
+        answer = response.choices[0].message.content
+    return answer or LIMIT_EXCEEDED_ANSWER.format(limit=budget.exceeded)
+
+
+def prompt_cache_attributes(usage):
+    """Prompt tokens of a response and how many of them were served from the provider's cache"""
+    if usage is None:
+        return {}
+    details = usage.prompt_tokens_details
+    return {
+        "usage.prompt_tokens": usage.prompt_tokens,
+        "usage.cached_tokens": (details.cached_tokens or 0) if details else 0,
+    }
+
+
+def run_agent(messages, budget=None):
     print("Running agent with messages:", messages)
 
+    # HINT: change the limits of the run via the AGENT_MAX_ITERATIONS,
+    # AGENT_MAX_TOTAL_TOKENS and AGENT_TIMEOUT env variables (see common/budget.py).
+    budget = budget or RunBudget.from_env()
+
     if isinstance(messages, str):
         messages = [{"role": "user", "content": messages}]
         
-    # Check and add system prompt if needed
+    # Check and add system prompt if needed. It goes first: providers cache the
+    # longest common prefix of the prompts, and with the system prompt followed
+    # by the (constant) tool definitions every router call starts the same way.
     if not any(
             isinstance(message, dict) and message.get("role") == "system" for message in messages
         ):
             system_prompt = {"role": "system", "content": SYSTEM_PROMPT}
-            messages.append(system_prompt)
+            messages.insert(0, system_prompt)
 
+    budget_token = budget.activate()
+    try:
+        return router_loop(messages, budget)
+    except APITimeoutError:
+        # only the deadline of the run, not a timeout of something else
+        if budget.remaining_time() != 0.0:
+            raise
+        budget.exceeded = "timeout"
+        return final_answer(messages, budget)
+    finally:
+        budget.deactivate(budget_token)
+        # recorded on the AgentRun span when called from start_main_span
+        trace.get_current_span().set_attributes(budget.span_attributes())
+
+
+def router_loop(messages, budget):
+    """Call the router until it stops calling tools or a limit of the run fires"""
     while True:
+        if budget.check():
+            return final_answer(messages, budget)
+        budget.iterations += 1
+
         print("Making router call to OpenAI")
         with tracer.start_as_current_span(
             "router_call", openinference_span_kind="chain"
@@ -391,7 +465,11 @@ def run_agent(messages):
                 model=MODEL,
                 messages=messages,
                 tools=tools,
+                # the deadline is also checked before every iteration
+                timeout=budget.remaining_time(),
             )
+            record_usage(response.usage)
+            span.set_attributes(prompt_cache_attributes(response.usage))
             messages.append(response.choices[0].message)
             tool_calls = response.choices[0].message.tool_calls
             print("Received response with tool calls:", bool(tool_calls))
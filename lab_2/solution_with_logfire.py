@@ -30,18 +30,37 @@ def get_openai_api_key():
 # =============================
 # importing necessary libraries
 # =============================
+import asyncio
 import json
 import os
+import sys
+import time
 import warnings
+from pathlib import Path
 warnings.filterwarnings('ignore')
 
 import duckdb
 import logfire
-import pandas as pd
-from openai import OpenAI
+from openai import AsyncOpenAI
+from opentelemetry import trace
 from opentelemetry.trace.status import StatusCode
 from pydantic import BaseModel, Field
 
+# make the `common` package importable when running `uv run lab_2/<script>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.budget import LIMIT_EXCEEDED_ANSWER, RunBudget, record_usage
+from common.cache import QueryResultCache, cache_key, make_response_cache
+from common.chart_sandbox import ChartRenderer
+from common.charts import chart_code
+from common.cursors import CursorPool
+from common.dataset import get_sales_dataset
+from common.fast_path import FastPath, FastPathQuery
+from common.guards import QueryGuard, QueryRejected
+from common.rendering import render_result
+from common.stub_model import stub_openai_client
+from common.tracing import PayloadPolicy
+
 # ==============================
 # initializing the OpenAI client
 # ==============================
@@ -49,7 +68,12 @@ from pydantic import BaseModel, Field
 # HINT: change the api key via the OPENAI_API_KEY env variable.
 openai_api_key = get_openai_api_key()
 # HINT: change the base_url via the OPENAI_BASE_URL env variable.
-client = OpenAI(api_key=openai_api_key)
+# HINT: set STUB_MODEL=1 to use a deterministic local stand-in instead of OpenAI,
+# e.g. for offline load tests (see common/stub_model.py).
+if os.getenv("STUB_MODEL"):
+    client = stub_openai_client()
+else:
+    client = AsyncOpenAI(api_key=openai_api_key)
 
 MODEL = "gpt-4o-mini"
 
@@ -65,6 +89,11 @@ logfire.configure()
 # instruments calls to OpenAI
 logfire.instrument_openai(client)
 
+# bounds the size of the input/output attributes of the spans created below
+# HINT: configure it via the SPAN_PAYLOAD_MAX_LENGTH, SPAN_PAYLOAD_HASH_ONLY and
+# SPAN_FULL_PAYLOAD_SAMPLE_RATE env variables (see common/tracing.py).
+payload_policy = PayloadPolicy.from_env()
+
 
 # ==================
 # Defining the tools
@@ -76,7 +105,68 @@ logfire.instrument_openai(client)
 # -----------------------
 
 # define the path to the transactional data
-TRANSACTION_DATA_FILE_PATH = 'data/Store_Sales_Price_Elasticity_Promotions_Data.parquet'
+# HINT: set SALES_DATA_PATH to use another file, e.g. the copy clustered by store
+# and date built by `uv run common/prepare_parquet.py`
+TRANSACTION_DATA_FILE_PATH = os.getenv(
+    "SALES_DATA_PATH", 'data/Store_Sales_Price_Elasticity_Promotions_Data.parquet'
+)
+# HINT: one of "copy", "arrow", "parquet" or "duckdb" (see common/dataset.py),
+# "duckdb" needs the database built by `uv run common/build_database.py`
+DATA_ACCESS_MODE = os.getenv("DATA_ACCESS_MODE", "arrow")
+# HINT: set SALES_ROLLUPS=false to not build the pre-aggregated tables of
+# common/rollups.py (nor advertise them in the SQL generation prompt)
+SALES_ROLLUPS = os.getenv("SALES_ROLLUPS", "true").lower() == "true"
+# the queries run on a bounded pool of worker threads (see common/cursors.py) and
+# are interrupted past their timeout
+# HINT: change them via the QUERY_WORKERS and QUERY_TIMEOUT env variables (0
+# disables the timeout).
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", 4))
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", 30)) or None
+# the generated SQL is checked against its plan before it runs: queries that
+# would process too many rows (e.g. cross joins) are sent back to the model,
+# large results are truncated and DuckDB runs with a memory limit (see
+# common/guards.py)
+# HINT: set SQL_GUARD=false to run the SQL unchecked, the limits are set via the
+# SQL_GUARD_MEMORY_LIMIT, SQL_GUARD_THREADS, SQL_GUARD_MAX_ROWS and
+# SQL_GUARD_MAX_ESTIMATED_ROWS env variables
+QUERY_GUARD = QueryGuard.from_env() if os.getenv("SQL_GUARD", "true").lower() == "true" else None
+# the SQL that fails or is rejected by the guard is generated again, with the
+# failing query and the error (or the guard's hint) added to the prompt
+# HINT: change the number of attempts via the SQL_GENERATION_RETRIES env variable
+SQL_GENERATION_RETRIES = int(os.getenv("SQL_GENERATION_RETRIES", 2))
+# budget of the lookup result passed to the other tools (see common/rendering.py)
+# HINT: RESULT_FORMAT is one of "csv" or "markdown"
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", 50))
+RESULT_MAX_TOKENS = int(os.getenv("RESULT_MAX_TOKENS", 2000))
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "csv")
+# the model generates the chart configuration and the code is rendered from a
+# template (see common/charts.py), the model only writes the code of the chart
+# types without template
+# HINT: set VISUALIZATION_MODE=fused to generate the configuration and the code
+# in a single structured call, or VISUALIZATION_MODE=two_step to generate the
+# code in a second call (e.g. to compare them in evaluations)
+VISUALIZATION_MODE = os.getenv("VISUALIZATION_MODE", "template")
+# the chart code is run in sandboxed worker processes (with time, CPU and memory
+# limits, see common/chart_sandbox.py) and the chart saved to CHART_OUTPUT_DIR
+# HINT: set CHART_RENDERING=false to only return the code, the limits are set via
+# the CHART_RENDER_WORKERS, CHART_RENDER_TIMEOUT, CHART_RENDER_CPU_SECONDS and
+# CHART_RENDER_MEMORY_MB env variables and the format via CHART_FORMAT (png or svg)
+CHART_RENDERING = os.getenv("CHART_RENDERING", "true").lower() == "true"
+CHART_OUTPUT_DIR = os.getenv("CHART_OUTPUT_DIR", "charts")
+# templated lookup questions ("sales for store N on DATE", "sales by SKU in
+# MONTH", ...) are answered with a parameterized query, without calling the
+# models, the other questions go to the router (see common/fast_path.py)
+# HINT: set FAST_PATH=false to send every question to the router
+FAST_PATH = os.getenv("FAST_PATH", "true").lower() == "true"
+# the parameterized queries (the fast path's, and the generated SQL with
+# SQL_PARAMETERS=true) run as prepared statements, kept per cursor by query
+# template, so a repeated query shape skips DuckDB's parsing and planning and the
+# guard's plan check (see common/prepared.py)
+# HINT: set SQL_PARAMETERS=true to have the model generate a query template plus
+# the values of its placeholders instead of SQL with literal values, and
+# PREPARED_STATEMENTS=0 to not prepare the parameterized queries
+SQL_PARAMETERS = os.getenv("SQL_PARAMETERS", "false").lower() == "true"
+PREPARED_STATEMENTS = int(os.getenv("PREPARED_STATEMENTS", 64))
 
 
 # prompt template for step 2 of tool 1
@@ -84,53 +174,216 @@ SQL_GENERATION_PROMPT = """
 Generate an SQL query based on a prompt. Do not reply with anything besides the SQL query.
 The prompt is: {prompt}
 
-The available columns are: {columns}
 The table name is: {table_name}
+The columns of the table are:
+{schema}
+"""
+
+
+# instructions added to the prompt of step 2 of tool 1 with SQL_PARAMETERS
+SQL_PARAMETERS_PROMPT = """
+Write every literal value the query compares columns to (numbers, strings, dates)
+as a ? placeholder, and list the values in params, in the order of the placeholders.
 """
 
 
+# added to the prompt of step 2 of tool 1 when the SQL is generated again after a failure
+SQL_RETRY_PROMPT = """
+The previous query was:
+{sql_query}
+It failed with: {error}
+Write a query that fixes this.
+"""
+
+
+# cache of the generated SQL, keyed on the model, the rendered prompt and the schema
+# HINT: set LLM_CACHE_PATH (e.g. ".cache/llm.sqlite") to also keep it on disk.
+sql_generation_cache = make_response_cache(sqlite_path=os.getenv("LLM_CACHE_PATH"))
+
+
+def sql_generation_key(prompt: str, schema: str, table_name: str, parameterized: bool) -> str:
+    """Key of the SQL generated for a prompt in sql_generation_cache"""
+    formatted_prompt = SQL_GENERATION_PROMPT.format(prompt=prompt,
+                                                    schema=schema,
+                                                    table_name=table_name)
+    if parameterized:
+        formatted_prompt += SQL_PARAMETERS_PROMPT
+    return cache_key(MODEL, formatted_prompt, {"table_name": table_name, "schema": schema})
+
+
 # code for step 2 of tool 1
-def generate_sql_query(prompt: str, columns: list, table_name: str) -> str:
-    """Generate an SQL query based on a prompt"""
+@logfire.instrument("chain=generate_sql_query", span_name="{chain=}")
+async def generate_sql_query(prompt: str, schema: str, table_name: str,
+                             feedback: str | None = None) -> str:
+    """Generate an SQL query based on a prompt, again with the previous query and
+    its error (feedback) when it failed"""
     formatted_prompt = SQL_GENERATION_PROMPT.format(prompt=prompt, 
-                                                    columns=columns, 
+                                                    schema=schema, 
                                                     table_name=table_name)
 
-    response = client.chat.completions.create(
+    key = sql_generation_key(prompt, schema, table_name, parameterized=False)
+    # a retry skips the lookup, the cached query is the one that failed
+    sql_query, tier = await sql_generation_cache.aget(key) if feedback is None else (None, None)
+    trace.get_current_span().set_attributes(
+        sql_generation_cache.span_attributes("sql_generation_cache", tier)
+    )
+    trace.get_current_span().set_attribute("sql_generation.retry", feedback is not None)
+    if sql_query is not None:
+        return sql_query
+    if feedback is not None:
+        formatted_prompt += feedback
+
+    response = await client.chat.completions.create(
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
-    
-    return response.choices[0].message.content
+    record_usage(response.usage)
+
+    sql_query = response.choices[0].message.content
+    if sql_query:
+        await sql_generation_cache.aset(key, sql_query)
+    return sql_query
+
+
+# class defining the response format of step 2 of tool 1 with SQL_PARAMETERS
+class ParameterizedQuery(BaseModel):
+    sql: str = Field(..., description="The SQL query, with a ? placeholder for every value")
+    params: list[str | int | float] = Field(
+        ..., description="The values of the placeholders, in order"
+    )
+
+
+# code for step 2 of tool 1 with SQL_PARAMETERS
+@logfire.instrument("chain=generate_sql_query", span_name="{chain=}")
+async def generate_parameterized_sql_query(
+    prompt: str, schema: str, table_name: str, feedback: str | None = None
+) -> ParameterizedQuery:
+    """Generate an SQL query template plus its values based on a prompt, again
+    with the previous query and its error (feedback) when it failed"""
+    formatted_prompt = SQL_GENERATION_PROMPT.format(prompt=prompt,
+                                                    schema=schema,
+                                                    table_name=table_name)
+    formatted_prompt += SQL_PARAMETERS_PROMPT
+
+    # cached as the JSON of the template and its values
+    key = sql_generation_key(prompt, schema, table_name, parameterized=True)
+    cached, tier = await sql_generation_cache.aget(key) if feedback is None else (None, None)
+    trace.get_current_span().set_attributes(
+        sql_generation_cache.span_attributes("sql_generation_cache", tier)
+    )
+    trace.get_current_span().set_attribute("sql_generation.retry", feedback is not None)
+    if cached is not None:
+        return ParameterizedQuery.model_validate_json(cached)
+    if feedback is not None:
+        formatted_prompt += feedback
+
+    response = await client.beta.chat.completions.parse(
+        model=MODEL,
+        messages=[{"role": "user", "content": formatted_prompt}],
+        response_format=ParameterizedQuery,
+    )
+    record_usage(response.usage)
+
+    query = response.choices[0].message.parsed
+    if query is None:
+        raise ValueError("no SQL query could be generated")
+    await sql_generation_cache.aset(key, query.model_dump_json())
+    return query
+
+
+# cache of the query results, keyed on the normalized SQL and the dataset version
+# HINT: change its memory budget via the SQL_RESULT_CACHE_MAX_BYTES env variable.
+sql_result_cache = QueryResultCache(
+    max_bytes=int(os.getenv("SQL_RESULT_CACHE_MAX_BYTES", 64 * 2**20))
+)
+
+
+# DuckDB cursors, one per in-flight query, over a database shared by the process.
+# The handle of the dataset is shared by the whole process too, the parquet file
+# is only read again if it changes on disk.
+cursor_pool = CursorPool(
+    get_sales_dataset(TRANSACTION_DATA_FILE_PATH, mode=DATA_ACCESS_MODE, rollups=SALES_ROLLUPS),
+    table_name="sales",
+    max_workers=QUERY_WORKERS,
+    guard=QUERY_GUARD,
+    max_prepared=PREPARED_STATEMENTS,
+)
+
+
+# code for step 3 of tool 1
+async def execute_sql_query(sql_query: str, params: list | None = None):
+    """Run the query, unless an equivalent query already ran against the same
+    version of the dataset"""
+    dataset = cursor_pool.dataset
+    with logfire.span("{chain=}", chain="execute_sql_query") as span:
+        span.set_attribute(key="input", value=payload_policy.render(sql_query))
+        result = sql_result_cache.get(sql_query, dataset.version, params)
+        span.set_attribute(key="cache_hit", value=result is not None)
+        if result is None:
+            # on a worker thread of the pool, DuckDB releases the GIL while the
+            # query runs so concurrent lookups execute in parallel. The queries
+            # rejected by the guard come back to the model as an error.
+            result = await cursor_pool.execute(sql_query, timeout=QUERY_TIMEOUT,
+                                               params=params)
+            sql_result_cache.set(sql_query, dataset.version, result, params)
+        span.set_attribute(key="output", value=payload_policy.render(str(result)))
+        span.set_status(StatusCode.OK)
+    return result
 
 
 # code for tool 1
 @logfire.instrument("tool=lookup_sales_data", span_name="{tool=}")
-def lookup_sales_data(prompt: str) -> str:
+async def lookup_sales_data(prompt: str) -> str:
     """Implementation of sales data lookup from parquet file using SQL"""
     try:
 
         # define the table name
-        table_name = "sales"
-        
-        # step 1: read the parquet file into a DuckDB table
-        df = pd.read_parquet(TRANSACTION_DATA_FILE_PATH)
-        duckdb.sql(f"CREATE TABLE IF NOT EXISTS {table_name} AS SELECT * FROM df")
-
-        # step 2: generate the SQL code
-        sql_query = generate_sql_query(prompt, df.columns, table_name)
-        # clean the response to make sure it only includes the SQL code
-        sql_query = sql_query.strip()
-        sql_query = sql_query.replace("```sql", "").replace("```", "")
-
-        with logfire.span("{chain=}", chain="execute_sql_query") as span:
-            span.set_attribute(key="input", value=sql_query)
-            # step 3: execute the SQL query
-            result = duckdb.sql(sql_query).df()
-            span.set_attribute(key="output", value=str(result))
-            span.set_status(StatusCode.OK)
+        table_name = cursor_pool.table_name
         
-        return result.to_string()
+        # step 1: the dataset is exposed as a DuckDB table (or view) on the
+        # cursors of `cursor_pool`, see step 3
+        dataset = cursor_pool.dataset
+
+        # step 2: generate the SQL code. The schema description (DuckDB types,
+        # ranges and example values of the columns) is computed once per
+        # version of the dataset, and lists the pre-aggregated tables of
+        # common/rollups.py, if enabled.
+        schema = dataset.table_description(table_name)
+        feedback = None
+        for attempt in range(SQL_GENERATION_RETRIES + 1):
+            params = None
+            if SQL_PARAMETERS:
+                query = await generate_parameterized_sql_query(prompt, schema, table_name,
+                                                               feedback)
+                sql_query, params = query.sql, query.params
+            else:
+                sql_query = await generate_sql_query(prompt, schema, table_name, feedback)
+            # clean the response to make sure it only includes the SQL code
+            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+
+            # step 3: execute the SQL query, unless an equivalent query already
+            # ran against the same version of the dataset. Parameterized queries
+            # run as prepared statements.
+            try:
+                result = await execute_sql_query(sql_query, params)
+                break
+            except Exception as e:
+                # the SQL failed (or was rejected by the guard), don't serve it again
+                await sql_generation_cache.adelete(
+                    sql_generation_key(prompt, schema, table_name, parameterized=SQL_PARAMETERS)
+                )
+                retryable = isinstance(e, (QueryRejected, duckdb.Error))
+                if not retryable or attempt == SQL_GENERATION_RETRIES:
+                    raise
+                # generate it again, with the error (or the guard's hint)
+                feedback = SQL_RETRY_PROMPT.format(sql_query=sql_query, error=e)
+
+        # step 4: render a compact version of the result, large results are
+        # replaced by a sample of their rows plus a summary of every column
+        rendered = render_result(result, max_rows=RESULT_MAX_ROWS,
+                                 max_tokens=RESULT_MAX_TOKENS, fmt=RESULT_FORMAT)
+        trace.get_current_span().set_attributes(rendered.span_attributes())
+        return rendered.text
     except Exception as e:
         return f"Error accessing data: {str(e)}"
 
@@ -147,14 +400,15 @@ Your job is to answer the following question: {prompt}
 
 # code for tool 2
 @logfire.instrument("tool=analyze_sales_data", span_name="{tool=}")
-def analyze_sales_data(prompt: str, data: str) -> str:
+async def analyze_sales_data(prompt: str, data: str) -> str:
     """Implementation of AI-powered sales data analysis"""
     formatted_prompt = DATA_ANALYSIS_PROMPT.format(data=data, prompt=prompt)
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
+    record_usage(response.usage)
 
     analysis = response.choices[0].message.content
     return analysis if analysis else "No analysis could be generated"
@@ -181,7 +435,7 @@ class VisualizationConfig(BaseModel):
 
 # code for step 1 of tool 3
 @logfire.instrument("tool=extract_chart_config", span_name="{tool=}")
-def extract_chart_config(data: str, visualization_goal: str) -> dict:
+async def extract_chart_config(data: str, visualization_goal: str) -> dict:
     """Generate chart visualization configuration
     
     Args:
@@ -194,15 +448,16 @@ def extract_chart_config(data: str, visualization_goal: str) -> dict:
     formatted_prompt = CHART_CONFIGURATION_PROMPT.format(data=data,
                                                          visualization_goal=visualization_goal)
     
-    response = client.beta.chat.completions.parse(
+    response = await client.beta.chat.completions.parse(
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
         response_format=VisualizationConfig,
     )
-    
+    record_usage(response.usage)
+
     try:
-        # Extract axis and title info from response
-        content = response.choices[0].message.content
+        # Extract axis and title info from the parsed response
+        content = response.choices[0].message.parsed
         
         # Return structured chart config
         return {
@@ -232,15 +487,16 @@ config: {config}
 
 # code for step 2 of tool 3
 @logfire.instrument("tool=create_chart", span_name="{tool=}")
-def create_chart(config: dict) -> str:
+async def create_chart(config: dict) -> str:
     """Create a chart based on the configuration"""
     formatted_prompt = CREATE_CHART_PROMPT.format(config=config)
     
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model=MODEL,
         messages=[{"role": "user", "content": formatted_prompt}],
     )
-    
+    record_usage(response.usage)
+
     code = response.choices[0].message.content
     code = code.replace("```python", "").replace("```", "")
     code = code.strip()
@@ -248,12 +504,86 @@ def create_chart(config: dict) -> str:
     return code
 
 
-# code for tool 3@logfire.instrument
+# prompt template of the fused mode of tool 3
+CHART_PROMPT = """
+Generate a chart configuration and the python code creating that chart.
+The code only contains python code, no other text.
+Generate the chart based on this data: {data}
+The goal is to show: {visualization_goal}
+"""
+
+
+# class defining the response format of the fused mode of tool 3: the
+# configuration and the code of the chart in a single result
+class Visualization(VisualizationConfig):
+    code: str = Field(..., description="Python code creating the chart, no other text")
+
+
+# code for the fused mode of tool 3
+@logfire.instrument("tool=generate_chart", span_name="{tool=}")
+async def generate_chart(data: str, visualization_goal: str) -> str:
+    """Generate the chart configuration and code in a single structured call"""
+    formatted_prompt = CHART_PROMPT.format(data=data, visualization_goal=visualization_goal)
+
+    response = await client.beta.chat.completions.parse(
+        model=MODEL,
+        messages=[{"role": "user", "content": formatted_prompt}],
+        response_format=Visualization,
+    )
+    record_usage(response.usage)
+
+    visualization = response.choices[0].message.parsed
+    if visualization is None:
+        return "No chart could be generated"
+    code = visualization.code.replace("```python", "").replace("```", "")
+    return code.strip()
+
+
+# code for the template mode of tool 3
+@logfire.instrument("tool=render_chart", span_name="{tool=}")
+def render_chart(config: dict) -> str | None:
+    """Render the chart code from a template, `None` if there is no template
+    for the configuration (see common/charts.py)"""
+    code = chart_code(config, config["data"])
+    trace.get_current_span().set_attribute("chart_template", code is not None)
+    return code
+
+
+# pool of worker processes running the chart code, with matplotlib and pandas
+# already imported (started in `main`)
+chart_renderer = ChartRenderer.from_env() if CHART_RENDERING else None
+
+
+# code for the execution of the chart code
+@logfire.instrument("tool=execute_chart_code", span_name="{tool=}")
+async def execute_chart_code(code: str, data: str) -> str:
+    """Run the chart code in the sandbox and note the outcome at the end of the code"""
+    chart = await asyncio.to_thread(chart_renderer.render, code, data)
+    trace.get_current_span().set_attributes(chart.span_attributes())
+    if chart.ok:
+        return f"{code}\n\n# chart rendered to {chart.save(CHART_OUTPUT_DIR)}"
+    return f"{code}\n\n# the chart code failed to run: {chart.error}"
+
+
+async def create_visualization(data: str, visualization_goal: str) -> str:
+    """The chart code, generated as set by `VISUALIZATION_MODE`"""
+    if VISUALIZATION_MODE == "fused":
+        return await generate_chart(data, visualization_goal)
+    config = await extract_chart_config(data, visualization_goal)
+    if VISUALIZATION_MODE == "template":
+        code = render_chart(config)
+        if code is not None:
+            return code
+    return await create_chart(config)
+
+
+# code for tool 3
 @logfire.instrument("tool=generate_visualization", span_name="{tool=}")
-def generate_visualization(data: str, visualization_goal: str) -> str:
+async def generate_visualization(data: str, visualization_goal: str) -> str:
     """Generate a visualization based on the data and goal"""
-    config = extract_chart_config(data, visualization_goal)
-    code = create_chart(config)
+    code = await create_visualization(data, visualization_goal)
+    if chart_renderer is not None:
+        code = await execute_chart_code(code, data)
     return code
 
 
@@ -325,16 +655,32 @@ tool_implementations = {
 # Router logic
 # ------------
 
+# HINT: maximum number of tool calls of the same turn executed at the same time
+MAX_CONCURRENT_TOOL_CALLS = int(os.getenv("MAX_CONCURRENT_TOOL_CALLS", "4"))
+
 # code for executing the tools returned in the model's response
 @logfire.instrument("chain=handle_tool_calls", span_name="{chain=}")
-def handle_tool_calls(tool_calls, messages):
-    
-    for tool_call in tool_calls:   
-        function = tool_implementations[tool_call.function.name]
-        function_args = json.loads(tool_call.function.arguments)
-        result = function(**function_args)
+async def handle_tool_calls(tool_calls, messages):
+    # The arguments of every tool call are fixed when the model emits them, so the
+    # calls of a turn are independent and run concurrently (their spans are siblings).
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+
+    async def call_tool(tool_call):
+        async with semaphore:
+            function = tool_implementations[tool_call.function.name]
+            function_args = json.loads(tool_call.function.arguments)
+            try:
+                return await function(**function_args)
+            except Exception as e:
+                # e.g. a query or a chart that timed out, the model gets the error
+                return f"Error running {tool_call.function.name}: {e}"
+
+    # gather keeps the results in the order of tool_calls, so the tool messages
+    # follow the order of the tool_call_ids in the assistant message
+    results = await asyncio.gather(*(call_tool(tool_call) for tool_call in tool_calls))
+    for tool_call, result in zip(tool_calls, results):
         messages.append({"role": "tool", "content": result, "tool_call_id": tool_call.id})
-        
+
     return messages
 
 
@@ -342,29 +688,104 @@ SYSTEM_PROMPT = """
 You are a helpful assistant that can answer questions about the Store Sales Price Elasticity Promotions dataset.
 """
 
+# instruction appended when a limit of the run fires, to get an answer without more tool calls
+FINAL_ANSWER_PROMPT = """
+The limits of this run were reached, do not call any more tools.
+Answer the user's question with the information gathered so far.
+"""
 
-def run_agent(messages):
+
+async def final_answer(messages, budget):
+    """Answer with the information gathered so far once a limit of the run fired"""
+    print(f"Run limit exceeded ({budget.exceeded}), returning final response")
+    with logfire.span("{chain=}", chain="final_answer", _tags=["CHAIN"]) as span:
+        span.set_attribute(key="budget.limit_exceeded", value=budget.exceeded)
+        answer = None
+        if budget.exceeded != "timeout":
+            try:
+                response = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=MODEL,
+                        messages=messages + [{"role": "system", "content": FINAL_ANSWER_PROMPT}],
+                        tools=tools,
+                        tool_choice="none",
+                    ),
+                    timeout=budget.remaining_time(),
+                )
+                record_usage(response.usage)
+                answer = response.choices[0].message.content
+            except asyncio.TimeoutError:
+                pass
+        answer = answer or LIMIT_EXCEEDED_ANSWER.format(limit=budget.exceeded)
+        span.set_attribute(key="output", value=payload_policy.render(answer))
+        return answer
+
+
+def prompt_cache_attributes(usage):
+    """Prompt tokens of a response and how many of them were served from the provider's cache"""
+    if usage is None:
+        return {}
+    details = usage.prompt_tokens_details
+    return {
+        "usage.prompt_tokens": usage.prompt_tokens,
+        "usage.cached_tokens": (details.cached_tokens or 0) if details else 0,
+    }
+
+
+async def run_agent(messages, budget=None):
     print("Running agent with messages:", messages)
 
+    # HINT: change the limits of the run via the AGENT_MAX_ITERATIONS,
+    # AGENT_MAX_TOTAL_TOKENS and AGENT_TIMEOUT env variables (see common/budget.py).
+    budget = budget or RunBudget.from_env()
+
     if isinstance(messages, str):
         messages = [{"role": "user", "content": messages}]
         
-    # Check and add system prompt if needed
+    # Check and add system prompt if needed. It goes first: providers cache the
+    # longest common prefix of the prompts, and with the system prompt followed
+    # by the (constant) tool definitions every router call starts the same way.
     if not any(
             isinstance(message, dict) and message.get("role") == "system" for message in messages
         ):
             system_prompt = {"role": "system", "content": SYSTEM_PROMPT}
-            messages.append(system_prompt)
+            messages.insert(0, system_prompt)
 
+    budget_token = budget.activate()
+    try:
+        return await router_loop(messages, budget)
+    except asyncio.TimeoutError:
+        # only the deadline of the run, not a timeout of something else
+        if budget.remaining_time() != 0.0:
+            raise
+        budget.exceeded = "timeout"
+        return await final_answer(messages, budget)
+    finally:
+        budget.deactivate(budget_token)
+        # recorded on the AgentRun span when called from start_main_span
+        trace.get_current_span().set_attributes(budget.span_attributes())
+
+
+async def router_loop(messages, budget):
+    """Call the router until it stops calling tools or a limit of the run fires"""
     while True:
+        if budget.check():
+            return await final_answer(messages, budget)
+        budget.iterations += 1
+
         print("Making router call to OpenAI")
         with logfire.span("{chain=}", chain="router_call", _tags=["CHAIN"]) as span:
-            span.set_attribute(key="input", value=messages)
-            response = client.chat.completions.create(
-                model=MODEL,
-                messages=messages,
-                tools=tools,
+            span.set_attribute(key="input", value=payload_policy.render(messages))
+            response = await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    tools=tools,
+                ),
+                timeout=budget.remaining_time(),
             )
+            record_usage(response.usage)
+            span.set_attributes(prompt_cache_attributes(response.usage))
             messages.append(response.choices[0].message)
             tool_calls = response.choices[0].message.tool_calls
             print("Received response with tool calls:", bool(tool_calls))
@@ -373,25 +794,88 @@ def run_agent(messages):
             # if the model decides to call function(s), call handle_tool_calls
             if tool_calls:
                 print("Processing tool calls")
-                messages = handle_tool_calls(tool_calls, messages)
-                span.set_attribute(key="output", value=tool_calls)
+                messages = await asyncio.wait_for(handle_tool_calls(tool_calls, messages),
+                                                  timeout=budget.remaining_time())
+                span.set_attribute(key="output", value=payload_policy.render(tool_calls))
             else:
                 print("No tool calls, returning final response")
-                span.set_attribute(key="output", value=response.choices[0].message.content)
+                span.set_attribute(key="output",
+                                   value=payload_policy.render(response.choices[0].message.content))
                 return response.choices[0].message.content
     
 
-def start_main_span(messages):
+# =========
+# Fast path
+# =========
+
+
+# templates of the lookup questions answered without the models
+fast_path = FastPath(cursor_pool.table_name, rollups=SALES_ROLLUPS) if FAST_PATH else None
+
+
+@logfire.instrument("chain=fast_path", span_name="{chain=}")
+async def answer_with_fast_path(query: FastPathQuery) -> str | None:
+    """Answer a templated question with its query, None if the query fails"""
+    span = trace.get_current_span()
+    span.set_attribute("fast_path.template", query.template)
+    try:
+        result = await execute_sql_query(query.sql, query.params)
+    except Exception as e:
+        # e.g. rejected by the guard, the router takes over
+        span.record_exception(e)
+        return None
+    rendered = render_result(result, max_rows=RESULT_MAX_ROWS,
+                             max_tokens=RESULT_MAX_TOKENS, fmt=RESULT_FORMAT)
+    span.set_attributes(rendered.span_attributes())
+    return f"{query.description}:\n\n{rendered.text}"
+
+
+def last_question(messages) -> str:
+    """Content of the last user message"""
+    if isinstance(messages, str):
+        return messages
+    for message in reversed(messages):
+        if isinstance(message, dict) and message.get("role") == "user":
+            return message.get("content") or ""
+    return ""
+
+
+async def start_main_span(messages):
     print("Starting main span with messages:", messages)
     
     with logfire.span("{agent=}", agent="AgentRun", _tags=["AGENT"]) as span:
-        span.set_attribute(key="input", value=messages)
-        ret = run_agent(messages)
+        span.set_attribute(key="input", value=payload_policy.render(messages))
+        start = time.perf_counter()
+        # templated questions skip the router and the SQL generation
+        query = fast_path.match(last_question(messages)) if fast_path is not None else None
+        ret = await answer_with_fast_path(query) if query is not None else None
+        if ret is None:
+            query = None
+            ret = await run_agent(messages)
+        if fast_path is not None:
+            span.set_attributes(fast_path.record(query, time.perf_counter() - start))
         print("Main span completed with return value:", ret)
-        span.set_attribute(key="output", value=ret)
+        span.set_attribute(key="output", value=payload_policy.render(ret))
         span.set_status(StatusCode.OK)
         return ret
 
 
-result = start_main_span([{"role": "user", 
-                           "content": "Which stores did the best in 2021?"}])
+async def main():
+    # HINT: the chart workers import matplotlib and pandas while the question is
+    # answered, so the first chart doesn't wait for them.
+    if chart_renderer is not None:
+        chart_renderer.start()
+    # HINT: start_main_span is a coroutine, so a single process can keep many
+    # questions in flight, e.g. with asyncio.gather(*(start_main_span(...) for ...))
+    try:
+        await start_main_span([{"role": "user",
+                                "content": "Which stores did the best in 2021?"}])
+    finally:
+        if chart_renderer is not None:
+            chart_renderer.close()
+        cursor_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
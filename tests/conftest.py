@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import duckdb
+import pytest
+
+# the modules of `common` are imported from the repository root, like the labs do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def sales_parquet(tmp_path_factory) -> str:
+    """A small Parquet file with the columns of the sales dataset."""
+    path = str(tmp_path_factory.mktemp("data") / "sales.parquet")
+    with duckdb.connect() as connection:
+        connection.execute(
+            "COPY (SELECT range % 4 + 1320 AS Store_Number, range % 50 AS SKU_Coded, "
+            "CAST(DATE '2021-11-01' + INTERVAL (range % 60) DAY AS DATE) AS Sold_Date, "
+            "range % 3 + 1 AS Qty_Sold, (range % 3 + 1) * 2.5 AS Total_Sale_Value "
+            f"FROM range(20000)) TO '{path}' (FORMAT parquet)"
+        )
+    return path
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+from common.budget import RunBudget, record_usage
+
+
+def test_iterations_exhausted():
+    budget = RunBudget(max_iterations=2, max_total_tokens=None, timeout=None)
+    budget.iterations = 1
+    assert budget.check() is None
+    budget.iterations = 2
+    assert budget.check() == "max_iterations"
+
+
+def test_tokens_exhausted():
+    budget = RunBudget(max_iterations=None, max_total_tokens=100, timeout=None)
+    budget.total_tokens = 100
+    assert budget.check() == "max_total_tokens"
+
+
+def test_time_exhausted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.budget.time.monotonic", lambda: now[0])
+    budget = RunBudget(max_iterations=None, max_total_tokens=None, timeout=10)
+    budget.activate()
+    now[0] += 4
+    assert budget.remaining_time() == 6
+    assert budget.check() is None
+    now[0] += 7
+    assert budget.remaining_time() == 0
+    assert budget.check() == "timeout"
+
+
+def test_first_limit_is_kept():
+    budget = RunBudget(max_iterations=1, max_total_tokens=100)
+    budget.iterations = 1
+    assert budget.check() == "max_iterations"
+    budget.iterations, budget.total_tokens = 0, 100
+    assert budget.check() == "max_iterations"
+    assert budget.span_attributes()["budget.limit_exceeded"] == "max_iterations"
+
+
+def test_disabled_limits():
+    budget = RunBudget(max_iterations=None, max_total_tokens=None, timeout=None)
+    budget.iterations, budget.total_tokens = 10**6, 10**9
+    assert budget.remaining_time() is None
+    assert budget.check() is None
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_MAX_ITERATIONS", "3")
+    monkeypatch.setenv("AGENT_MAX_TOTAL_TOKENS", "0")
+    monkeypatch.delenv("AGENT_TIMEOUT", raising=False)
+    budget = RunBudget.from_env()
+    assert (budget.max_iterations, budget.max_total_tokens, budget.timeout) == (3, None, 120.0)
+
+
+def test_record_usage_charges_the_active_budget():
+    budget = RunBudget()
+    usage = SimpleNamespace(total_tokens=40)
+    record_usage(usage)  # no run in progress
+    token = budget.activate()
+    try:
+        record_usage(usage)
+        record_usage(None)
+
+        async def tool():
+            # the tasks of the run inherit its budget
+            record_usage(usage)
+
+        asyncio.run(tool())
+    finally:
+        RunBudget.deactivate(token)
+    record_usage(usage)
+    assert budget.total_tokens == 80
@@ -0,0 +1,156 @@
+import asyncio
+
+import pandas as pd
+
+from common.cache import (
+    LRUCache,
+    QueryResultCache,
+    SQLiteCache,
+    TieredCache,
+    make_response_cache,
+    normalize_sql,
+)
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "b" is now the least recently used
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_lru_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.time", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("a", "1")
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_sqlite_evicts_least_recently_used(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.time", lambda: now[0])
+    cache = SQLiteCache(
+        str(tmp_path / "cache.sqlite"), max_entries=2, access_resolution=0, evict_every=1
+    )
+    for key, value in (("a", "1"), ("b", "2")):
+        now[0] += 1
+        cache.set(key, value)
+    now[0] += 1
+    assert cache.get("a") == "1"  # "b" is now the least recently used
+    now[0] += 1
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_sqlite_evicts_every_n_writes(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=5, evict_every=10)
+    count = "SELECT count(*) FROM cache"
+    for i in range(9):
+        cache.set(str(i), "v")
+    assert cache._connection.execute(count).fetchone() == (9,)
+    cache.set("9", "v")
+    assert cache._connection.execute(count).fetchone() == (5,)
+
+
+def test_sqlite_expires_entries_and_is_shared(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.time", lambda: now[0])
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path, ttl=10).set("a", "1")
+    cache = SQLiteCache(path, ttl=10)
+    assert cache.get("a") == "1"
+    now[0] += 11
+    assert cache.get("a") is None
+
+
+def test_sqlite_lookup_only_writes_stale_access_times(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.time", lambda: now[0])
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), access_resolution=60)
+    cache.set("a", "1")
+    accessed_at = "SELECT accessed_at FROM cache WHERE key = 'a'"
+    now[0] += 30
+    cache.get("a")
+    assert cache._connection.execute(accessed_at).fetchone() == (1000.0,)
+    now[0] += 31
+    cache.get("a")
+    assert cache._connection.execute(accessed_at).fetchone() == (1061.0,)
+
+
+def test_tiered_cache_fills_faster_tiers(tmp_path):
+    memory, disk = LRUCache(), SQLiteCache(str(tmp_path / "cache.sqlite"))
+    cache = TieredCache(memory, disk)
+    disk.set("a", "1")
+    assert cache.lookup("a") == ("1", "sqlite")
+    assert memory.get("a") == "1"
+    assert cache.lookup("a") == ("1", "memory")
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.span_attributes("llm", "memory") == {
+        "llm.hit": True, "llm.tier": "memory", "llm.hits": 2, "llm.misses": 1
+    }
+    assert cache.span_attributes("llm", None)["llm.hit"] is False
+
+
+def test_tiered_cache_delete_drops_every_tier(tmp_path):
+    cache = make_response_cache(sqlite_path=str(tmp_path / "cache.sqlite"))
+    cache.set("a", "1")
+    cache.delete("a")
+    assert all(tier.get("a") is None for tier in cache.tiers)
+
+
+def test_tiered_cache_async_variants(tmp_path):
+    cache = make_response_cache(sqlite_path=str(tmp_path / "cache.sqlite"), max_entries=1)
+
+    async def run():
+        await cache.aset("a", "1")
+        await cache.aset("b", "2")  # evicts "a" from the memory tier only
+        assert await cache.aget("a") == ("1", "sqlite")
+        assert await cache.aget("a") == ("1", "memory")
+        await cache.adelete("a")
+        assert await cache.aget("a") == (None, None)
+
+    asyncio.run(run())
+
+
+def test_normalize_sql_folds_spelling():
+    assert normalize_sql("```sql\n  SELECT *\n FROM Sales\tWHERE x = 1;\n```") == (
+        "select * from sales where x = 1"
+    )
+
+
+def test_normalize_sql_keeps_quoted_parts():
+    sql = """SELECT "Store Name" FROM sales WHERE City = 'New  York' AND Note = 'it''s'"""
+    assert normalize_sql(sql) == (
+        """select "Store Name" from sales where city = 'New  York' and note = 'it''s'"""
+    )
+    assert normalize_sql("SELECT 'A'") != normalize_sql("SELECT 'a'")
+
+
+def test_query_result_cache_key():
+    key = QueryResultCache.key
+    assert key("SELECT 1;", 1) == key("select  1", 1)
+    assert key("SELECT 1", 1) != key("SELECT 1", 2)
+    assert key("SELECT ?", 1, [1]) != key("SELECT ?", 1, [2])
+    assert key("SELECT 1", 1, []) == key("SELECT 1", 1)
+
+
+def test_query_result_cache_memory_budget():
+    df = pd.DataFrame({"x": range(1000)})
+    nbytes = int(df.memory_usage(deep=True).sum())
+    cache = QueryResultCache(max_bytes=2 * nbytes)
+    for sql in ("SELECT 1", "SELECT 2", "SELECT 3"):
+        cache.set(sql, 1, df)
+    assert cache.get("SELECT 1", 1) is None
+    assert cache.get("SELECT 3", 1) is df
+    assert cache.size == 2 * nbytes
+    cache.set("SELECT 4", 1, pd.DataFrame({"x": range(10_000)}))  # larger than the budget
+    assert cache.get("SELECT 4", 1) is None
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from common.chart_sandbox import ChartRenderer
+
+pytest.importorskip("matplotlib")
+
+CHART = "import matplotlib.pyplot as plt\nplt.plot(data['x'], data['y'])"
+DATA = "x,y\n1,2\n2,4\n3,1"
+# ignores the time and CPU limits of the worker, only killing it stops it
+HANG = (
+    "import signal, time\n"
+    "signal.signal(signal.SIGALRM, signal.SIG_IGN)\n"
+    "signal.signal(signal.SIGXCPU, signal.SIG_IGN)\n"
+    "time.sleep(60)"
+)
+
+
+@pytest.fixture(scope="module")
+def renderer():
+    renderer = ChartRenderer(workers=1, timeout=1, cpu_seconds=1, memory_limit=256 * 2**20)
+    renderer.start()
+    yield renderer
+    renderer.close()
+
+
+def test_renders_and_caches(renderer):
+    chart = renderer.render(CHART, DATA)
+    assert chart.ok and chart.image.startswith(b"\x89PNG")
+    assert not chart.cached
+    assert renderer.render(CHART, DATA).cached
+
+
+@pytest.mark.parametrize(
+    "code, error",
+    [
+        ("while True:\n    pass", "exceeded its"),
+        ("x = bytearray(2 * 1024**3)", "memory limit"),
+        ("1 / 0", "ZeroDivisionError: division by zero (line 1)"),
+        ("x = 1", "didn't draw a figure"),
+    ],
+)
+def test_failing_code_is_reported(renderer, code, error):
+    chart = renderer.render(code, DATA)
+    assert not chart.ok
+    assert error in chart.error
+    # the worker survives
+    assert renderer.render(CHART + f"\nplt.title({code!r})", DATA).ok
+
+
+def test_unresponsive_worker_is_killed_and_replaced(renderer):
+    chart = renderer.render(HANG)
+    assert chart.error == "the chart code didn't complete in time"
+    assert chart.elapsed < 10
+    assert renderer.render(CHART + "\nplt.title('after')", DATA).ok
+
+
+def test_close_kills_busy_workers():
+    renderer = ChartRenderer(workers=1, timeout=30)
+    renderer.start()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(renderer.render(HANG)))
+    thread.start()
+    time.sleep(3)  # the worker is rendering
+    renderer.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert not results[0].ok
@@ -0,0 +1,72 @@
+import io
+
+import pandas as pd
+import pytest
+
+from common.charts import chart_code, chart_type
+from common.rendering import render_result
+
+matplotlib = pytest.importorskip("matplotlib")
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+DATA = render_result(
+    pd.DataFrame(
+        {
+            "Sold_Date": [f"2021-11-{day:02d}" for day in (3, 1, 2)],
+            "Store_Number": [1320, 1321, 1322],
+            "Total_Sales": [10.5, 20.0, 15.25],
+        }
+    )
+).text
+
+
+def run(code: str) -> tuple[bytes, dict]:
+    """Execute chart code, return the PNG of its figure and its variables."""
+    plt.close("all")
+    namespace = {}
+    exec(compile(code, "<chart>", "exec"), namespace)
+    buffer = io.BytesIO()
+    plt.gcf().savefig(buffer, format="png")
+    plt.close("all")
+    return buffer.getvalue(), namespace
+
+
+@pytest.mark.parametrize("kind", ["bar", "line", "scatter", "pie"])
+def test_chart_code_draws_a_png(kind):
+    code = chart_code(
+        {"chart_type": kind, "x_axis": "Store_Number", "y_axis": "Total_Sales", "title": "Sales"},
+        DATA,
+    )
+    image, _ = run(code)
+    assert image.startswith(b"\x89PNG")
+
+
+def test_line_chart_sorts_dates():
+    code = chart_code(
+        {"chart_type": "line chart", "x_axis": "sold date", "y_axis": "total_sales"}, DATA
+    )
+    assert "pd.to_datetime(data['Sold_Date'])" in code
+    _, namespace = run(code)
+    assert list(namespace["data"]["Total_Sales"]) == [20.0, 15.25, 10.5]
+
+
+@pytest.mark.parametrize(
+    "name, kind",
+    [("Bar chart", "bar"), ("line_plot", "line"), ("time series", "line"), ("heatmap", None)],
+)
+def test_chart_type(name, kind):
+    assert chart_type(name) == kind
+
+
+@pytest.mark.parametrize(
+    "config, data",
+    [
+        ({"chart_type": "heatmap", "x_axis": "Store_Number", "y_axis": "Total_Sales"}, DATA),
+        ({"chart_type": "bar", "x_axis": "Store", "y_axis": "Total_Sales"}, DATA),
+        ({"chart_type": "bar", "x_axis": "Total_Sales", "y_axis": "Sold_Date"}, DATA),
+        ({"chart_type": "bar", "x_axis": "a", "y_axis": "b"}, "Error accessing data: boom"),
+    ],
+)
+def test_falls_back_to_the_model(config, data):
+    assert chart_code(config, data) is None
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+
+from common.cursors import CursorPool, QueryTimeout
+from common.dataset import SalesDataset
+
+# runs for minutes unless interrupted
+HEAVY_QUERY = "SELECT count(*) FROM range(1000000000) a, range(1000) b WHERE a.range + b.range < 0"
+
+
+@pytest.fixture
+def pool(sales_parquet):
+    pool = CursorPool(SalesDataset(sales_parquet, mode="parquet"), max_workers=1, max_prepared=8)
+    yield pool
+    pool.close()
+
+
+def test_execute(pool):
+    result = asyncio.run(
+        pool.execute("SELECT count(*) AS n FROM sales WHERE Store_Number = ?", params=[1320])
+    )
+    assert result["n"][0] == 5000
+
+
+def test_timeout_interrupts_the_query(pool):
+    async def run():
+        started = time.monotonic()
+        with pytest.raises(QueryTimeout):
+            await pool.execute(HEAVY_QUERY, timeout=0.2)
+        assert time.monotonic() - started < 1
+        # the only worker is free again once the query is interrupted
+        return await pool.execute("SELECT count(*) AS n FROM sales", timeout=5)
+
+    assert asyncio.run(run())["n"][0] == 20000
+
+
+def test_interrupt_before_the_query_starts_is_repeated(pool, monkeypatch):
+    query = pool._query
+
+    def slow_start(cursor, sql, params):
+        # the timeout fires after the cursor is taken, before the query runs
+        time.sleep(0.3)
+        return query(cursor, sql, params)
+
+    monkeypatch.setattr(pool, "_query", slow_start)
+
+    async def run():
+        with pytest.raises(QueryTimeout):
+            await pool.execute(HEAVY_QUERY, timeout=0.1)
+        monkeypatch.setattr(pool, "_query", query)
+        return await pool.execute("SELECT count(*) AS n FROM sales", timeout=5)
+
+    assert asyncio.run(run())["n"][0] == 20000
+
+
+def test_queries_run_in_parallel(sales_parquet):
+    pool = CursorPool(SalesDataset(sales_parquet, mode="parquet"), max_workers=2)
+
+    async def run():
+        heavy = asyncio.ensure_future(pool.execute(HEAVY_QUERY, timeout=1))
+        result = await pool.execute("SELECT count(*) AS n FROM sales", timeout=0.5)
+        with pytest.raises(QueryTimeout):
+            await heavy
+        return result
+
+    try:
+        assert asyncio.run(run())["n"][0] == 20000
+    finally:
+        pool.close()
@@ -0,0 +1,161 @@
+import os
+import shutil
+
+import duckdb
+import pytest
+
+from common import dataset as dataset_module
+from common.dataset import (
+    VERSION_MARKER,
+    SalesDataset,
+    build_partitioned_parquet,
+    build_sales_database,
+)
+from common.cache import QueryResultCache
+from common.rollups import ROLLUPS
+
+
+def write_sales(path, rows: int) -> None:
+    with duckdb.connect() as connection:
+        connection.execute(
+            f"COPY (SELECT range AS Store_Number FROM range({rows})) TO '{path}' (FORMAT parquet)"
+        )
+
+
+@pytest.mark.parametrize("mode", ["copy", "arrow", "parquet"])
+def test_rewritten_file_is_reloaded(tmp_path, mode):
+    path = str(tmp_path / "sales.parquet")
+    write_sales(path, 10)
+    dataset = SalesDataset(path, mode=mode, rollups=False)
+    cache = QueryResultCache()
+    sql = "SELECT count(*) AS n FROM sales"
+
+    def lookup(connection):
+        result = cache.get(sql, dataset.version)
+        if result is None:
+            dataset.register(connection, "sales")
+            dataset.register_cursor(connection, "sales")
+            result = connection.execute(sql).df()
+            cache.set(sql, dataset.version, result)
+        return result["n"][0]
+
+    with duckdb.connect() as connection:
+        assert lookup(connection) == 10
+        version = dataset.version
+        write_sales(path, 20)
+        # a later modification time, whatever the resolution of the file system
+        os.utime(path, ns=(0, version + 10**9))
+        assert dataset.version != version
+        assert cache.get(sql, dataset.version) is None
+        assert lookup(connection) == 20
+        assert cache.hits == 0
+
+
+@pytest.mark.parametrize("mode", ["copy", "arrow", "parquet"])
+def test_schema_description(sales_parquet, mode):
+    lines = SalesDataset(sales_parquet, mode=mode).schema_description.splitlines()
+    assert lines[0] == "- Store_Number (BIGINT): one of 1320, 1321, 1322, 1323"
+    # the approximate distinct count varies, the range and the examples don't
+    assert lines[2].startswith("- Sold_Date (DATE): ~")
+    assert lines[2].endswith(
+        "distinct values from 2021-11-01 to 2021-12-30, e.g. 2021-11-01, 2021-11-02, 2021-11-03"
+    )
+    assert len(lines) == 5
+
+
+@pytest.fixture
+def partitioned(sales_parquet, tmp_path) -> str:
+    return build_partitioned_parquet(sales_parquet, str(tmp_path / "sales.partitioned"))
+
+
+def test_version_follows_the_marker(partitioned):
+    dataset = SalesDataset(partitioned, mode="parquet")
+    marker = os.path.join(partitioned, VERSION_MARKER)
+    assert dataset.version == os.stat(marker).st_mtime_ns
+    os.utime(marker, ns=(0, 10**18))
+    assert dataset.version == 10**18
+
+
+def test_version_without_marker_is_reused_for_its_ttl(partitioned, monkeypatch):
+    os.remove(os.path.join(partitioned, VERSION_MARKER))
+    dataset = SalesDataset(partitioned, mode="parquet")
+    version = dataset.version
+    os.utime(os.path.join(partitioned, "Sold_Year=2021"), ns=(0, 2 * 10**18))
+    assert dataset.version == version
+    monkeypatch.setattr(dataset_module, "VERSION_TTL", 0.0)
+    assert dataset.version == 2 * 10**18
+
+
+def test_schema_reads_the_footers_and_the_recent_partitions(partitioned, monkeypatch):
+    monkeypatch.setattr(dataset_module, "SCHEMA_SAMPLE_ROWS", 100)
+    schema = {column.name: column for column in SalesDataset(partitioned, mode="parquet").schema}
+    # the ranges cover the whole history
+    assert (schema["Sold_Date"].min, schema["Sold_Date"].max) == ("2021-11-01", "2021-12-30")
+    assert schema["Sold_Month"].values == ("11", "12")
+    assert schema["Store_Number"].distinct == 4
+    # the example values come from the most recent partition
+    assert all(value >= "2021-12-" for value in schema["Sold_Date"].values)
+
+
+def test_rollups_are_views(partitioned):
+    dataset = SalesDataset(partitioned, mode="parquet")
+    with duckdb.connect() as connection:
+        dataset.register(connection, "sales")
+        views = {name for (name,) in connection.execute(
+            "SELECT view_name FROM duckdb_views() WHERE NOT internal"
+        ).fetchall()}
+        assert {rollup.name("sales") for rollup in ROLLUPS} <= views
+        assert connection.execute(
+            "SELECT SUM(Transaction_Count) FROM sales_daily_store"
+        ).fetchone() == (20000,)
+
+
+def test_rollups_are_tables_for_a_file(sales_parquet):
+    dataset = SalesDataset(sales_parquet, mode="parquet")
+    with duckdb.connect() as connection:
+        dataset.register(connection, "sales")
+        tables = {name for (name,) in connection.execute(
+            "SELECT table_name FROM duckdb_tables()"
+        ).fetchall()}
+        assert {rollup.name("sales") for rollup in ROLLUPS} <= tables
+
+
+def test_rollups_are_built_with_the_database(sales_parquet, tmp_path):
+    path = build_sales_database(sales_parquet, str(tmp_path / "sales.duckdb"))
+    dataset = SalesDataset(path, mode="duckdb")
+    with duckdb.connect() as connection:
+        dataset.register(connection, "sales")
+        # views over the tables of the database, nothing is aggregated on registration
+        assert connection.execute(
+            "SELECT sql FROM duckdb_views() WHERE view_name = 'sales_daily_store'"
+        ).fetchone()[0].endswith("FROM sales_db.sales_daily_store;")
+        assert connection.execute(
+            "SELECT SUM(Transaction_Count) FROM sales_daily_store"
+        ).fetchone() == (20000,)
+
+
+def test_table_description_omits_the_rollups(partitioned, sales_parquet):
+    description = SalesDataset(partitioned, mode="parquet").table_description("sales")
+    assert "- Store_Number (" in description
+    assert "sales_daily_store" not in description
+    assert "sales_daily_store" in SalesDataset(sales_parquet, mode="parquet").table_description(
+        "sales"
+    )
+
+
+@pytest.mark.parametrize("layout", ["file", "partitioned", "database"])
+def test_paths_with_quotes(sales_parquet, tmp_path, layout):
+    directory = tmp_path / "o'brien"
+    directory.mkdir()
+    path = str(directory / "sales.parquet")
+    shutil.copy(sales_parquet, path)
+    mode = "parquet"
+    if layout == "partitioned":
+        path = build_partitioned_parquet(path, str(directory / "sales.partitioned"))
+    elif layout == "database":
+        path, mode = build_sales_database(path, str(directory / "sales.duckdb")), "duckdb"
+    dataset = SalesDataset(path, mode=mode)
+    assert "- Store_Number (" in dataset.schema_description
+    with duckdb.connect() as connection:
+        dataset.register(connection, "sales")
+        assert connection.execute("SELECT count(*) FROM sales").fetchone() == (20000,)
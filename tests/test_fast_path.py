@@ -0,0 +1,74 @@
+from datetime import date
+
+import pytest
+
+from common.fast_path import FastPath, parse_day, parse_period
+
+
+@pytest.fixture
+def fast_path():
+    return FastPath("sales", rollups=True)
+
+
+def test_store_day(fast_path):
+    query = fast_path.match("Show me all the sales for store 1320 on November 1st, 2021")
+    assert query.template == "store_day"
+    assert query.sql == "SELECT * FROM sales WHERE Store_Number = ? AND Sold_Date = ?"
+    assert query.params == [1320, date(2021, 11, 1)]
+
+
+def test_store_month(fast_path):
+    query = fast_path.match("sales of store #1640 in Nov 2021?")
+    assert query.template == "store_month"
+    assert query.params == [1640, date(2021, 11, 1), date(2021, 12, 1)]
+
+
+def test_by_sku_with_store_and_period(fast_path):
+    query = fast_path.match("List the sales by SKU for store 1320 during December 2021")
+    assert query.template == "by_sku"
+    assert "GROUP BY SKU_Coded" in query.sql
+    assert query.params == [1320, date(2021, 12, 1), date(2022, 1, 1)]
+
+
+def test_by_store_scans_the_rollup(fast_path):
+    query = fast_path.match("total sales per store in 2021")
+    assert query.template == "by_store"
+    assert "FROM sales_daily_store " in query.sql
+    assert query.params == [date(2021, 1, 1), date(2022, 1, 1)]
+
+
+def test_by_store_without_rollups():
+    query = FastPath("sales").match("sales by store")
+    assert "FROM sales GROUP BY Store_Number" in query.sql
+    assert query.params == []
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Show me a bar chart of the sales for store 1320 on November 1st, 2021",
+        "What is the trend of the sales for store 1320 in November 2021?",
+        "Show me all the sales for store 1320 on the first Monday of November",
+        "Show me all the sales for store 1320 in 2021",
+        "sales by SKU in Smarch 2021",
+        "Which store sold the most?",
+    ],
+)
+def test_other_questions_fall_through(fast_path, question):
+    assert fast_path.match(question) is None
+
+
+def test_parse_day_and_period():
+    assert parse_day("1 Nov 2021") == parse_day("2021-11-01") == date(2021, 11, 1)
+    assert parse_period("the month of 2021-02") == (
+        date(2021, 2, 1), date(2021, 3, 1), "February 2021"
+    )
+
+
+def test_record(fast_path):
+    fast_path.record(None, 2.0)
+    attributes = fast_path.record(fast_path.match("sales by store"), 0.5)
+    assert attributes["fast_path.hit"] is True
+    assert attributes["fast_path.template"] == "by_store"
+    assert attributes["fast_path.hit_rate"] == 0.5
+    assert attributes["fast_path.latency_saved_ms"] == 1500.0
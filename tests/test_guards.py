@@ -0,0 +1,55 @@
+import duckdb
+import pytest
+
+from common.guards import QueryGuard, QueryRejected
+
+
+@pytest.fixture
+def cursor():
+    connection = duckdb.connect()
+    connection.execute(
+        "CREATE TABLE sales AS SELECT range AS id, range % 100 AS store FROM range(100000)"
+    )
+    yield connection.cursor()
+    connection.close()
+
+
+def run(guard: QueryGuard, cursor, sql: str, params=None) -> int:
+    return len(cursor.execute(guard.prepare(cursor, sql, params=params), params).fetchall())
+
+
+def test_large_result_is_limited(cursor):
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales") == 1000
+
+
+def test_small_result_is_unchanged(cursor):
+    guard = QueryGuard(max_rows=1000)
+    sql = "SELECT store, count(*) FROM sales GROUP BY store"
+    assert guard.prepare(cursor, sql) == sql
+
+
+def test_trailing_comment_is_kept_out_of_the_limit(cursor):
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales -- all rows") == 1000
+
+
+def test_limit_larger_than_max_rows_is_limited(cursor):
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales LIMIT 50000") == 1000
+
+
+def test_parameterized_limit_is_limited(cursor):
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales LIMIT ?", [50000]) == 1000
+
+
+def test_limit_smaller_than_max_rows_is_kept(cursor):
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales LIMIT 10") == 10
+    assert run(QueryGuard(max_rows=1000), cursor, "SELECT * FROM sales ORDER BY id LIMIT 10") == 10
+
+
+def test_top_n_within_max_rows_is_not_wrapped(cursor):
+    sql = "SELECT * FROM sales ORDER BY id LIMIT 500"
+    assert QueryGuard(max_rows=1000).prepare(cursor, sql) == sql
+
+
+def test_cross_join_is_rejected(cursor):
+    with pytest.raises(QueryRejected, match="rejected"):
+        QueryGuard(max_estimated_rows=1_000_000).prepare(cursor, "SELECT * FROM sales a, sales b")
@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("logfire")
+
+
+@pytest.fixture(scope="module")
+def lab():
+    # the offline stub, no export of the spans and no chart workers
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("STUB_MODEL", "1")
+        monkeypatch.setenv("LOGFIRE_SEND_TO_LOGFIRE", "false")
+        monkeypatch.setenv("LOGFIRE_CONSOLE", "false")
+        monkeypatch.setenv("CHART_RENDERING", "false")
+        lab = importlib.import_module("lab_2.solution_with_logfire")
+        yield lab
+        lab.cursor_pool.close()
+
+
+def tool_call(id: str, name: str, **arguments):
+    return SimpleNamespace(
+        id=id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    )
+
+
+@pytest.fixture
+def tools(lab, monkeypatch):
+    """A `sleep` tool answering after `delay` seconds, recording the peak of
+    concurrent calls, and a `fail` tool."""
+    state = {"running": 0, "peak": 0}
+
+    async def sleep(delay: float, value: str) -> str:
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(delay)
+        state["running"] -= 1
+        return value
+
+    async def fail() -> str:
+        raise TimeoutError("the chart took too long")
+
+    monkeypatch.setitem(lab.tool_implementations, "sleep", sleep)
+    monkeypatch.setitem(lab.tool_implementations, "fail", fail)
+    return state
+
+
+def test_tool_messages_keep_the_order_of_the_calls(lab, tools):
+    # the first call completes last
+    calls = [
+        tool_call(f"call_{i}", "sleep", delay=delay, value=str(i))
+        for i, delay in enumerate((0.2, 0.05, 0.1))
+    ]
+    messages = asyncio.run(lab.handle_tool_calls(calls, []))
+    assert [(m["tool_call_id"], m["content"]) for m in messages] == [
+        ("call_0", "0"), ("call_1", "1"), ("call_2", "2")
+    ]
+    assert tools["peak"] == 3
+
+
+def test_concurrency_is_capped(lab, tools, monkeypatch):
+    monkeypatch.setattr(lab, "MAX_CONCURRENT_TOOL_CALLS", 2)
+    calls = [tool_call(f"call_{i}", "sleep", delay=0.02, value=str(i)) for i in range(6)]
+    messages = asyncio.run(lab.handle_tool_calls(calls, []))
+    assert [m["content"] for m in messages] == [str(i) for i in range(6)]
+    assert tools["peak"] == 2
+
+
+def test_tool_error_goes_back_to_the_model(lab, tools):
+    calls = [tool_call("call_0", "fail"), tool_call("call_1", "sleep", delay=0, value="ok")]
+    messages = asyncio.run(lab.handle_tool_calls(calls, []))
+    assert messages[0]["content"] == "Error running fail: the chart took too long"
+    assert messages[1]["content"] == "ok"
@@ -0,0 +1,109 @@
+from datetime import date, datetime
+
+import duckdb
+import pytest
+
+from common.prepared import PreparedStatements, parameterize, sql_literal
+
+
+def test_parameterize_comparisons():
+    sql = "SELECT * FROM sales WHERE Store_Number = 1320 AND Qty_Sold >= 2.5"
+    assert parameterize(sql) == (
+        "SELECT * FROM sales WHERE Store_Number = ? AND Qty_Sold >= ?",
+        [1320, 2.5],
+    )
+
+
+def test_parameterize_between_and_in_list():
+    sql = (
+        "SELECT * FROM sales WHERE Sold_Date BETWEEN '2021-11-01' AND '2021-11-30' "
+        "AND Store_Number IN (1320, 1640)"
+    )
+    assert parameterize(sql) == (
+        "SELECT * FROM sales WHERE Sold_Date BETWEEN ? AND ? AND Store_Number IN (?, ?)",
+        ["2021-11-01", "2021-11-30", 1320, 1640],
+    )
+
+
+def test_parameterize_unescapes_strings():
+    assert parameterize("SELECT * FROM t WHERE name = 'O''Brien'") == (
+        "SELECT * FROM t WHERE name = ?",
+        ["O'Brien"],
+    )
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM sales LIMIT 10",
+        "SELECT Store_Number, SUM(Qty_Sold) FROM sales GROUP BY 1 ORDER BY 2 DESC",
+        "SELECT round(Total_Sale_Value, 2) FROM sales",
+        "SELECT * FROM sales WHERE Sold_Date = DATE '2021-11-01'",
+        'SELECT "Store 1" FROM sales',
+    ],
+)
+def test_parameterize_keeps_the_shape_of_the_query(sql):
+    assert parameterize(sql) == (sql, [])
+
+
+@pytest.mark.parametrize(
+    "value, literal",
+    [
+        (None, "NULL"),
+        (True, "TRUE"),
+        (False, "FALSE"),
+        (1320, "1320"),
+        (2.5, "2.5"),
+        ("O'Brien", "'O''Brien'"),
+        (date(2021, 11, 1), "DATE '2021-11-01'"),
+        (datetime(2021, 11, 1, 12, 30), "TIMESTAMP '2021-11-01 12:30:00'"),
+    ],
+)
+def test_sql_literal(value, literal):
+    assert sql_literal(value) == literal
+
+
+def test_sql_literal_rejects_non_finite_floats():
+    with pytest.raises(ValueError):
+        sql_literal(float("nan"))
+
+
+def test_sql_literal_rejects_unsupported_types():
+    with pytest.raises(TypeError):
+        sql_literal(object())
+
+
+@pytest.fixture
+def cursor():
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE sales AS SELECT range AS id FROM range(100)")
+    yield connection.cursor()
+    connection.close()
+
+
+def test_prepared_statement_is_reused(cursor):
+    statements = PreparedStatements()
+    sql = "SELECT count(*) FROM sales WHERE id < ?"
+    assert statements.execute(cursor, sql, [10]).fetchone() == (10,)
+    assert statements.execute(cursor, sql, [20]).fetchone() == (20,)
+    assert (statements.hits, statements.misses) == (1, 1)
+
+
+def test_equivalent_spellings_share_a_statement(cursor):
+    statements = PreparedStatements()
+    assert PreparedStatements.name("SELECT 1 ;") == PreparedStatements.name("select   1")
+    statements.execute(cursor, "SELECT count(*) FROM sales WHERE id < ?", [10])
+    statements.execute(cursor, "select count(*)\nfrom sales where id < ?;", [10])
+    assert (statements.hits, statements.misses) == (1, 1)
+
+
+def test_least_recently_used_statements_are_deallocated(cursor):
+    statements = PreparedStatements(max_statements=2)
+    queries = [f"SELECT count(*) + {i} FROM sales WHERE id < ?" for i in range(3)]
+    for sql in queries:
+        statements.execute(cursor, sql, [10])
+    with pytest.raises(duckdb.Error):
+        cursor.execute(f"EXECUTE {PreparedStatements.name(queries[0])}(10)")
+    # the evicted statement is prepared again on its next use
+    assert statements.execute(cursor, queries[0], [10]).fetchone() == (10,)
+    assert statements.misses == 4
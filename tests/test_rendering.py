@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from common.rendering import parse_result, render_result, summarize_columns
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "Store_Number": [1320 + i % 5 for i in range(200)],
+            "Total_Sales": [round(i * 1.5, 2) for i in range(200)],
+            "Note": ['a, "quoted" note' if i % 2 else "plain" for i in range(200)],
+        }
+    )
+
+
+@pytest.mark.parametrize("fmt", ["csv", "markdown"])
+def test_small_result_round_trips(df, fmt):
+    rendered = render_result(df.head(10), fmt=fmt)
+    assert not rendered.truncated
+    pd.testing.assert_frame_equal(parse_result(rendered.text), df.head(10))
+
+
+def test_large_result_is_truncated_with_a_summary(df):
+    rendered = render_result(df, max_rows=20, max_tokens=2000)
+    assert (rendered.rows, rendered.rows_shown) == (200, 20)
+    assert rendered.text.startswith("The result has 200 rows and 3 columns")
+    assert "Summary of every column:" in rendered.text
+    assert rendered.tokens <= 2000
+    assert rendered.tokens_saved > 0
+    # the head sample is read back
+    pd.testing.assert_frame_equal(parse_result(rendered.text), df.head(20))
+
+
+def test_token_budget_shrinks_the_sample(df):
+    rendered = render_result(df, max_rows=50, max_tokens=300)
+    assert rendered.rows_shown < 50
+    assert rendered.tokens <= 300 or rendered.rows_shown == 0
+
+
+def test_summarize_columns(df):
+    summary = summarize_columns(df).set_index("column")
+    assert summary.loc["Store_Number", "min"] == 1320
+    assert summary.loc["Store_Number", "max"] == 1324
+    assert summary.loc["Store_Number", "distinct"] == 5
+    assert summary.loc["Total_Sales", "mean"] == 149.25
+    assert pd.isna(summary.loc["Note", "mean"])
+
+
+def test_parse_result_rejects_text():
+    assert parse_result("No analysis could be generated") is None
+    assert parse_result("Error accessing data: boom") is None
+
+
+def test_unknown_format(df):
+    with pytest.raises(ValueError):
+        render_result(df, fmt="json")
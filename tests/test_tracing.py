@@ -0,0 +1,45 @@
+import json
+
+from common import tracing
+from common.tracing import PayloadPolicy
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Which stores did the best in 2021?"},
+]
+
+
+def test_small_payloads_are_kept():
+    policy = PayloadPolicy()
+    assert policy.render("SELECT 1") == "SELECT 1"
+    assert policy.render(MESSAGES) == json.dumps(MESSAGES)
+
+
+def test_large_payloads_are_truncated():
+    policy = PayloadPolicy(max_length=20)
+    text = json.dumps(MESSAGES)
+    rendered = policy.render(MESSAGES)
+    assert rendered.startswith(text[:20] + "...[truncated ")
+    assert f"of {len(text)} chars, sha256:" in rendered
+    assert policy.render("x" * 30).startswith("x" * 20 + "...[truncated 10 of 30 chars")
+
+
+def test_hash_only():
+    policy = PayloadPolicy(hash_only=True)
+    rendered = policy.render(MESSAGES)
+    assert rendered.startswith("sha256:")
+    assert policy.render(list(MESSAGES)) == rendered
+    assert policy.render(MESSAGES + [{"role": "user", "content": "and 2022?"}]) != rendered
+
+
+def test_messages_are_serialized_once(monkeypatch):
+    calls = []
+    to_text = tracing._to_text
+    monkeypatch.setattr(tracing, "_to_text", lambda value: calls.append(value) or to_text(value))
+    policy = PayloadPolicy(hash_only=True)
+    messages = list(MESSAGES)
+    for turn in range(3):
+        policy.render(messages)
+        messages.append({"role": "tool", "content": f"result {turn}"})
+    # every message once, not the whole history at every turn
+    assert len(calls) == 4